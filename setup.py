@@ -53,4 +53,7 @@ setup(
         'typing-extensions; python_version < "3.8"',
         "filelock",
     ],
+    extras_require={
+        "gzip-index": ["indexed_gzip"],
+    },
 )
@@ -113,6 +113,42 @@ if "SIIBRA_CACHE_SIZE_GIB" in _os.environ:
     set_cache_size(float(_os.environ.get("SIIBRA_CACHE_SIZE_GIB")))
 
 
+def set_memory_cache_size(maxsize_gbyte: float):
+    from .retrieval.cache import MEMORY_CACHE
+    assert maxsize_gbyte >= 0
+    MEMORY_CACHE.maxsize_bytes = int(maxsize_gbyte * 1024**3)
+    if maxsize_gbyte == 0:
+        MEMORY_CACHE.clear()
+    logger.info(f"Set memory cache size to {maxsize_gbyte} GiB.")
+
+
+if "SIIBRA_MEMORY_CACHE_SIZE_GIB" in _os.environ:
+    set_memory_cache_size(float(_os.environ.get("SIIBRA_MEMORY_CACHE_SIZE_GIB")))
+
+
+def set_chunk_cache_size(maxsize_gbyte: float):
+    from .retrieval.cache import CHUNK_CACHE
+    assert maxsize_gbyte >= 0
+    CHUNK_CACHE.maxsize_bytes = int(maxsize_gbyte * 1024**3)
+    if maxsize_gbyte == 0:
+        CHUNK_CACHE.clear()
+    logger.info(f"Set chunk cache size to {maxsize_gbyte} GiB.")
+
+
+if "SIIBRA_CHUNK_CACHE_SIZE_GIB" in _os.environ:
+    set_chunk_cache_size(float(_os.environ.get("SIIBRA_CHUNK_CACHE_SIZE_GIB")))
+
+
+def set_http_pool_size(maxsize_per_host: int, num_hosts: int = None):
+    from .retrieval.connections import POOL
+    POOL.configure(pool_connections=num_hosts, pool_maxsize=maxsize_per_host)
+    logger.info(f"Set http connection pool size to {maxsize_per_host} connections per host.")
+
+
+if "SIIBRA_HTTP_POOL_SIZE" in _os.environ:
+    set_http_pool_size(int(_os.environ.get("SIIBRA_HTTP_POOL_SIZE")))
+
+
 def warm_cache():
     """
     Preload preconfigured siibra concepts.
@@ -16,7 +16,7 @@
 from ..commons import logger, __version__, SIIBRA_USE_CONFIGURATION, siibra_tqdm
 from ..retrieval.repositories import GitlabConnector, RepositoryConnector
 from ..retrieval.exceptions import NoSiibraConfigMirrorsAvailableException
-from ..retrieval.requests import SiibraHttpRequestError
+from ..retrieval.requests import SiibraHttpRequestError, prefetch
 
 from typing import Union
 from collections import defaultdict
@@ -153,6 +153,7 @@ class Configuration:
         if len(specloaders) == 0:  # no loaders found in this configuration folder!
             return result
 
+        prefetch(specloaders, desc=f"Downloading {len(specloaders)} {folder} specifications")
         obj0 = Factory.from_json(
             dict(
                 specloaders[0][1].data,
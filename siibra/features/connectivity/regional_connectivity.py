@@ -23,6 +23,7 @@ from ...commons import logger, QUIET, siibra_tqdm
 from ...core import region as _region
 from ...locations import pointset
 from ...retrieval.repositories import RepositoryConnector
+from ...retrieval import requests
 
 import pandas as pd
 import numpy as np
@@ -126,10 +127,15 @@ class RegionalConnectivity(Feature):
                 "You might alternatively specify an individual subject."
             )
             if "mean" not in self._matrices:
+                loaders = [
+                    self._connector.get_loader(fname, decode_func=self._decode_func)
+                    for fname in self._files.values()
+                ]
+                requests.prefetch(loaders, desc=f"Downloading {len(self)} connectivity matrices")
                 all_arrays = [
-                    self._connector.get(fname, decode_func=self._decode_func)
-                    for fname in siibra_tqdm(
-                        self._files.values(),
+                    loader.data
+                    for loader in siibra_tqdm(
+                        loaders,
                         total=len(self),
                         desc=f"Averaging {len(self)} connectivity matrices"
                     )
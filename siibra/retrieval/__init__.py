@@ -21,6 +21,7 @@ from .repositories import (
     LocalFileRepository,
     ZipfileConnector
 )
-from .requests import HttpRequest, ZipfileRequest, EbrainsRequest, SiibraHttpRequestError
+from .requests import HttpRequest, ZipfileRequest, EbrainsRequest, SiibraHttpRequestError, prefetch
 from .cache import CACHE
+from .connections import POOL, RETRY_POLICY
 from .exceptions import NoSiibraConfigMirrorsAvailableException, TagNotFoundException
@@ -15,8 +15,18 @@
 
 import hashlib
 import os
+import shutil
+import sqlite3
+from time import time
 from appdirs import user_cache_dir
 import tempfile
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from nibabel.spatialimages import SpatialImage
+from nibabel.gifti import GiftiImage
 
 from ..commons import logger, SIIBRA_CACHEDIR
 
@@ -42,12 +52,154 @@ def assert_folder(folder):
         return tmpdir
 
 
+class CacheIndex:
+    """
+    Persistent manifest of the entries in the cache folder, stored as a small
+    sqlite database inside the folder. Records size, last access time,
+    origin url and http validators (ETag, Last-Modified) of each entry,
+    so that the cache does not need to be scanned.
+    """
+
+    FILENAME = ".siibra-cache-index.sqlite"
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.filename = os.path.join(folder, self.FILENAME)
+        self.is_new = not os.path.isfile(self.filename)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(
+            self.filename, timeout=60, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "name TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL, url TEXT, "
+            "etag TEXT, last_modified TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        for column in ["etag", "last_modified"]:  # indices of older siibra versions
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE entries ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+
+    def _name(self, filename: str):
+        return os.path.relpath(filename, self.folder)
+
+    def add(
+        self,
+        filename: str,
+        size: int,
+        atime: float,
+        url: str = None,
+        etag: str = None,
+        last_modified: str = None
+    ):
+        name = self._name(filename)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, "
+                "COALESCE(?, (SELECT url FROM entries WHERE name = ?)), "
+                "COALESCE(?, (SELECT etag FROM entries WHERE name = ?)), "
+                "COALESCE(?, (SELECT last_modified FROM entries WHERE name = ?)))",
+                (name, size, atime, url, name, etag, name, last_modified, name)
+            )
+
+    def add_many(self, entries: List[Tuple[str, int, float]]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (name, size, atime) VALUES (?, ?, ?)",
+                [(self._name(fn), size, atime) for fn, size, atime in entries]
+            )
+            self._conn.execute("COMMIT")
+
+    def touch(self, filename: str, atime: float):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET atime = ? WHERE name = ?",
+                (atime, self._name(filename))
+            )
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE name = ?", (self._name(filename),))
+
+    def validators(self, filename: str) -> Tuple[str, str]:
+        """ Return the (ETag, Last-Modified) headers stored for the entry, if any. """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified FROM entries WHERE name = ?",
+                (self._name(filename),)
+            ).fetchone()
+        return (None, None) if row is None else row
+
+    def get(self, filename: str):
+        """ Return (size, atime, url) of the entry, or None. """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, atime, url FROM entries WHERE name = ?",
+                (self._name(filename),)
+            ).fetchone()
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def oldest(self) -> List[Tuple[str, int]]:
+        """ All entries as (filename, size), least recently accessed first. """
+        with self._lock:
+            rows = self._conn.execute("SELECT name, size FROM entries ORDER BY atime").fetchall()
+        return [(os.path.join(self.folder, name), size) for name, size in rows]
+
+    def __iter__(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM entries").fetchall()
+        return (os.path.join(self.folder, name) for name, in rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _file_size(filename: str):
+    # disk usage, which is less than the logical size of sparse files
+    st = os.stat(filename)
+    blocks = getattr(st, "st_blocks", None)
+    return st.st_size if blocks is None else min(st.st_size, blocks * 512)
+
+
+def _entry_size(filename: str):
+    if os.path.isdir(filename):
+        return sum(
+            _file_size(os.path.join(root, f))
+            for root, _, files in os.walk(filename)
+            for f in files
+        )
+    return _file_size(filename)
+
+
 class Cache:
 
     _instance = None
     folder = user_cache_dir(".".join(__name__.split(".")[:-1]), "")
     SIZE_GIB = 2  # maintenance will delete old files to stay below this limit
 
+    # Entries are stored in nested subfolders named by prefixes of their hash,
+    # e.g. <folder>/ab/cd/abcd..., to keep the number of entries per folder small.
+    SHARD_DEPTH = 2
+    SHARD_WIDTH = 2
+
+    # Files kept next to an entry by its writers: partial downloads, the http
+    # validator of a partial download, and file locks. Longest suffix first.
+    COMPANION_SUFFIXES = ["_temp.validator", "_temp.lock", "_temp", ".lock"]
+    # Companions of entries that do not exist are deleted by maintenance once
+    # they are older than this (in seconds), since their writer may still be busy.
+    ORPHAN_MAX_AGE = 24 * 3600
+
     def __init__(self):
         raise RuntimeError(
             "Call instance() to access "
@@ -63,56 +215,191 @@ class Cache:
                 cls.folder = SIIBRA_CACHEDIR
             cls.folder = assert_folder(cls.folder)
             cls._instance = cls.__new__(cls)
+            cls._instance._index_cached = None
             cls._instance.run_maintenance()
         return cls._instance
 
-    def clear(self):
-        import shutil
+    @property
+    def index(self) -> CacheIndex:
+        """
+        The persistent index of cache entries. Built by scanning the cache
+        folder once if it does not exist yet, e.g. for caches of older versions.
+        """
+        if self._index_cached is None:
+            self._index_cached = CacheIndex(self.folder)
+            if self._index_cached.is_new:
+                self.rebuild_index()
+        return self._index_cached
+
+    def _is_shard(self, fname: str, level: int):
+        return (
+            level < self.SHARD_DEPTH
+            and len(fname) == self.SHARD_WIDTH
+            and all(c in "0123456789abcdef" for c in fname)
+        )
+
+    def _iter_entries(self, folder: str = None, level: int = 0):
+        # yields the full paths of all cache entries, descending into shard folders
+        folder = folder or self.folder
+        for fname in os.listdir(folder):
+            if fname.startswith(CacheIndex.FILENAME):
+                continue
+            fn = os.path.join(folder, fname)
+            if self._is_shard(fname, level) and os.path.isdir(fn):
+                yield from self._iter_entries(fn, level + 1)
+            else:
+                yield fn
+
+    def _companion_of(self, filename: str):
+        # the entry a companion file belongs to, or None
+        for suffix in self.COMPANION_SUFFIXES:
+            if filename.endswith(suffix):
+                return filename[:-len(suffix)]
+        return None
+
+    def rebuild_index(self):
+        """ Rebuild the cache index by scanning all entries of the cache folder. """
+        logger.debug(f"Building cache index of {self.folder}")
+        entries = []
+        for fn in self._iter_entries():
+            if self._companion_of(fn) is not None:
+                continue
+            try:
+                entries.append((fn, _entry_size(fn), os.stat(fn).st_atime))
+            except OSError:
+                continue
+        self._index_cached.add_many(entries)
 
+    def _shard_folder(self, hashstr: str):
+        return os.path.join(
+            self.folder,
+            *[hashstr[i * self.SHARD_WIDTH: (i + 1) * self.SHARD_WIDTH] for i in range(self.SHARD_DEPTH)]
+        )
+
+    def _migrate_entry(self, flatfile: str, filename: str):
+        # move an entry of the old flat cache layout into its shard folder
+        try:
+            self.ensure_folder(filename)
+            os.rename(flatfile, filename)
+        except OSError:
+            return
+        self.index.remove(flatfile)
+        self.register(filename)
+
+    def migrate(self):
+        """
+        Move all entries of the flat cache layout used by previous siibra
+        versions into their shard folders. Not required, since entries are
+        also migrated one by one when they are requested.
+        """
+        flat_entries = [
+            fname for fname in os.listdir(self.folder)
+            if not fname.startswith(CacheIndex.FILENAME) and not self._is_shard(fname, 0)
+        ]
+        logger.info(f"Migrating {len(flat_entries)} entries to the sharded cache layout.")
+        for fname in flat_entries:
+            shard = self._shard_folder(fname)
+            self._migrate_entry(os.path.join(self.folder, fname), os.path.join(shard, fname))
+
+    def register(self, filename: str, url: str = None, etag: str = None, last_modified: str = None):
+        """
+        Record a new or updated entry in the cache index.
+        To be called after writing a file (or folder) to the cache.
+        """
+        try:
+            size = _entry_size(filename)
+        except OSError:
+            return
+        self.index.add(filename, size, time(), url, etag, last_modified)
+
+    def touch(self, filename: str):
+        """ Record read access to an entry of the cache. """
+        self.index.touch(filename, time())
+
+    @staticmethod
+    def _delete(filename: str):
+        if os.path.isdir(filename):
+            shutil.rmtree(filename, ignore_errors=True)
+        elif os.path.isfile(filename):
+            os.remove(filename)
+
+    def remove(self, filename: str):
+        """ Delete an entry and its companion files from the cache and its index. """
+        self._delete(filename)
+        for suffix in self.COMPANION_SUFFIXES:
+            try:
+                self._delete(filename + suffix)
+            except OSError as e:
+                logger.debug(f"Could not remove {filename + suffix} from cache: {e}")
+        self.index.remove(filename)
+
+    def remove_orphans(self):
+        """
+        Delete companion files of entries which do not exist, e.g. partial
+        downloads and file locks left behind by failed downloads. Files
+        changed within the last ORPHAN_MAX_AGE seconds are kept.
+        """
+        expiry = time() - self.ORPHAN_MAX_AGE
+        for fn in self._iter_entries():
+            entry = self._companion_of(fn)
+            if entry is None or os.path.exists(entry):
+                continue
+            try:
+                if os.stat(fn).st_mtime < expiry:
+                    self._delete(fn)
+            except OSError as e:
+                logger.debug(f"Could not remove {fn} from cache: {e}")
+
+    def clear(self):
         logger.info(f"Clearing siibra cache at {self.folder}")
+        if self._index_cached is not None:
+            self._index_cached.close()
+            self._index_cached = None
         shutil.rmtree(self.folder)
         self.folder = assert_folder(self.folder)
 
     def run_maintenance(self):
         """ Shrinks the cache by deleting oldest files first until the total size
-        is below cache size (Cache.SIZE) given in GiB."""
+        is below cache size (Cache.SIZE) given in GiB. Orphaned companion files
+        are deleted as well, which requires a scan of the cache folder."""
+        size_bytes = self.index.total_size()
+        if size_bytes <= self.SIZE_GIB * 1024**3:
+            return
 
-        # build sorted list of cache files and their os attributes
-        files = [os.path.join(self.folder, fname) for fname in os.listdir(self.folder)]
-        sfiles = sorted([(fn, os.stat(fn)) for fn in files], key=lambda t: t[1].st_atime)
+        self.remove_orphans()
 
         # determine the first n files that need to be deleted to reach the accepted cache size
-        size_gib = sum(t[1].st_size for t in sfiles) / 1024**3
-        targetsize = size_gib
-        index = 0
-        for index, (fn, st) in enumerate(sfiles):
-            if targetsize <= self.SIZE_GIB:
+        targetsize = size_bytes
+        expired = []
+        for fn, size in self.index.oldest():
+            if targetsize <= self.SIZE_GIB * 1024**3:
                 break
-            targetsize -= st.st_size / 1024**3
-
-        if index > 0:
-            logger.debug(f"Removing the {index+1} oldest files to keep cache size below {targetsize:.2f} GiB.")
-            for fn, st in sfiles[:index + 1]:
-                if os.path.isdir(fn):
-                    import shutil
-                    size = sum(os.path.getsize(f) for f in os.listdir(fn) if os.path.isfile(f))
-                    shutil.rmtree(fn)
-                else:
-                    size = st.st_size
-                    os.remove(fn)
-                size_gib -= size / 1024**3
+            expired.append(fn)
+            targetsize -= size
+
+        logger.debug(f"Removing the {len(expired)} oldest files to keep cache size below {self.SIZE_GIB:.2f} GiB.")
+        for fn in expired:
+            try:
+                self.remove(fn)
+            except OSError as e:
+                logger.debug(f"Could not remove {fn} from cache: {e}")
 
     @property
     def size(self):
         """ Return size of the cache in GiB. """
-        return sum(os.path.getsize(fn) for fn in self) / 1024**3
+        return self.index.total_size() / 1024**3
 
     def __iter__(self):
-        """ Iterate all element names in the cache directory. """
-        return (os.path.join(self.folder, f) for f in os.listdir(self.folder))
+        """ Iterate all element names in the cache. """
+        return iter(self.index)
+
+    def ensure_folder(self, filename: str):
+        """ Create the shard folder of a cache entry. To be called before writing it. """
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
 
     def build_filename(self, str_rep: str, suffix=None):
-        """Generate a filename in the cache.
+        """Generate a filename in the cache. The shard folder of the file is
+        not created, see ensure_folder().
 
         Args:
             str_rep (str): Unique string representation of the item. Will be used to compute a hash.
@@ -121,16 +408,155 @@ class Cache:
         Returns:
             filename
         """
-        hashfile = os.path.join(
-            self.folder, str(hashlib.sha256(str_rep.encode("ascii")).hexdigest())
-        )
+        hashstr = hashlib.sha256(str_rep.encode("ascii")).hexdigest()
         if suffix is None:
-            return hashfile
+            basename = hashstr
+        elif suffix.startswith("."):
+            basename = hashstr + suffix
         else:
-            if suffix.startswith("."):
-                return hashfile + suffix
-            else:
-                return hashfile + "." + suffix
+            basename = hashstr + "." + suffix
+
+        filename = os.path.join(self._shard_folder(hashstr), basename)
+        if not os.path.exists(filename):
+            flatfile = os.path.join(self.folder, basename)
+            if os.path.exists(flatfile):
+                self._migrate_entry(flatfile, filename)
+        return filename
+
+
+# memory footprint counted for objects whose data stays on disk, i.e.
+# memory-mapped arrays and images which read their data through a proxy
+MAPPED_NBYTES = 4096
+
+
+def estimate_nbytes(obj: Any):
+    """
+    Estimate the memory footprint in bytes of a decoded object.
+    Returns None for object types that are not known, or that
+    carry state (e.g. file handles) and should therefore not be shared.
+    """
+    if isinstance(obj, np.memmap):
+        return MAPPED_NBYTES
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, str)):
+        return len(obj)
+    if isinstance(obj, (int, float, bool)) or obj is None:
+        return 8
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, SpatialImage):
+        return estimate_nbytes(obj.dataobj) if isinstance(obj.dataobj, np.ndarray) else MAPPED_NBYTES
+    if isinstance(obj, GiftiImage):
+        return sum(d.data.nbytes for d in obj.darrays if d.data is not None)
+    if isinstance(obj, (list, tuple)):
+        sizes = [estimate_nbytes(v) for v in obj]
+        return None if any(s is None for s in sizes) else sum(sizes)
+    if isinstance(obj, dict):
+        sizes = [estimate_nbytes(v) for v in obj.values()]
+        return None if any(s is None for s in sizes) else sum(sizes) + 64 * len(obj)
+    return None
+
+
+def _set_readonly(obj: Any):
+    """Make the arrays of a decoded object read-only, since it is shared."""
+    if isinstance(obj, np.ndarray):
+        obj.flags.writeable = False
+    elif isinstance(obj, SpatialImage) and isinstance(obj.dataobj, np.ndarray):
+        obj.dataobj.flags.writeable = False
+    elif isinstance(obj, GiftiImage):
+        for d in obj.darrays:
+            if isinstance(d.data, np.ndarray):
+                d.data.flags.writeable = False
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _set_readonly(v)
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _set_readonly(v)
+
+
+class MemoryCache:
+    """
+    Least-recently-used in-memory cache of decoded objects, placed above the
+    disk cache. Disabled as long as the byte budget is zero.
+
+    Cached objects are shared by all callers, so their arrays are made
+    read-only, and data frames are returned as copies.
+    """
+
+    def __init__(self, maxsize_bytes: int = 0):
+        self.maxsize_bytes = maxsize_bytes
+        self._items = OrderedDict()
+        self._nbytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build_key(filename: str, decoder_name: Optional[str]) -> Optional[Hashable]:
+        """
+        Key of the object decoded from a file by the named decoder. Decoders
+        without a stable name give no key, and their objects are not cached.
+        """
+        return None if decoder_name is None else (filename, decoder_name)
+
+    @property
+    def enabled(self):
+        return self.maxsize_bytes > 0
+
+    @property
+    def size(self):
+        """ Return size of the memory cache in GiB. """
+        return self._nbytes / 1024**3
+
+    def get(self, key: Hashable):
+        """ Return the cached object, or None if not available. """
+        if not self.enabled or key is None:
+            return None
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            obj = self._items[key][0]
+        # data frames cannot be made read-only, so callers get their own copy
+        return obj.copy() if isinstance(obj, pd.DataFrame) else obj
+
+    def put(self, key: Hashable, obj: Any):
+        if not self.enabled or key is None:
+            return
+        nbytes = estimate_nbytes(obj)
+        if nbytes is None or nbytes > self.maxsize_bytes:
+            return
+        _set_readonly(obj)
+        with self._lock:
+            self._pop(key)
+            self._items[key] = (obj, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.maxsize_bytes:
+                _, (_, evicted_nbytes) = self._items.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+
+    def invalidate(self, filename: str):
+        """ Drop all objects decoded from the given file. """
+        with self._lock:
+            for key in [k for k in self._items if k[0] == filename]:
+                self._pop(key)
+
+    def _pop(self, key: Hashable):
+        if key in self._items:
+            _, nbytes = self._items.pop(key)
+            self._nbytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._nbytes = 0
 
 
 CACHE = Cache.instance()
+MEMORY_CACHE = MemoryCache()
+# decoded image chunks of neuroglancer volumes, shared by overlapping fetches
+CHUNK_CACHE = MemoryCache(maxsize_bytes=256 * 1024**2)
@@ -0,0 +1,344 @@
+# Copyright 2018-2021
+# Institute of Neuroscience and Medicine (INM-1), Forschungszentrum Jülich GmbH
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Shared pool of keep-alive HTTP connections used by all siibra requests,
+with the retry policy applied to them."""
+
+from .exceptions import CircuitOpenError
+from ..commons import logger
+
+import requests
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import random
+
+
+def _hostkey(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of one host. After `threshold` failures in a
+    row the circuit opens and requests to the host are rejected immediately
+    for `cooldown` seconds. Afterwards a single trial request is let through,
+    which closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.opened_at is not None and monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now. Lets one trial request through after the cooldown."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.opened_at = monotonic()  # half open: block others during the trial
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = monotonic()
+
+
+class RetryPolicy:
+    """
+    Retry policy shared by all http requests of siibra.
+
+    Failed idempotent requests are retried with exponential backoff and full
+    jitter, honouring a `Retry-After` header sent by the server, as long as
+    the total deadline of the request is not exceeded. Hosts which keep
+    failing are taken offline by a per-host circuit breaker, so that callers
+    fail fast (and e.g. move on to another mirror) instead of waiting for
+    timeouts.
+    """
+
+    MAX_RETRIES = 4
+    BACKOFF_BASE = 0.5  # seconds
+    BACKOFF_MAX = 30.  # seconds
+    DEADLINE = 300.  # seconds, total time spent on one request including retries
+    TIMEOUT = (10., 120.)  # seconds, (connect, read) timeouts of a single attempt
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+    RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+    BREAKER_THRESHOLD = 5
+    BREAKER_COOLDOWN = 30.  # seconds
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = Lock()
+
+    def configure(
+        self,
+        max_retries: int = None,
+        backoff_base: float = None,
+        backoff_max: float = None,
+        deadline: float = None,
+        timeout: Union[float, Tuple[float, float]] = None,
+        breaker_threshold: int = None,
+        breaker_cooldown: float = None,
+    ):
+        """
+        Change the retry policy. Parameters left at None are not changed.
+
+        Parameters
+        ----------
+        max_retries: int
+            Number of retries after the first attempt of a request.
+        backoff_base: float
+            Upper bound in seconds of the first backoff, doubled for each retry.
+        backoff_max: float
+            Upper bound in seconds of any single backoff.
+        deadline: float
+            Total time in seconds after which a request is not retried anymore.
+        timeout: float or (float, float)
+            Connect and read timeouts in seconds of each attempt.
+        breaker_threshold: int
+            Number of consecutive failures after which a host is taken offline.
+        breaker_cooldown: float
+            Time in seconds for which an offline host is not contacted.
+        """
+        for attr, value in [
+            ("MAX_RETRIES", max_retries),
+            ("BACKOFF_BASE", backoff_base),
+            ("BACKOFF_MAX", backoff_max),
+            ("DEADLINE", deadline),
+            ("TIMEOUT", timeout),
+            ("BREAKER_THRESHOLD", breaker_threshold),
+            ("BREAKER_COOLDOWN", breaker_cooldown),
+        ]:
+            if value is not None:
+                setattr(self, attr, value)
+        self.reset()
+
+    def reset(self):
+        """Close all circuit breakers."""
+        with self._lock:
+            self._breakers.clear()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """The circuit breaker of the host of the given url."""
+        host = _hostkey(url)
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_COOLDOWN)
+            return self._breakers[host]
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Time in seconds to wait before the given retry (counting from 0)."""
+        if retry_after is not None:
+            return min(retry_after, self.BACKOFF_MAX)
+        return random.uniform(0, min(self.BACKOFF_BASE * 2 ** attempt, self.BACKOFF_MAX))
+
+    @staticmethod
+    def retry_after(response: requests.Response) -> Optional[float]:
+        """The delay in seconds requested by a `Retry-After` header, if any."""
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time(), 0.)
+        except (TypeError, ValueError):
+            return None
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of persistent HTTP connections.
+
+    All http traffic of siibra is routed through one requests.Session, so that
+    TCP and TLS handshakes are only paid once per connection instead of once
+    per request. The underlying urllib3 connection pools are thread-safe.
+    """
+
+    _instance = None
+    POOL_CONNECTIONS = 10  # number of hosts for which connection pools are kept
+    POOL_MAXSIZE = 10  # number of connections kept alive per host
+
+    def __init__(self):
+        raise RuntimeError(
+            "Call instance() to access "
+            f"{self.__class__.__name__}")
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the instance of the siibra connection pool.
+        """
+        if cls._instance is None:
+            cls._instance = cls.__new__(cls)
+            cls._instance._session = None
+            cls._instance._lock = Lock()
+        return cls._instance
+
+    @property
+    def session(self) -> requests.Session:
+        """The shared session, created on first use."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.POOL_CONNECTIONS,
+            pool_maxsize=self.POOL_MAXSIZE
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def configure(self, pool_connections: int = None, pool_maxsize: int = None):
+        """
+        Change the pool limits. Existing connections are closed and the
+        session is rebuilt with the new limits on next use.
+
+        Parameters
+        ----------
+        pool_connections: int, default: None
+            Number of hosts for which connection pools are kept.
+        pool_maxsize: int, default: None
+            Maximum number of connections kept alive per host.
+        """
+        if pool_connections is not None:
+            assert pool_connections > 0
+            self.POOL_CONNECTIONS = pool_connections
+        if pool_maxsize is not None:
+            assert pool_maxsize > 0
+            self.POOL_MAXSIZE = pool_maxsize
+        self.close()
+        logger.debug(
+            f"Configured http connection pools for {self.POOL_CONNECTIONS} hosts "
+            f"with up to {self.POOL_MAXSIZE} connections each."
+        )
+
+    def close(self):
+        """Close all pooled connections."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the pool, applying the retry policy. Responses
+        with an error status are returned once retries are exhausted, while
+        connection errors are raised.
+        """
+        policy = RETRY_POLICY
+        breaker = policy.breaker(url)
+        retryable = method.upper() in policy.RETRY_METHODS
+        deadline = monotonic() + policy.DEADLINE
+        kwargs.setdefault("timeout", policy.TIMEOUT)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    f"{_hostkey(url)} failed repeatedly and is not contacted "
+                    f"for {breaker.cooldown:.0f} seconds."
+                )
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                wait = policy.backoff(attempt)
+                if not retryable or attempt >= policy.MAX_RETRIES or monotonic() + wait > deadline:
+                    raise
+                logger.debug(f"{method} {url} failed ({e}), retrying in {wait:.1f}s.")
+            else:
+                if response.status_code not in policy.RETRY_STATUS:
+                    breaker.record_success()
+                    return response
+                if response.status_code != 429:  # throttling is not a host failure
+                    breaker.record_failure()
+                wait = policy.backoff(attempt, policy.retry_after(response))
+                if not retryable or attempt >= policy.MAX_RETRIES or monotonic() + wait > deadline:
+                    return response
+                response.close()
+                logger.debug(f"{method} {url} returned {response.status_code}, retrying in {wait:.1f}s.")
+            sleep(wait)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Usage statistics of the currently open host pools, keyed by
+        "<scheme>://<host>[:<port>]". For each host, the number of
+        connections opened, requests sent, and requests that reused an
+        already open connection are reported.
+        """
+        result = {}
+        if self._session is None:
+            return result
+        seen = set()
+        for adapter in self._session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                try:
+                    pool = pools[key]
+                except KeyError:  # evicted meanwhile
+                    continue
+                hostkey = f"{key.key_scheme}://{key.key_host}"
+                if key.key_port is not None:
+                    hostkey += f":{key.key_port}"
+                result[hostkey] = {
+                    "connections": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "reused": max(pool.num_requests - pool.num_connections, 0),
+                }
+        return result
+
+
+RETRY_POLICY = RetryPolicy()
+POOL = ConnectionPool.instance()
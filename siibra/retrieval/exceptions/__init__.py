@@ -8,3 +8,7 @@ class TagNotFoundException(Exception):
 
 class EbrainsAuthenticationError(Exception):
     pass
+
+
+class CircuitOpenError(Exception):
+    pass
@@ -18,9 +18,11 @@ from .requests import (
     EbrainsRequest,
     SiibraHttpRequestError,
     find_suitiable_decoder,
+    decode_file,
     DECODERS
 )
 from .cache import CACHE
+from .connections import POOL
 
 from ..commons import logger, siibra_tqdm
 
@@ -29,7 +31,6 @@ from urllib.parse import quote
 import os
 from zipfile import ZipFile
 from typing import List
-import requests
 
 
 class RepositoryConnector(ABC):
@@ -63,9 +64,8 @@ class RepositoryConnector(ABC):
         if url is None:
             raise RuntimeError(f"Cannot build url for ({folder}, {filename})")
         if decode_func is None:
-            return HttpRequest(url, lambda b: self._decode_response(b, filename))
-        else:
-            return HttpRequest(url, decode_func)
+            decode_func = find_suitiable_decoder(filename) or (lambda b: b)
+        return HttpRequest(url, decode_func)
 
     def get_loaders(
         self, folder="", suffix=None, progress=None, recursive=False, decode_func=None
@@ -124,8 +124,7 @@ class LocalFileRepository(RepositoryConnector):
 
         @property
         def data(self):
-            with open(self.url, 'rb') as f:
-                return self.func(f.read())
+            return decode_file(self.url, self.func)
 
     def get_loader(self, filename, folder="", decode_func=None):
         """Get a lazy loader for a file, for loading data
@@ -134,9 +133,8 @@ class LocalFileRepository(RepositoryConnector):
         if url is None:
             raise RuntimeError(f"Cannot build url for ({folder}, {filename})")
         if decode_func is None:
-            return self.FileLoader(url, lambda b: self._decode_response(b, filename))
-        else:
-            return self.FileLoader(url, decode_func)
+            decode_func = find_suitiable_decoder(filename) or (lambda b: b)
+        return self.FileLoader(url, decode_func)
 
     def search_files(self, folder="", suffix=None, recursive=False):
         exclude = ['.', '~']
@@ -178,7 +176,7 @@ class GitlabConnector(RepositoryConnector):
         self.reftag = reftag
         self._per_page = 100
         self._branchloader = HttpRequest(
-            f"{self.base_url}/branches", DECODERS[".json"], refresh=True
+            f"{self.base_url}/branches", DECODERS[".json"], revalidate=True
         )
         self._tag_checked = True if skip_branchtest else False
         self._want_commit_cached = None
@@ -250,8 +248,9 @@ class GitlabConnector(RepositoryConnector):
 
         if not os.path.isdir(archive_directory):
 
+            CACHE.ensure_folder(archive_directory)
             url = self.base_url + f"/archive.tar.gz?sha={ref}"
-            resp = requests.get(url)
+            resp = POOL.get(url)
             tar_filename = f"{archive_directory}.tar.gz"
 
             resp.raise_for_status()
@@ -265,6 +264,9 @@ class GitlabConnector(RepositoryConnector):
                 for file in os.listdir(f"{archive_directory}/{_dir}"):
                     os.rename(f"{archive_directory}/{_dir}/{file}", f"{archive_directory}/{file}")
                 os.rmdir(f"{archive_directory}/{_dir}")
+            CACHE.register(tar_filename, url=url)
+            CACHE.register(archive_directory, url=url)
+        CACHE.touch(archive_directory)
 
         with open(f"{archive_directory}/{folder}/{filename}", "rb") as fp:
             return self._decode_response(fp.read(), filename)
@@ -13,7 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .cache import CACHE
+from .cache import CACHE, MEMORY_CACHE
+from .connections import POOL, RETRY_POLICY
 from .exceptions import EbrainsAuthenticationError
 from ..commons import (
     logger,
@@ -27,21 +28,33 @@ from .. import __version__
 
 import json
 from zipfile import ZipFile
-import requests
 import os
 from nibabel import Nifti1Image, GiftiImage, streamlines
+from nibabel.fileholders import FileHolder
 from skimage import io as skimage_io
 import gzip
-from io import BytesIO
+import zlib
+import shutil
+from io import BytesIO, RawIOBase
 import urllib.parse
 import pandas as pd
 import numpy as np
-from typing import List, Callable, Any, TYPE_CHECKING
+from typing import List, Callable, Any, Dict, Iterable, Optional, Tuple, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock as ThreadLock
+from contextlib import contextmanager
+from requests.exceptions import ChunkedEncodingError, ConnectionError as RequestsConnectionError
 from enum import Enum
 from functools import wraps
 from time import sleep
 import sys
 import platform
+import inspect
+
+try:
+    from indexed_gzip import IndexedGzipFile
+except ImportError:  # optional, enables random access into gzipped files
+    IndexedGzipFile = None
 
 if platform.system() == "Linux":
     from filelock import FileLock as Lock
@@ -53,21 +66,189 @@ if TYPE_CHECKING:
 
 USER_AGENT_HEADER = {"User-Agent": f"siibra-python/{__version__}"}
 
+# in-process locks of the cache entries currently being downloaded,
+# with the number of threads holding or waiting for each of them
+_INFLIGHT: Dict[str, List] = {}
+_INFLIGHT_GUARD = ThreadLock()
+
+
+@contextmanager
+def _singleflight(key: str):
+    """
+    Serialize threads of this process which retrieve the same cache entry,
+    so that only one of them downloads while the others wait for it.
+    """
+    with _INFLIGHT_GUARD:
+        entry = _INFLIGHT.setdefault(key, [ThreadLock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _INFLIGHT_GUARD:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _INFLIGHT[key]
+
+
+class FileDecoder:
+    """
+    A decoder which can also read a file on disk directly, e.g. by memory
+    mapping it, instead of decoding its full content from memory. Called
+    with bytes, it behaves like any other decoder.
+    """
+
+    def __init__(self, decode_bytes: Callable, decode_file: Callable):
+        self.decode_bytes = decode_bytes
+        self.decode_file = decode_file
+
+    def __call__(self, b: bytes):
+        return self.decode_bytes(b)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.decode_file.__qualname__})"
+
+
+def _load_nifti_file(filename: str) -> Nifti1Image:
+    # file map instead of nibabel.load, since cache files have no suffix.
+    # The image proxy opens the file by name on each read and keeps no file
+    # handle, so that many cached images do not exhaust the file descriptors.
+    holder = FileHolder(filename=filename)
+    return Nifti1Image.from_file_map({"header": holder, "image": holder}, mmap=True)
+
+
+def _load_npy_file(filename: str) -> np.ndarray:
+    # copy-on-write, so that callers may still modify the array in memory.
+    # The memory map stays valid if the cache entry is replaced or removed.
+    return np.load(filename, mmap_mode="c")
+
+
+def decode_file(filename: str, func: Callable = None):
+    """
+    Decode a file on disk with the given decoder. File decoders receive the
+    path, other decoders the content of the file.
+    """
+    if isinstance(func, FileDecoder):
+        return func.decode_file(filename)
+    with open(filename, "rb") as f:
+        data = f.read()
+    return data if func is None else func(data)
+
+
 DECODERS = {
-    ".nii": lambda b: Nifti1Image.from_bytes(b),
+    ".nii": FileDecoder(lambda b: Nifti1Image.from_bytes(b), _load_nifti_file),
     ".gii": lambda b: GiftiImage.from_bytes(b),
     ".json": lambda b: json.loads(b.decode()),
     ".tck": lambda b: streamlines.load(BytesIO(b)),
     ".csv": lambda b: pd.read_csv(BytesIO(b)),
     ".tsv": lambda b: pd.read_csv(BytesIO(b), delimiter="\t").dropna(axis=0, how="all"),
     ".txt": lambda b: pd.read_csv(BytesIO(b), delimiter=" ", header=None),
-    ".zip": lambda b: ZipFile(BytesIO(b)),
+    ".zip": FileDecoder(lambda b: ZipFile(BytesIO(b)), ZipFile),
     ".png": lambda b: skimage_io.imread(BytesIO(b)),
-    ".npy": lambda b: np.load(BytesIO(b)),
+    ".npy": FileDecoder(lambda b: np.load(BytesIO(b)), _load_npy_file),
 }
 
 
-def find_suitiable_decoder(url: str) -> Callable:
+def decompressed_copy(filename: str) -> str:
+    """
+    Return a decompressed copy of a gzipped file, kept in the local cache.
+    The copy is created on first use, and replaced if the gzipped file changes.
+    """
+    stat = os.stat(filename)
+    target = CACHE.build_filename(f"{filename} {stat.st_size} {stat.st_mtime_ns}", suffix=".decompressed")
+    if not os.path.isfile(target):
+        CACHE.ensure_folder(target)
+        temp_target = f"{target}_temp"
+        with _singleflight(target), Lock(f"{temp_target}.lock"):
+            if not os.path.isfile(target):
+                logger.debug(f"Keeping decompressed copy of {filename} in the cache.")
+                with gzip.open(filename, "rb") as src, open(temp_target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, HttpRequest.MAX_BLOCK_SIZE)
+                os.rename(temp_target, target)
+                CACHE.register(target)
+    CACHE.touch(target)
+    return target
+
+
+def indexed_gzip_file(filename: str, spacing: int = 2 * 1024**2) -> "IndexedGzipFile":
+    """
+    Open a gzipped file for random access, so that reading a part of it only
+    decompresses the blocks needed. The seek point index is built once and
+    kept in the local cache. Requires the indexed_gzip package.
+    """
+    stat = os.stat(filename)
+    indexfile = CACHE.build_filename(f"{filename} {stat.st_size} {stat.st_mtime_ns}", suffix=".gzidx")
+    if not os.path.isfile(indexfile):
+        CACHE.ensure_folder(indexfile)
+        temp_indexfile = f"{indexfile}_temp"
+        with _singleflight(indexfile), Lock(f"{temp_indexfile}.lock"):
+            if not os.path.isfile(indexfile):
+                logger.debug(f"Building gzip seek index for {filename}.")
+                with IndexedGzipFile(filename, spacing=spacing) as f:
+                    f.build_full_index()
+                    f.export_index(temp_indexfile)
+                os.rename(temp_indexfile, indexfile)
+                CACHE.register(indexfile)
+    CACHE.touch(indexfile)
+    return IndexedGzipFile(filename, index_file=indexfile)
+
+
+def _load_indexed_nifti_file(filename: str) -> Nifti1Image:
+    holder = FileHolder(fileobj=indexed_gzip_file(filename))
+    return Nifti1Image.from_file_map({"header": holder, "image": holder})
+
+
+# decoders of gzipped content, by (decoder, keep_decompressed, indexed)
+_GZIP_DECODERS: Dict[Tuple[Callable, bool, bool], Callable] = {}
+
+
+def _gzip_decoder(dec: Callable, keep_decompressed: bool = False, indexed: bool = False) -> Callable:
+    """
+    Decoder of gzipped content for the given decoder. It is created once per
+    combination of arguments, so that it has a stable name, see decoder_name().
+    """
+    key = (dec, keep_decompressed, indexed)
+    if key not in _GZIP_DECODERS:
+        if dec is None:
+            gzdec = lambda b: gzip.decompress(b)
+        elif keep_decompressed:
+            gzdec = FileDecoder(
+                lambda b: dec(gzip.decompress(b)),
+                lambda fn: dec.decode_file(decompressed_copy(fn))
+            )
+        elif indexed:
+            gzdec = FileDecoder(lambda b: dec(gzip.decompress(b)), _load_indexed_nifti_file)
+        else:
+            gzdec = lambda b: dec(gzip.decompress(b))
+        _GZIP_DECODERS.setdefault(key, gzdec)
+    return _GZIP_DECODERS[key]
+
+
+def decoder_name(func: Callable) -> Optional[str]:
+    """
+    Stable name of a decoder, under which the memory cache keeps the objects
+    it decoded: the suffix of decoders obtained from DECODERS or
+    find_suitiable_decoder(), or the qualified name of a function.
+    Returns None for lambdas, closures, partial objects and bound methods,
+    which cannot be told apart by name.
+    """
+    if func is None:
+        return ""
+    for suffix, dec in DECODERS.items():
+        if func is dec:
+            return suffix
+    for (dec, keep_decompressed, indexed), gzdec in list(_GZIP_DECODERS.items()):
+        if func is gzdec:
+            name = decoder_name(dec)
+            flags = " decompressed" * keep_decompressed + " indexed" * indexed
+            return None if name is None else f"{name}.gz{flags}"
+    qualname = getattr(func, "__qualname__", None)
+    if qualname is None or "<" in qualname or inspect.ismethod(func):
+        return None
+    return f"{func.__module__}.{qualname}"
+
+
+def find_suitiable_decoder(url: str, keep_decompressed: bool = False, gzip_index: bool = False) -> Callable:
     """
     By supplying a url or a filename, obtain a suitable decoder function
     for siibra to digest based on predifined DECODERS. An extra layer of 
@@ -77,6 +258,15 @@ def find_suitiable_decoder(url: str) -> Callable:
     ----------
     url : str
         The url or filename with extension.
+    keep_decompressed: bool, default: False
+        If True, gzipped files which have a file decoder (e.g. .nii.gz) are
+        decompressed into a copy in the local cache once, which is then read
+        by the file decoder (e.g. memory mapped) on this and later calls.
+    gzip_index: bool, default: False
+        If True, cached .nii.gz files are read through a persistent gzip seek
+        index, so that volumes of interest and single voxels can be read
+        without decompressing the whole image. Building the index costs one
+        full decompression on first use. Requires the indexed_gzip package.
 
     Returns
     -------
@@ -85,10 +275,14 @@ def find_suitiable_decoder(url: str) -> Callable:
     urlpath = urllib.parse.urlsplit(url).path
     if urlpath.endswith(".gz"):
         dec = find_suitiable_decoder(urlpath[:-3])
-        if dec is None:
-            return lambda b: gzip.decompress(b)
-        else:
-            return lambda b: dec(gzip.decompress(b))
+        indexed = gzip_index and urlpath.endswith(".nii.gz") and not keep_decompressed
+        if indexed and IndexedGzipFile is None:
+            raise ImportError("Reading gzipped images through a seek index requires the indexed_gzip package (pip install siibra[gzip-index]).")
+        return _gzip_decoder(
+            dec,
+            keep_decompressed=keep_decompressed and isinstance(dec, FileDecoder),
+            indexed=indexed
+        )
 
     suitable_decoders = [
         dec for sfx, dec in DECODERS.items() if urlpath.endswith(sfx)
@@ -112,6 +306,19 @@ class SiibraHttpRequestError(Exception):
 
 
 class HttpRequest:
+
+    # If True, cached content is revalidated with the server by all requests
+    # which do not explicitly specify the revalidate parameter.
+    REVALIDATE = False
+
+    # Downloads are streamed to the cache in blocks between these sizes,
+    # scaled with the size of the file.
+    MIN_BLOCK_SIZE = 64 * 1024
+    MAX_BLOCK_SIZE = 8 * 1024**2
+
+    # How often an interrupted download is resumed before giving up.
+    MAX_RESUMES = 5
+
     def __init__(
         self,
         url: str,
@@ -119,6 +326,7 @@ class HttpRequest:
         msg_if_not_cached: str = None,
         refresh=False,
         post=False,
+        revalidate: bool = None,
         **kwargs,
     ):
         """
@@ -141,6 +349,10 @@ class HttpRequest:
             If True, a possibly cached content will be ignored and refreshed
         post: bool, default: False
             perform a post instead of get
+        revalidate: bool, default: None
+            If True, a possibly cached content is revalidated using a conditional
+            request (If-None-Match / If-Modified-Since), and only downloaded again
+            if it changed on the server. Defaults to HttpRequest.REVALIDATE.
         """
         assert url is not None
         self.url = url
@@ -150,6 +362,7 @@ class HttpRequest:
         self.msg_if_not_cached = msg_if_not_cached
         self.refresh = refresh
         self.post = post
+        self.revalidate = self.REVALIDATE if revalidate is None else revalidate
 
     def _set_decoder_func(self, func: Callable = None):
         """
@@ -166,70 +379,179 @@ class HttpRequest:
     def cached(self):
         return os.path.isfile(self.cachefile)
 
-    def _retrieve(self, block_size=1024, min_bytesize_with_no_progress_info=2e8):
+    def _open_stream(self, headers: Dict[str, str], offset: int = 0, validator: str = None):
         """
-        Populates the file cache with the data from http if required.
-        noop if 1/ data is already cached and 2/ refresh flag not set
-        The caller should load the cachefile after _retrieve successfuly executes
+        Send the request and return the streamed response. With a nonzero
+        offset, only the remaining bytes are requested.
         """
-        if self.cached and not self.refresh:
-            return
-
-        # not yet in cache, perform http request.
-        if self.msg_if_not_cached is not None:
-            logger.debug(self.msg_if_not_cached)
-
-        headers = self.kwargs.get("headers", {})
+        if offset > 0:
+            headers = {**headers, "Range": f"bytes={offset}-"}
+            if validator is not None:
+                headers["If-Range"] = validator
         other_kwargs = {
             key: self.kwargs[key] for key in self.kwargs if key != "headers"
         }
+        http_method = POOL.post if self.post else POOL.get
+        return http_method(self.url, headers=headers, **other_kwargs, stream=True)
 
-        http_method = requests.post if self.post else requests.get
-        r = http_method(
-            self.url,
-            headers={
-                **USER_AGENT_HEADER,
-                **headers,
-            },
-            **other_kwargs,
-            stream=True,
-        )
+    @classmethod
+    def _adaptive_block_size(cls, size_bytes: int = None) -> int:
+        """Block size for streaming a download of the given size into the cache."""
+        if not size_bytes:
+            return cls.MIN_BLOCK_SIZE
+        return int(min(max(size_bytes // 256, cls.MIN_BLOCK_SIZE), cls.MAX_BLOCK_SIZE))
 
-        if not r.ok:
-            raise SiibraHttpRequestError(status_code=r.status_code, url=self.url)
+    def _retrieve(self, block_size=None, min_bytesize_with_no_progress_info=2e8):
+        """
+        Populates the file cache with the data from http if required.
+        noop if 1/ data is already cached and 2/ refresh flag not set
+        The caller should load the cachefile after _retrieve successfuly executes
 
-        size_bytes = int(r.headers.get("content-length", 0))
-        if size_bytes > min_bytesize_with_no_progress_info:
-            progress_bar = siibra_tqdm(
-                total=size_bytes,
-                unit="iB",
-                unit_scale=True,
-                position=0,
-                leave=True,
-                desc=f"Downloading {os.path.split(self.url)[-1]} ({size_bytes / 1024**2:.1f} MiB)",
-            )
+        Concurrent retrievals of the same cache entry are coalesced: threads of
+        this process wait for the one already downloading, other processes block
+        on the file lock, and both then use the finished file.
+        Interrupted downloads are resumed with Range requests if the server
+        supports them, and the result is checked against the announced size.
+        A partial download left behind by a failed call is resumed by the
+        next call, if its ETag or Last-Modified header was recorded so that the
+        server can check with If-Range that the resource did not change.
+        """
+        if self.cached and not self.refresh and not self.revalidate:
+            return
+
+        CACHE.ensure_folder(self.cachefile)
         temp_cachefile = f"{self.cachefile}_temp"
         lock = Lock(f"{temp_cachefile}.lock")
 
-        with lock:
-            with open(temp_cachefile, "wb") as f:
-                for data in r.iter_content(block_size):
-                    if size_bytes > min_bytesize_with_no_progress_info:
-                        progress_bar.update(len(data))
-                    f.write(data)
+        with _singleflight(self.cachefile), lock:
+            conditional_headers = {}
+            if self.cached and not self.refresh:
+                if not self.revalidate:
+                    # retrieved by another thread or process meanwhile
+                    return
+                etag, last_modified = CACHE.index.validators(self.cachefile)
+                if etag is not None:
+                    conditional_headers["If-None-Match"] = etag
+                if last_modified is not None:
+                    conditional_headers["If-Modified-Since"] = last_modified
+            elif self.msg_if_not_cached is not None:
+                # not yet in cache, perform http request.
+                logger.debug(self.msg_if_not_cached)
+
+            headers = {
+                **USER_AGENT_HEADER,
+                **self.kwargs.get("headers", {}),
+                **conditional_headers,
+            }
+            # validator of the partial download, if any, written next to it
+            validator_file = f"{temp_cachefile}.validator"
+            offset = 0
+            validator = None
+            if not self.post and os.path.isfile(temp_cachefile) and os.path.isfile(validator_file):
+                with open(validator_file, "r") as f:
+                    validator = f.read()
+                offset = os.path.getsize(temp_cachefile)
+            r = self._open_stream(headers, offset, validator)
+            if r.status_code == 416:  # stale partial download
+                r.close()
+                offset = 0
+                r = self._open_stream(headers)
+
+            if r.status_code == 304:  # not modified, keep the cached content
+                r.close()
+                logger.debug(f"Cached content of {self.url} is still valid.")
+                self.revalidate = False
+                CACHE.touch(self.cachefile)
+                return
+
+            if not r.ok:
+                raise SiibraHttpRequestError(status_code=r.status_code, url=self.url)
+
+            if r.status_code != 206:
+                offset = 0
+            # sizes are only meaningful if the content is not re-encoded on the fly
+            identity = r.headers.get("Content-Encoding", "identity") == "identity"
+            size_bytes = offset + int(r.headers.get("Content-Length", 0)) if identity else 0
+            resumable = not self.post and identity and (
+                r.status_code == 206 or r.headers.get("Accept-Ranges") == "bytes"
+            )
+            if offset == 0:
+                validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+                if resumable and validator is not None:
+                    with open(validator_file, "w") as f:
+                        f.write(validator)
+                elif os.path.isfile(validator_file):
+                    os.remove(validator_file)
+            if block_size is None:
+                block_size = self._adaptive_block_size(size_bytes)
+
+            if size_bytes > min_bytesize_with_no_progress_info:
+                progress_bar = siibra_tqdm(
+                    total=size_bytes,
+                    initial=offset,
+                    unit="iB",
+                    unit_scale=True,
+                    position=0,
+                    leave=True,
+                    desc=f"Downloading {os.path.split(self.url)[-1]} ({size_bytes / 1024**2:.1f} MiB)",
+                )
+            resumes = 0
+            while True:
+                try:
+                    with open(temp_cachefile, "ab" if offset > 0 else "wb") as f:
+                        for data in r.iter_content(block_size):
+                            if size_bytes > min_bytesize_with_no_progress_info:
+                                progress_bar.update(len(data))
+                            f.write(data)
+                            offset += len(data)
+                    break
+                except (ChunkedEncodingError, RequestsConnectionError) as e:
+                    r.close()
+                    if not resumable or resumes >= self.MAX_RESUMES:
+                        raise
+                    resumes += 1
+                    logger.debug(f"Download of {self.url} interrupted after {offset} bytes ({e}), resuming.")
+                    r = self._open_stream(headers, offset, validator)
+                    if not r.ok:
+                        raise SiibraHttpRequestError(status_code=r.status_code, url=self.url)
+                    if r.status_code != 206:  # resource changed, start over
+                        offset = 0
             if size_bytes > min_bytesize_with_no_progress_info:
                 progress_bar.close()
-            if self.refresh and os.path.isfile(self.cachefile):
+            if size_bytes > 0 and offset != size_bytes:
+                if offset > size_bytes:
+                    os.remove(temp_cachefile)
+                raise SiibraHttpRequestError(
+                    status_code=r.status_code,
+                    url=self.url,
+                    msg=f"Incomplete download: received {offset} of {size_bytes} bytes."
+                )
+            if (self.refresh or self.revalidate) and os.path.isfile(self.cachefile):
                 os.remove(self.cachefile)
             self.refresh = False
+            self.revalidate = False
             os.rename(temp_cachefile, self.cachefile)
+            if os.path.isfile(validator_file):
+                os.remove(validator_file)
+        CACHE.register(
+            self.cachefile,
+            url=self.url,
+            etag=r.headers.get("ETag"),
+            last_modified=r.headers.get("Last-Modified")
+        )
 
     def get(self):
+        memkey = MEMORY_CACHE.build_key(self.cachefile, decoder_name(self.func))
+        if self.refresh or self.revalidate:
+            MEMORY_CACHE.invalidate(self.cachefile)
+        else:
+            result = MEMORY_CACHE.get(memkey)
+            if result is not None:
+                return result
         self._retrieve()
-        with open(self.cachefile, "rb") as f:
-            data = f.read()
+        CACHE.touch(self.cachefile)
         try:
-            return data if self.func is None else self.func(data)
+            result = decode_file(self.cachefile, self.func)
         except Exception as e:
             # if network error results in bad cache, it may get raised here
             # e.g. BadZipFile("File is not a zip file")
@@ -239,12 +561,230 @@ class HttpRequest:
             except Exception:
                 pass
             raise e
+        MEMORY_CACHE.put(memkey, result)
+        return result
 
     @property
     def data(self):
         # for backward compatibility with old LazyHttpRequest class
         return self.get()
 
+    def peek(self, nbytes: int, decompress: bool = False) -> bytes:
+        """
+        Return the first bytes of the content, e.g. to read a file header.
+        They are read from the cached file if present, otherwise only as much
+        of the content is downloaded as needed, without caching it.
+
+        Parameters
+        ----------
+        nbytes: int
+            Number of bytes to read (less if the content is shorter).
+        decompress: bool, default: False
+            If True, the content is gzip-decompressed before reading.
+        """
+        if self.cached:
+            CACHE.touch(self.cachefile)
+            with (gzip.open if decompress else open)(self.cachefile, "rb") as f:
+                return f.read(nbytes)
+        r = self._open_stream({**USER_AGENT_HEADER, **self.kwargs.get("headers", {})})
+        try:
+            if not r.ok:
+                raise SiibraHttpRequestError(status_code=r.status_code, url=self.url)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if decompress else None
+            result = b""
+            for data in r.iter_content(self.MIN_BLOCK_SIZE):
+                result += data if decompressor is None else decompressor.decompress(data)
+                if len(result) >= nbytes:
+                    break
+        finally:
+            r.close()
+        return result[:nbytes]
+
+
+def prefetch(loaders: Iterable, max_workers: int = 8, desc: str = "Prefetching files") -> Dict[str, Exception]:
+    """
+    Populate the disk cache for a list of lazy loaders concurrently, so that
+    subsequent access to `loader.data` only reads from the local cache.
+
+    Loaders which do not download anything (e.g. local file loaders) or are
+    already cached are skipped.
+
+    Parameters
+    ----------
+    loaders : Iterable
+        HttpRequest-like loaders, or (filename, loader) tuples as returned
+        by RepositoryConnector.get_loaders().
+    max_workers : int, default: 8
+        Maximum number of concurrent downloads.
+    desc : str
+        Description shown in the progress bar.
+
+    Returns
+    -------
+    Dict[str, Exception]
+        The exception raised for each url that could not be retrieved.
+    """
+    pending = []
+    for item in loaders:
+        loader = item[1] if isinstance(item, tuple) else item
+        if isinstance(loader, MultiSourcedRequest):
+            loader = loader.requests[0] if len(loader.requests) > 0 else None
+        if isinstance(loader, HttpRequest) and not loader.cached:
+            pending.append(loader)
+
+    errors = {}
+    if len(pending) == 0:
+        return errors
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(loader._retrieve): loader for loader in pending}
+        for future in siibra_tqdm(
+            as_completed(futures), total=len(futures), desc=desc, unit="files"
+        ):
+            exc = future.exception()
+            if exc is not None:
+                errors[futures[future].url] = exc
+
+    if len(errors) > 0:
+        logger.warning(
+            f"Could not prefetch {len(errors)} of {len(pending)} files:\n"
+            + "\n".join(f"{url}: {str(exc)}" for url, exc in errors.items())
+        )
+    return errors
+
+
+class HttpRangeFile(RawIOBase):
+    """
+    Read-only, seekable file object for a remote file, which downloads only
+    the byte ranges that are actually read, using http Range requests.
+
+    Downloaded blocks are kept in a sparse file in the local cache, together
+    with a map of the blocks already fetched, so repeated reads of the same
+    region are served locally, also across sessions and processes.
+    Requires a server which supports Range requests.
+    """
+
+    BLOCK_SIZE = 1024**2
+
+    def __init__(self, url: str, block_size: int = None):
+        RawIOBase.__init__(self)
+        self.url = url
+        self.block_size = block_size or self.BLOCK_SIZE
+        self.datafile = CACHE.build_filename(f"{url} {self.block_size}", suffix=".ranges")
+        self.blockfile = f"{self.datafile}.blocks"
+        self._pos = 0
+        self._lock = ThreadLock()
+        CACHE.ensure_folder(self.datafile)
+        with _singleflight(self.datafile), Lock(f"{self.datafile}.lock"):
+            if not (os.path.isfile(self.blockfile) and os.path.isfile(self.datafile)):
+                self._initialize()
+        self.size = os.path.getsize(self.datafile)
+        with open(self.blockfile, "rb") as f:
+            self._blocks = bytearray(f.read())
+        CACHE.touch(self.datafile)
+
+    def _initialize(self):
+        r = POOL.head(self.url, headers=USER_AGENT_HEADER, allow_redirects=True)
+        if not r.ok:
+            raise SiibraHttpRequestError(status_code=r.status_code, url=self.url)
+        if r.headers.get("Accept-Ranges") != "bytes" or "Content-Length" not in r.headers:
+            raise SiibraHttpRequestError(
+                status_code=r.status_code,
+                url=self.url,
+                msg="Server does not support http Range requests."
+            )
+        size = int(r.headers["Content-Length"])
+        with open(self.datafile, "wb") as f:
+            f.truncate(size)  # sparse on most file systems
+        nblocks = (size + self.block_size - 1) // self.block_size
+        with open(f"{self.blockfile}_temp", "wb") as f:
+            f.write(bytes(nblocks))
+        os.rename(f"{self.blockfile}_temp", self.blockfile)
+        CACHE.register(self.datafile, url=self.url)
+        CACHE.register(self.blockfile, url=self.url)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset: int, whence: int = 0):
+        if whence == 0:
+            self._pos = offset
+        elif whence == 1:
+            self._pos += offset
+        elif whence == 2:
+            self._pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        start = min(self._pos, self.size)
+        stop = min(start + len(buffer), self.size)
+        if stop <= start:
+            return 0
+        self._fetch(start, stop)
+        with open(self.datafile, "rb") as f:
+            f.seek(start)
+            n = f.readinto(memoryview(buffer)[:stop - start])
+        self._pos = start + n
+        return n
+
+    def _missing_runs(self, first: int, last: int):
+        """Runs of consecutive blocks between first and last which are not fetched yet."""
+        runs = []
+        for b in range(first, last + 1):
+            if self._blocks[b]:
+                continue
+            if runs and runs[-1][1] == b - 1:
+                runs[-1][1] = b
+            else:
+                runs.append([b, b])
+        return runs
+
+    def _fetch(self, start: int, stop: int):
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        if not self._missing_runs(first, last):
+            return
+        with self._lock, Lock(f"{self.datafile}.lock"):
+            # other processes may have fetched some blocks meanwhile
+            with open(self.blockfile, "rb") as f:
+                self._blocks = bytearray(f.read())
+            for b0, b1 in self._missing_runs(first, last):
+                offset = b0 * self.block_size
+                end = min((b1 + 1) * self.block_size, self.size)
+                r = POOL.get(
+                    self.url,
+                    headers={**USER_AGENT_HEADER, "Range": f"bytes={offset}-{end - 1}"}
+                )
+                if r.status_code != 206:
+                    raise SiibraHttpRequestError(
+                        status_code=r.status_code,
+                        url=self.url,
+                        msg=f"Cannot read bytes {offset}-{end - 1}."
+                    )
+                if len(r.content) != end - offset:
+                    raise SiibraHttpRequestError(
+                        status_code=r.status_code,
+                        url=self.url,
+                        msg=f"Incomplete range: received {len(r.content)} of {end - offset} bytes."
+                    )
+                with open(self.datafile, "r+b") as f:
+                    f.seek(offset)
+                    f.write(r.content)
+                # mark blocks only after their data is written
+                with open(self.blockfile, "r+b") as f:
+                    f.seek(b0)
+                    f.write(b"\x01" * (b1 - b0 + 1))
+                self._blocks[b0:b1 + 1] = b"\x01" * (b1 - b0 + 1)
+            # the sparse file takes up only the space of the fetched blocks
+            CACHE.register(self.datafile)
+
 
 class ZipfileRequest(HttpRequest):
     def __init__(self, url, filename, func=None, refresh=False):
@@ -255,7 +795,15 @@ class ZipfileRequest(HttpRequest):
         self.filename = filename
 
     def get(self):
+        memkey = MEMORY_CACHE.build_key(f"{self.cachefile} {self.filename}", decoder_name(self.func))
+        if self.refresh or self.revalidate:
+            MEMORY_CACHE.invalidate(f"{self.cachefile} {self.filename}")
+        else:
+            result = MEMORY_CACHE.get(memkey)
+            if result is not None:
+                return result
         self._retrieve()
+        CACHE.touch(self.cachefile)
         zipfile = ZipFile(self.cachefile)
         filenames = zipfile.namelist()
         matches = [fn for fn in filenames if fn.endswith(self.filename)]
@@ -269,7 +817,9 @@ class ZipfileRequest(HttpRequest):
             )
         with zipfile.open(matches[0]) as f:
             data = f.read()
-        return data if self.func is None else self.func(data)
+        result = data if self.func is None else self.func(data)
+        MEMORY_CACHE.put(memkey, result)
+        return result
 
 
 class EbrainsRequest(HttpRequest):
@@ -301,7 +851,7 @@ class EbrainsRequest(HttpRequest):
 
     @classmethod
     def init_oidc(cls):
-        resp = requests.get(f"{cls._IAM_ENDPOINT}/.well-known/openid-configuration")
+        resp = POOL.get(f"{cls._IAM_ENDPOINT}/.well-known/openid-configuration")
         json_resp = resp.json()
         if "token_endpoint" in json_resp:
             logger.debug(
@@ -376,7 +926,7 @@ class EbrainsRequest(HttpRequest):
         if scope:
             data["scope"] = scope
 
-        resp = requests.post(url=cls._IAM_DEVICE_ENDPOINT, data=data)
+        resp = POOL.post(url=cls._IAM_DEVICE_ENDPOINT, data=data)
         resp.raise_for_status()
         resp_json = resp.json()
         logger.debug("device flow, request full json:", resp_json)
@@ -405,7 +955,7 @@ class EbrainsRequest(HttpRequest):
                 logger.error(message)
                 raise EbrainsAuthenticationError(message)
             attempt_number += 1
-            resp = requests.post(
+            resp = POOL.post(
                 url=cls._IAM_TOKEN_ENDPOINT,
                 data={
                     "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
@@ -452,7 +1002,7 @@ class EbrainsRequest(HttpRequest):
 
         if KEYCLOAK_CLIENT_ID is not None and KEYCLOAK_CLIENT_SECRET is not None:
             logger.info("Getting an EBRAINS token via keycloak client configuration...")
-            result = requests.post(
+            result = POOL.post(
                 self.__class__._IAM_TOKEN_ENDPOINT,
                 data=(
                     f"grant_type=client_credentials&client_id={KEYCLOAK_CLIENT_ID}"
@@ -495,10 +1045,10 @@ class EbrainsRequest(HttpRequest):
             "Authorization": f"Bearer {self.kg_token}",
         }
 
-    def get(self):
+    def _retrieve(self, *args, **kwargs):
         """Evaluate KG Token is evaluated only on execution of the request."""
         self.kwargs = {"headers": self.auth_headers, "params": self.params}
-        return super().get()
+        return super()._retrieve(*args, **kwargs)
 
 
 def try_all_connectors():
@@ -607,8 +1157,16 @@ class MultiSourcedRequest:
         self.requests = requests
 
     def get(self):
+        """
+        Return the data of the first request that succeeds. Sources on hosts
+        whose circuit breaker is open are tried last.
+        """
         exceptions = []
-        for req in self.requests:
+        available = sorted(
+            self.requests,
+            key=lambda req: isinstance(req, HttpRequest) and RETRY_POLICY.breaker(req.url).is_open
+        )
+        for req in available:
             try:
                 return req.get()
             except Exception as e:
@@ -83,10 +83,11 @@ class GiftiMesh(volume.VolumeProvider, srctype="gii-mesh"):
         for fragment_name, loader in self._loaders.items():
             if fragment and fragment.lower() not in fragment_name.lower():
                 continue
-            assert len(loader.data.darrays) > 1
+            gii = loader.data
+            assert len(gii.darrays) > 1
             meshes.append({
-                "verts": loader.data.darrays[0].data,
-                "faces": loader.data.darrays[1].data
+                "verts": gii.darrays[0].data,
+                "faces": gii.darrays[1].data
             })
             fragments_included.append(fragment_name)
 
@@ -137,8 +138,9 @@ class GiftiSurfaceLabeling(volume.VolumeProvider, srctype="gii-label"):
         for fragment_name, loader in self._loaders.items():
             if fragment is not None and fragment.lower() not in fragment_name.lower():
                 continue
-            assert len(loader.data.darrays) == 1
-            labels.append(loader.data.darrays[0].data)
+            gii = loader.data
+            assert len(gii.darrays) == 1
+            labels.append(gii.darrays[0].data)
 
         return {"labels": np.hstack(labels)}
 
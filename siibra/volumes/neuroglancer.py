@@ -16,17 +16,27 @@
 from . import volume
 
 from ..commons import logger, MapType, merge_meshes
-from ..retrieval import requests, cache
+from ..retrieval import requests, cache, connections
 from ..locations import boundingbox as _boundingbox
 
-from neuroglancer_scripts.precomputed_io import get_IO_for_existing_dataset
+from neuroglancer_scripts.precomputed_io import get_IO_for_existing_dataset, PrecomputedIO
 from neuroglancer_scripts.accessor import get_accessor_for_url
+from neuroglancer_scripts.http_accessor import HttpAccessor
+from neuroglancer_scripts.sharded_http_accessor import ShardedHttpAccessor
 from neuroglancer_scripts.mesh import read_precomputed_mesh, affine_transform_mesh
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock as ThreadLock
+from zipfile import ZipFile, ZIP_STORED
 import nibabel as nib
+import json
+import mmap
 import os
+import shutil
+import struct
+import zlib
 import numpy as np
-from typing import Union, Dict, Tuple
+from typing import Union, Dict, Tuple, List
 
 
 class NeuroglancerProvider(volume.VolumeProvider, srctype="neuroglancer/precomputed"):
@@ -66,41 +76,21 @@ class NeuroglancerProvider(volume.VolumeProvider, srctype="neuroglancer/precompu
             Specify the resolution
         voi: BoundingBox
             optional specification of a volume of interest to fetch.
+        memmap: bool or str, default: False
+            Assemble the image in a memory-mapped NIfTI file, in the siibra
+            cache if True or at the given '.nii' path, instead of in memory.
+            The resolution is then not reduced to stay below MAX_GiB.
         """
 
-        result = None
-
         if 'index' in kwargs:
             index = kwargs.pop('index')
             if fragment is not None:
                 assert fragment == index.fragment
             fragment = index.fragment
 
-        if len(self._fragments) > 1:
-            if fragment is None:
-                raise RuntimeError(
-                    f"Merging of fragments not yet implemented in {self.__class__.__name__}. "
-                    f"Specify one of [{', '.join(self._fragments.keys())}] using fetch(fragment=<name>). "
-                )
-            else:
-                matched_names = [n for n in self._fragments if fragment.lower() in n.lower()]
-                if len(matched_names) != 1:
-                    raise ValueError(
-                        f"Requested fragment '{fragment}' could not be matched uniquely "
-                        f"to [{', '.join(self._fragments)}]"
-                    )
-                else:
-                    result = self._fragments[matched_names[0]].fetch(
-                        resolution_mm=resolution_mm, voi=voi, **kwargs
-                    )
-        else:
-            assert len(self._fragments) > 0
-            fragment_name, ngvol = next(iter(self._fragments.items()))
-            if fragment is not None:
-                assert fragment.lower() in fragment_name.lower()
-            result = ngvol.fetch(
-                resolution_mm=resolution_mm, voi=voi, **kwargs
-            )
+        result = self._select_fragment(fragment).fetch(
+            resolution_mm=resolution_mm, voi=voi, **kwargs
+        )
 
         # if a label is specified, mask the resulting image.
         if result is not None:
@@ -118,6 +108,76 @@ class NeuroglancerProvider(volume.VolumeProvider, srctype="neuroglancer/precompu
 
         return result
 
+    def _select_fragment(self, fragment: str = None) -> "NeuroglancerVolume":
+        if len(self._fragments) > 1:
+            if fragment is None:
+                raise RuntimeError(
+                    f"Merging of fragments not yet implemented in {self.__class__.__name__}. "
+                    f"Specify one of [{', '.join(self._fragments.keys())}] using fetch(fragment=<name>). "
+                )
+            matched_names = [n for n in self._fragments if fragment.lower() in n.lower()]
+            if len(matched_names) != 1:
+                raise ValueError(
+                    f"Requested fragment '{fragment}' could not be matched uniquely "
+                    f"to [{', '.join(self._fragments)}]"
+                )
+            return self._fragments[matched_names[0]]
+        assert len(self._fragments) > 0
+        fragment_name, ngvol = next(iter(self._fragments.items()))
+        if fragment is not None:
+            assert fragment.lower() in fragment_name.lower()
+        return ngvol
+
+    def get_array(self, fragment: str = None, resolution_mm: float = None) -> "NeuroglancerArray":
+        """
+        Lazy array view of a fragment volume, reading chunks on access.
+        See NeuroglancerVolume.get_array().
+        """
+        return self._select_fragment(fragment).get_array(resolution_mm=resolution_mm)
+
+    def read_points(self, xyz_mm: np.ndarray, fragment: str = None, **kwargs) -> np.ndarray:
+        """
+        Read the values of the image at the given physical coordinates
+        (N x 3 array) at full resolution, loading only the chunks which
+        contain them. If a label is specified, the values of the label
+        mask are returned, as in fetch().
+        """
+        if 'index' in kwargs:
+            index = kwargs.pop('index')
+            if fragment is not None:
+                assert fragment == index.fragment
+            fragment = index.fragment
+            kwargs.setdefault('label', index.label)
+        values = self._select_fragment(fragment).read_points(xyz_mm)
+        if kwargs.get('label') is not None:
+            values = (values == kwargs['label']).astype('uint8')
+        return values
+
+    def get_metadata(
+        self,
+        fragment: str = None,
+        resolution_mm: float = None,
+        voi: _boundingbox.BoundingBox = None,
+        **kwargs
+    ) -> volume.VolumeMetadata:
+        """
+        Shape, affine and data type of the image returned by fetch() with the
+        same arguments, determined from the info file without loading chunks.
+        """
+        if voi is not None:
+            return volume.VolumeProvider.get_metadata(
+                self, fragment=fragment, resolution_mm=resolution_mm, voi=voi, **kwargs
+            )
+        if 'index' in kwargs:
+            index = kwargs['index']
+            if fragment is not None:
+                assert fragment == index.fragment
+            fragment = index.fragment
+        result = self._select_fragment(fragment).get_metadata(resolution_mm=resolution_mm)
+        if kwargs.get('label') is not None:
+            result = volume.VolumeMetadata(result.shape, result.affine, np.dtype('uint8'))
+        return result
+
     @property
     def boundingbox(self):
         """
@@ -167,14 +227,49 @@ class NeuroglancerProvider(volume.VolumeProvider, srctype="neuroglancer/precompu
         return result
 
 
+class PooledHttpAccessor(HttpAccessor):
+    """
+    Reads a neuroglancer precomputed dataset over http through siibra's
+    shared connection pool, so that chunk downloads apply the retry policy
+    and circuit breakers of all other siibra requests.
+    """
+
+    def __init__(self, base_url: str):
+        HttpAccessor.__init__(self, base_url)
+        # the pool provides the get and head methods of a requests.Session
+        self._session = connections.POOL
+
+
+class PooledShardedHttpAccessor(ShardedHttpAccessor, PooledHttpAccessor):
+    """
+    Reads a sharded neuroglancer precomputed dataset over http through
+    siibra's shared connection pool. Takes the already known info file.
+    """
+
+    def __init__(self, base_url: str, info: dict):
+        PooledHttpAccessor.__init__(self, base_url)
+        self.shard_scale_dict = {}
+        self.info = info
+
+
+def pooled_http_accessor(base_url: str, info: dict) -> HttpAccessor:
+    """ Pooled http accessor matching the layout of the dataset. """
+    if PooledShardedHttpAccessor.info_is_sharded(info):
+        return PooledShardedHttpAccessor(base_url, info)
+    return PooledHttpAccessor(base_url)
+
+
 class NeuroglancerVolume:
 
     # Number of bytes at which an image array is considered to large to fetch
     MAX_GiB = 0.2
 
-    # Wether to keep fetched data in local cache
+    # Wether to keep fetched chunks in compressed shard files in the local cache
     USE_CACHE = False
 
+    # Number of chunks to download and decode concurrently when fetching
+    MAX_WORKERS = 8
+
     @property
     def MAX_BYTES(self):
         return self.MAX_GiB * 1024 ** 3
@@ -226,8 +321,13 @@ class NeuroglancerVolume:
             )
 
     def _bootstrap(self):
-        accessor = get_accessor_for_url(self.url)
-        self._io = get_IO_for_existing_dataset(accessor)
+        if self.url.startswith("http"):
+            # keep the info file in the local cache, so that geometry and
+            # data type are known without contacting the server again
+            info = requests.HttpRequest(f"{self.url}/info", func=requests.DECODERS['.json']).data
+            self._io = PrecomputedIO(info, pooled_http_accessor(self.url, info))
+        else:
+            self._io = get_IO_for_existing_dataset(get_accessor_for_url(self.url))
         self._scales_cached = sorted(
             [NeuroglancerScale(self, i) for i in self._io.info["scales"]]
         )
@@ -254,19 +354,52 @@ class NeuroglancerVolume:
         # return the affine matrix of the scale 0 data
         return self.scales[0].affine
 
-    def fetch(self, resolution_mm: float = None, voi: _boundingbox.BoundingBox = None, **kwargs):
+    def fetch(
+        self,
+        resolution_mm: float = None,
+        voi: _boundingbox.BoundingBox = None,
+        memmap: Union[bool, str] = False,
+        **kwargs
+    ):
         # the caller has to make sure voi is defined in the correct reference space
-        scale = self._select_scale(resolution_mm=resolution_mm, bbox=voi)
-        return scale.fetch(voi)
+        if memmap:
+            # the output is not kept in memory, so its size is not limited
+            scale = self._select_scale(resolution_mm=resolution_mm, bbox=voi, max_bytes=np.inf)
+        else:
+            scale = self._select_scale(resolution_mm=resolution_mm, bbox=voi)
+        return scale.fetch(voi, memmap=memmap)
+
+    def get_array(self, resolution_mm: float = None) -> "NeuroglancerArray":
+        """
+        Lazy array view of the scale matching the given resolution, which
+        reads chunks on access. Defaults to the full resolution scale.
+        Unlike fetch(), the scale is not reduced to stay below MAX_GiB.
+        """
+        if resolution_mm is None:
+            return NeuroglancerArray(self.scales[0])
+        suitable = sorted(s for s in self.scales if s.resolves(resolution_mm))
+        return NeuroglancerArray(suitable[-1] if len(suitable) > 0 else self.scales[0])
+
+    def read_points(self, xyz_mm: np.ndarray) -> np.ndarray:
+        """Values at the given physical coordinates, read from the full resolution scale."""
+        return self.scales[0].read_points(xyz_mm)
 
     def get_shape(self, resolution_mm=None):
         scale = self._select_scale(resolution_mm)
         return scale.size
 
+    def get_metadata(self, resolution_mm: float = None) -> volume.VolumeMetadata:
+        """Shape, affine and data type of the image returned by fetch(resolution_mm)."""
+        scale = self._select_scale(resolution_mm=resolution_mm)
+        trans = np.identity(4)[[2, 1, 0, 3], :]  # zyx -> xyz, as in NeuroglancerScale.fetch()
+        return volume.VolumeMetadata(
+            tuple(int(v) for v in scale.size[::-1]), np.dot(scale.affine, trans), self.dtype
+        )
+
     def is_float(self):
         return self.dtype.kind == "f"
 
-    def _select_scale(self, resolution_mm: float, bbox: _boundingbox.BoundingBox = None):
+    def _select_scale(self, resolution_mm: float, bbox: _boundingbox.BoundingBox = None, max_bytes: float = None):
         if resolution_mm is None:
             suitable = self.scales
         elif resolution_mm < 0:
@@ -284,14 +417,16 @@ class NeuroglancerVolume:
                 f"{', '.join(map('{:.2f}'.format, scale.res_mm))} mm."
             )
 
+        if max_bytes is None:
+            max_bytes = self.MAX_BYTES
         scale_changed = False
-        while scale._estimate_nbytes(bbox) > self.MAX_BYTES:
+        while scale._estimate_nbytes(bbox) > max_bytes:
             scale = scale.next()
             scale_changed = True
             if scale is None:
                 raise RuntimeError(
                     f"Fetching bounding box {bbox} is infeasible "
-                    f"relative to the limit of {self.MAX_BYTES/1024**3}GiB."
+                    f"relative to the limit of {max_bytes/1024**3}GiB."
                 )
         if scale_changed:
             logger.warning(f"Resolution was reduced to {scale.res_mm} to provide a feasible volume size")
@@ -311,6 +446,7 @@ class NeuroglancerScale:
         self.res_nm = np.array(scaleinfo["resolution"]).squeeze()
         self.size = scaleinfo["size"]
         self.voxel_offset = np.array(scaleinfo["voxel_offset"])
+        self.chunkstore = NeuroglancerChunkStore(volume.url, self.key)
 
     @property
     def res_mm(self):
@@ -347,7 +483,7 @@ class NeuroglancerScale:
     def next(self):
         """Returns the next scale in this volume, of None if this is the last."""
         my_index = self.volume.scales.index(self)
-        if my_index < len(self.volume.scales):
+        if my_index + 1 < len(self.volume.scales):
             return self.volume.scales[my_index + 1]
         else:
             return None
@@ -363,40 +499,56 @@ class NeuroglancerScale:
 
     @property
     def affine(self):
+        """
+        Affine matrix from the voxel indices of the data of this scale to
+        physical coordinates. The data starts at voxel_offset in the voxel
+        space of the volume, so that index 0 maps to the voxel offset.
+        """
         scaling = np.diag(np.r_[self.res_nm, 1.0])
-        affine = np.dot(self.volume.transform_nm, scaling)
+        translation = np.c_[np.identity(4)[:, :3], np.r_[self.voxel_offset, 1]]
+        affine = np.dot(self.volume.transform_nm, np.dot(scaling, translation))
         affine[:3, :] /= 1e6
         return affine
 
     def _point_to_lower_chunk_idx(self, xyz):
         return (
-            np.floor((np.array(xyz) - self.voxel_offset) / self.chunk_sizes)
+            np.floor(np.array(xyz) / self.chunk_sizes)
             .astype("int")
             .ravel()
         )
 
     def _point_to_upper_chunk_idx(self, xyz):
         return (
-            np.ceil((np.array(xyz) - self.voxel_offset) / self.chunk_sizes)
+            np.ceil(np.array(xyz) / self.chunk_sizes)
             .astype("int")
             .ravel()
         )
 
+    def export_chunks(self, filename: str) -> int:
+        """
+        Export the chunks of this scale kept in the local chunk store
+        (see NeuroglancerVolume.USE_CACHE) to a portable bundle file.
+        """
+        grid_size = np.ceil(np.array(self.size) / self.chunk_sizes).astype("int")
+        return self.chunkstore.export(filename, tuple(grid_size))
+
     def _read_chunk(self, gx, gy, gz):
         if any(v < 0 for v in (gx, gy, gz)):
             raise RuntimeError('Negative tile index observed - you have likely requested fetch() with a voi specification ranging outside the actual data.')
-        if self.volume.USE_CACHE:
-            cachefile = cache.CACHE.build_filename(
-                "{}_{}_{}_{}_{}".format(self.volume.url, self.key, gx, gy, gz),
-                suffix=".npy",
-            )
-            if os.path.isfile(cachefile):
-                return np.load(cachefile)
+        memkey = (self.volume.url, self.key, gx, gy, gz)
+        chunk_zyx = cache.CHUNK_CACHE.get(memkey)
+        if chunk_zyx is not None:
+            return chunk_zyx
 
-        x0 = gx * self.chunk_sizes[0]
-        y0 = gy * self.chunk_sizes[1]
-        z0 = gz * self.chunk_sizes[2]
-        x1, y1, z1 = np.minimum(self.chunk_sizes + [x0, y0, z0], self.size)
+        if self.volume.USE_CACHE:
+            chunk_zyx = self.chunkstore.get(gx, gy, gz)
+            if chunk_zyx is not None:
+                cache.CHUNK_CACHE.put(memkey, chunk_zyx)
+                return chunk_zyx
+
+        # chunks are named by their position in the voxel space of the volume
+        x0, y0, z0 = (int(v) for v in np.array([gx, gy, gz]) * self.chunk_sizes + self.voxel_offset)
+        x1, y1, z1 = (int(v) for v in np.minimum(self.chunk_sizes + [x0, y0, z0], self.voxel_offset + self.size))
         chunk_czyx = self.volume._io.read_chunk(self.key, (x0, x1, y0, y1, z0, z1))
         if not chunk_czyx.shape[0] == 1 and not self.color_warning_issued:
             logger.warning(
@@ -406,10 +558,148 @@ class NeuroglancerScale:
         chunk_zyx = chunk_czyx[0]
 
         if self.volume.USE_CACHE:
-            np.save(cachefile, chunk_zyx)
+            self.chunkstore.put(gx, gy, gz, chunk_zyx)
+        # cached chunks are shared between fetches, so protect them from changes
+        chunk_zyx.flags.writeable = False
+        cache.CHUNK_CACHE.put(memkey, chunk_zyx)
         return chunk_zyx
 
-    def fetch(self, voi: _boundingbox.BoundingBox = None, **kwargs):
+    def _map_chunks(self, func, grid: List[Tuple[int, int, int]]):
+        """Call func(gx, gy, gz) for the given chunk indices on a bounded thread pool."""
+        workers = min(self.volume.MAX_WORKERS, len(grid))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # consume the results to propagate exceptions from the workers
+                for _ in executor.map(lambda g: func(*g), grid):
+                    pass
+        else:
+            for g in grid:
+                func(*g)
+
+    def read_points(self, xyz_mm: np.ndarray) -> np.ndarray:
+        """
+        Read the voxel values at the given physical coordinates (N x 3 array),
+        loading only the chunks which contain them. Coordinates outside the
+        volume read as zero.
+        """
+        xyz_mm = np.asarray(xyz_mm, dtype="float").reshape(-1, 3)
+        ijk = np.floor(
+            np.dot(np.linalg.inv(self.affine), np.c_[xyz_mm, np.ones(len(xyz_mm))].T)[:3].T + 0.5
+        ).astype("int")
+        values = np.zeros(len(ijk), dtype=self.volume.dtype)
+        inside = np.all((ijk >= 0) & (ijk < self.size), axis=1)
+        if not inside.any():
+            return values
+        grid = np.floor(ijk[inside] / self.chunk_sizes).astype("int")
+
+        # group the points by the chunk containing them
+        chunks, chunk_index = np.unique(grid, axis=0, return_inverse=True)
+        chunk_index = chunk_index.ravel()
+        groups = np.split(
+            np.flatnonzero(inside)[np.argsort(chunk_index, kind="stable")],
+            np.cumsum(np.bincount(chunk_index))[:-1]
+        )
+        points = {tuple(int(g) for g in c): p for c, p in zip(chunks, groups)}
+
+        def read(gx, gy, gz):
+            chunk = self._read_chunk(gx, gy, gz)
+            p = points[gx, gy, gz]
+            x, y, z = (ijk[p] - np.array([gx, gy, gz]) * self.chunk_sizes).T
+            values[p] = chunk[z, y, x]
+
+        self._map_chunks(read, list(points))
+        return values
+
+    def _read_region(self, lower: np.ndarray, upper: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Read the voxels from lower (inclusive) to upper (exclusive) along
+        x, y and z, assembled from the chunks covering them. Returns a
+        zyx-ordered array, which is the given zero-initialized output
+        array if any.
+        """
+        lower, upper = np.array(lower, dtype="int"), np.array(upper, dtype="int")
+        if out is None:
+            data_zyx = np.zeros(np.maximum(upper - lower, 0)[::-1], dtype=self.volume.dtype)
+        else:
+            assert out.shape == tuple(np.maximum(upper - lower, 0)[::-1])
+            data_zyx = out
+        if np.any(upper <= lower):
+            return data_zyx
+
+        gx0, gy0, gz0 = self._point_to_lower_chunk_idx(tuple(lower))
+        gx1, gy1, gz1 = self._point_to_upper_chunk_idx(tuple(upper))
+        grid = [
+            (gx, gy, gz)
+            for gx in range(gx0, gx1)
+            for gy in range(gy0, gy1)
+            for gz in range(gz0, gz1)
+        ]
+
+        def fill(gx, gy, gz):
+            chunk = self._read_chunk(gx, gy, gz)
+            origin = np.array([gx, gy, gz]) * self.chunk_sizes
+            # intersection of the chunk with the region
+            lo = np.maximum(origin, lower)
+            hi = np.minimum(origin + chunk.shape[::-1], upper)
+            if np.any(hi <= lo):
+                return
+            (x0, y0, z0), (x1, y1, z1) = lo - origin, hi - origin
+            (X0, Y0, Z0), (X1, Y1, Z1) = lo - lower, hi - lower
+            # chunks do not overlap, so workers can write without locking
+            data_zyx[Z0:Z1, Y0:Y1, X0:X1] = chunk[z0:z1, y0:y1, x0:x1]
+
+        self._map_chunks(fill, grid)
+        return data_zyx
+
+    def _fetch_to_file(self, lower: np.ndarray, upper: np.ndarray, affine: np.ndarray, filename: str) -> nib.Nifti1Image:
+        """
+        Write the voxels from lower to upper into a NIfTI file, assembling the
+        chunks directly in a memory map of the file, and return the image
+        memory-mapped from the file. The file is written under a temporary
+        name and renamed when complete.
+        """
+        header = nib.Nifti1Header()
+        header.set_data_dtype(self.volume.dtype)
+        header.set_data_shape(tuple(int(v) for v in upper - lower))
+        header.set_sform(affine, code="aligned")
+        header.set_qform(affine, code="aligned")
+        header.set_data_offset(352)  # header and empty extension flag
+        temp_filename = f"{filename}_temp"
+        with open(temp_filename, "wb") as f:
+            header.write_to(f)
+            f.write(bytes(4))
+            f.truncate(352 + int(np.prod(upper - lower)) * header.get_data_dtype().itemsize)
+        # NIfTI stores x as the fastest changing axis, i.e. zyx in C order
+        data_zyx = np.memmap(
+            temp_filename, dtype=header.get_data_dtype(), mode="r+",
+            offset=352, shape=tuple(int(v) for v in (upper - lower)[::-1])
+        )
+        self._read_region(lower, upper, out=data_zyx)
+        data_zyx.flush()
+        del data_zyx
+        os.replace(temp_filename, filename)
+        return nib.load(filename, mmap=True)
+
+    def fetch(self, voi: _boundingbox.BoundingBox = None, memmap: Union[bool, str] = False, **kwargs):
+        """
+        Fetch the given volume of interest, or the whole scale.
+
+        Parameters
+        ----------
+        voi: BoundingBox, default: None
+            Volume of interest in physical coordinates.
+        memmap: bool or str, default: False
+            Write the output into a NIfTI file and return the image memory-mapped
+            from it, instead of assembling it in memory. If True, the file is
+            kept in the siibra cache, otherwise memmap is the path of the file,
+            which must end with '.nii'. The memory-mapped image is stored in
+            xyz order, with the same physical geometry as the in-memory result.
+        """
+        if isinstance(memmap, str) and not memmap.endswith(".nii"):
+            raise ValueError(
+                f"Memory-mapped images are written as uncompressed NIfTI files, "
+                f"so the filename needs to end with '.nii': {memmap}"
+            )
 
         # define the bounding box in this scale's voxel space
         if voi is None:
@@ -424,39 +714,322 @@ class NeuroglancerScale:
                 )
                 bbox_.maxpoint[dim] = bbox_.maxpoint[dim] + 1
 
-        # extract minimum and maximum the chunk indices to be loaded
-        gx0, gy0, gz0 = self._point_to_lower_chunk_idx(tuple(bbox_.minpoint))
-        gx1, gy1, gz1 = self._point_to_upper_chunk_idx(tuple(bbox_.maxpoint))
-
-        # create requested data volume, and fill it with the required chunk data
-        shape_zyx = np.array([gz1 - gz0, gy1 - gy0, gx1 - gx0]) * self.chunk_sizes[::-1]
-        data_zyx = np.zeros(shape_zyx, dtype=self.volume.dtype)
-        for gx in range(gx0, gx1):
-            x0 = (gx - gx0) * self.chunk_sizes[0]
-            for gy in range(gy0, gy1):
-                y0 = (gy - gy0) * self.chunk_sizes[1]
-                for gz in range(gz0, gz1):
-                    z0 = (gz - gz0) * self.chunk_sizes[2]
-                    chunk = self._read_chunk(gx, gy, gz)
-                    z1, y1, x1 = np.array([z0, y0, x0]) + chunk.shape
-                    data_zyx[z0:z1, y0:y1, x0:x1] = chunk
-
-        # determine the remaining offset from the "chunk mosaic" to the
-        # exact bounding box requested, to cut off undesired borders
-        data_min = np.array([gx0, gy0, gz0]) * self.chunk_sizes
-        x0, y0, z0 = (np.array(tuple(bbox_.minpoint)) - data_min).astype("int")
-        xd, yd, zd = np.array(bbox_.shape).astype("int")
+        # read the voxels of the requested bounding box from the chunks covering it
+        lower = np.floor(np.array(tuple(bbox_.minpoint))).astype("int")
+        upper = lower + np.array(bbox_.shape).astype("int")
         offset = tuple(bbox_.minpoint)
+        shift = np.c_[np.identity(4)[:, :3], np.r_[offset, 1]]
+
+        if memmap is True:
+            filename = cache.CACHE.build_filename(
+                f"{self.volume.url} {self.key} {tuple(lower)} {tuple(upper)} {offset}", suffix=".nii"
+            )
+            cache.CACHE.ensure_folder(filename)
+            with requests.Lock(f"{filename}.lock"):
+                if os.path.isfile(filename):
+                    cache.CACHE.touch(filename)
+                    return nib.load(filename, mmap=True)
+                img = self._fetch_to_file(lower, upper, np.dot(self.affine, shift), filename)
+            cache.CACHE.register(filename, url=self.volume.url)
+            return img
+        if memmap:
+            return self._fetch_to_file(lower, upper, np.dot(self.affine, shift), memmap)
+
+        data_zyx = self._read_region(lower, upper)
 
         # build the nifti image
         trans = np.identity(4)[[2, 1, 0, 3], :]  # zyx -> xyz
-        shift = np.c_[np.identity(4)[:, :3], np.r_[offset, 1]]
         return nib.Nifti1Image(
-            data_zyx[z0: z0 + zd, y0: y0 + yd, x0: x0 + xd],
+            data_zyx,
             np.dot(self.affine, np.dot(shift, trans)),
         )
 
 
+class NeuroglancerArray:
+    """
+    Lazy, numpy-like array view of one scale of a neuroglancer volume, in xyz
+    voxel order. Indexing with integers and slices reads only the chunks
+    covering the selection, without the size limit of fetch(). Volumes too
+    large for memory can be processed block by block with iter_blocks().
+    """
+
+    ndim = 3
+
+    def __init__(self, scale: "NeuroglancerScale"):
+        self.scale = scale
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return tuple(int(v) for v in self.scale.size)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.scale.volume.dtype
+
+    @property
+    def affine(self) -> np.ndarray:
+        """Affine matrix from the voxel indices of this array to physical coordinates."""
+        return self.scale.affine
+
+    @property
+    def chunk_shape(self) -> Tuple[int, int, int]:
+        return tuple(int(v) for v in self.scale.chunk_sizes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.shape} {self.dtype} of {self.scale.volume.url} {self.scale.key}>"
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key, )
+        ellipsis = [i for i, k in enumerate(key) if k is Ellipsis]
+        if len(ellipsis) > 1:
+            raise IndexError("An index can only have a single ellipsis ('...')")
+        if ellipsis:
+            i = ellipsis[0]
+            key = key[:i] + (slice(None), ) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"Too many indices for {self.__class__.__name__} of dimension {self.ndim}")
+        key = key + (slice(None), ) * (self.ndim - len(key))
+
+        indices, squeeze = [], []
+        for axis, (k, n) in enumerate(zip(key, self.shape)):
+            if isinstance(k, (int, np.integer)):
+                i = int(k) + n if k < 0 else int(k)
+                if not 0 <= i < n:
+                    raise IndexError(f"Index {k} is out of bounds for axis {axis} with size {n}")
+                indices.append(np.array([i]))
+                squeeze.append(axis)
+            elif isinstance(k, slice):
+                indices.append(np.arange(*k.indices(n)))
+            else:
+                raise TypeError(
+                    f"{self.__class__.__name__} supports integers, slices and ellipsis "
+                    f"as indices, not {k.__class__.__name__}."
+                )
+
+        if any(len(i) == 0 for i in indices):
+            data = np.zeros([len(i) for i in indices], dtype=self.dtype)
+        else:
+            lower = [i.min() for i in indices]
+            upper = [i.max() + 1 for i in indices]
+            data = self.scale._read_region(lower, upper).T
+            if not all(np.array_equal(i, np.arange(lo, up)) for i, lo, up in zip(indices, lower, upper)):
+                # steps other than 1
+                data = data[np.ix_(*(i - lo for i, lo in zip(indices, lower)))]
+        return data.squeeze(axis=tuple(squeeze)) if squeeze else data
+
+    def iter_blocks(self, block_shape: Tuple[int, int, int] = None):
+        """
+        Iterate the array in blocks aligned to the chunk grid, so that every
+        chunk is read exactly once.
+
+        Parameters
+        ----------
+        block_shape: Tuple[int, int, int], default: None
+            Requested block shape along x, y and z, rounded up to multiples of
+            the chunk shape. Defaults to the chunk shape.
+
+        Yields
+        ------
+        Tuple[Tuple[slice, slice, slice], np.ndarray]
+            The position of each block in the array and its voxel data.
+        """
+        chunk_shape = np.array(self.chunk_shape)
+        if block_shape is None:
+            block_shape = chunk_shape
+        else:
+            block_shape = np.ceil(np.array(block_shape) / chunk_shape).astype("int") * chunk_shape
+        for x in range(0, self.shape[0], block_shape[0]):
+            for y in range(0, self.shape[1], block_shape[1]):
+                for z in range(0, self.shape[2], block_shape[2]):
+                    block = tuple(
+                        slice(lo, min(lo + d, n))
+                        for lo, d, n in zip((x, y, z), block_shape, self.shape)
+                    )
+                    yield block, self[block]
+
+
+class NeuroglancerChunkStore:
+    """
+    Local store for the decoded chunks of one scale of a neuroglancer volume.
+
+    Chunks are packed into shard files of SHARD_SIZE^3 neighbouring chunks in
+    the siibra cache. Each shard file starts with a header and an index of the
+    offset, length and shape of every chunk, followed by the zlib-compressed
+    chunk data. Single chunks are read by memory-mapped random access, and
+    the shards of a scale can be exported to a portable bundle.
+    """
+
+    SHARD_SIZE = 8
+    COMPRESSION_LEVEL = 3
+
+    # magic, shard size, data type
+    HEADER = struct.Struct("<8sI4x16s")
+    # offset, number of bytes, and z/y/x shape of a chunk
+    ENTRY = struct.Struct("<QQIII4x")
+    MAGIC = b"SIIBRACS"
+
+    def __init__(self, url: str, key: str):
+        self.url = url
+        self.key = key
+        self._lock = ThreadLock()
+
+    @property
+    def index_offset(self):
+        return self.HEADER.size
+
+    @property
+    def data_offset(self):
+        return self.HEADER.size + self.SHARD_SIZE**3 * self.ENTRY.size
+
+    def shard(self, gx: int, gy: int, gz: int) -> Tuple[int, int, int]:
+        """Grid index of the shard containing the given chunk."""
+        return tuple(int(g) // self.SHARD_SIZE for g in (gx, gy, gz))
+
+    def shardfile(self, sx: int, sy: int, sz: int) -> str:
+        return cache.CACHE.build_filename(
+            f"{self.url} {self.key} {sx}_{sy}_{sz} {self.SHARD_SIZE}", suffix=".shard"
+        )
+
+    def _entry_position(self, gx: int, gy: int, gz: int) -> int:
+        n = self.SHARD_SIZE
+        slot = ((int(gx) % n) * n + int(gy) % n) * n + int(gz) % n
+        return self.index_offset + slot * self.ENTRY.size
+
+    def _read_header(self, buffer) -> np.dtype:
+        """Data type of a valid shard, or None if the buffer holds no valid shard."""
+        if len(buffer) < self.data_offset:
+            return None
+        magic, shard_size, dtype = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC or shard_size != self.SHARD_SIZE:
+            return None
+        return np.dtype(dtype.rstrip(b"\0").decode())
+
+    def get(self, gx: int, gy: int, gz: int) -> np.ndarray:
+        """Return the chunk as a read-only zyx array, or None if not stored."""
+        filename = self.shardfile(*self.shard(gx, gy, gz))
+        if not os.path.isfile(filename) or os.path.getsize(filename) == 0:
+            return None
+        with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            dtype = self._read_header(buffer)
+            if dtype is None:
+                return None
+            offset, nbytes, *shape = self.ENTRY.unpack_from(buffer, self._entry_position(gx, gy, gz))
+            if nbytes == 0 or offset + nbytes > len(buffer):
+                return None
+            try:
+                data = zlib.decompress(buffer[offset:offset + nbytes])
+            except zlib.error:
+                # chunk is being overwritten by another process
+                return None
+        cache.CACHE.touch(filename)
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    def put(self, gx: int, gy: int, gz: int, chunk_zyx: np.ndarray):
+        """
+        Store the chunk in its shard file. A chunk which is already stored is
+        overwritten in place if the new data fits, and appended otherwise.
+        """
+        filename = self.shardfile(*self.shard(gx, gy, gz))
+        blob = zlib.compress(np.ascontiguousarray(chunk_zyx).tobytes(), self.COMPRESSION_LEVEL)
+        cache.CACHE.ensure_folder(filename)
+        with self._lock, requests.Lock(f"{filename}.lock"):
+            with open(filename, "a+b") as f:
+                f.seek(0)
+                header = f.read(self.data_offset)
+                dtype = self._read_header(header)
+            if dtype is None:
+                # new or invalid shard
+                dtype = chunk_zyx.dtype
+                with open(filename, "wb") as f:
+                    f.write(self.HEADER.pack(self.MAGIC, self.SHARD_SIZE, dtype.str.encode()))
+                    f.write(bytes(self.data_offset - self.HEADER.size))
+            elif dtype != chunk_zyx.dtype:
+                blob = zlib.compress(
+                    np.ascontiguousarray(chunk_zyx, dtype=dtype).tobytes(), self.COMPRESSION_LEVEL
+                )
+            with open(filename, "r+b") as f:
+                f.seek(self._entry_position(gx, gy, gz))
+                offset, nbytes, *_ = self.ENTRY.unpack(f.read(self.ENTRY.size))
+                if nbytes == 0 or nbytes < len(blob):
+                    offset = f.seek(0, os.SEEK_END)
+                else:
+                    f.seek(offset)
+                f.write(blob)
+                f.flush()
+                # write the index entry last, so that readers never see partial data
+                f.seek(self._entry_position(gx, gy, gz))
+                f.write(self.ENTRY.pack(offset, len(blob), *chunk_zyx.shape))
+        cache.CACHE.register(filename, url=self.url)
+
+    def export(self, filename: str, grid_size: Tuple[int, int, int]):
+        """
+        Write all stored shards of this scale into a single zip bundle,
+        to be imported by NeuroglancerChunkStore.import_bundle() elsewhere.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the bundle file to be written.
+        grid_size : Tuple[int, int, int]
+            Number of chunks along x, y and z of the scale.
+
+        Returns
+        -------
+        int
+            The number of exported shards.
+        """
+        shards = [
+            (sx, sy, sz)
+            for sx in range(-(-grid_size[0] // self.SHARD_SIZE))
+            for sy in range(-(-grid_size[1] // self.SHARD_SIZE))
+            for sz in range(-(-grid_size[2] // self.SHARD_SIZE))
+        ]
+        manifest = {"url": self.url, "key": self.key, "shard_size": self.SHARD_SIZE, "shards": []}
+        # chunks are compressed already
+        with ZipFile(filename, "w", compression=ZIP_STORED) as bundle:
+            for sx, sy, sz in shards:
+                shardfile = self.shardfile(sx, sy, sz)
+                if not os.path.isfile(shardfile):
+                    continue
+                with requests.Lock(f"{shardfile}.lock"):
+                    bundle.write(shardfile, arcname=f"{sx}_{sy}_{sz}.shard")
+                manifest["shards"].append([sx, sy, sz])
+            bundle.writestr("manifest.json", json.dumps(manifest))
+        return len(manifest["shards"])
+
+    @classmethod
+    def import_bundle(cls, filename: str) -> "NeuroglancerChunkStore":
+        """Copy the shards of a bundle written by export() into the local cache."""
+        with ZipFile(filename) as bundle:
+            manifest = json.loads(bundle.read("manifest.json"))
+            store = cls(manifest["url"], manifest["key"])
+            if manifest["shard_size"] != store.SHARD_SIZE:
+                raise ValueError(
+                    f"Bundle {filename} uses shards of {manifest['shard_size']}^3 chunks, "
+                    f"expected {store.SHARD_SIZE}^3."
+                )
+            for sx, sy, sz in manifest["shards"]:
+                shardfile = store.shardfile(sx, sy, sz)
+                cache.CACHE.ensure_folder(shardfile)
+                with store._lock, requests.Lock(f"{shardfile}.lock"):
+                    with bundle.open(f"{sx}_{sy}_{sz}.shard") as src, open(shardfile, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                cache.CACHE.register(shardfile, url=store.url)
+        return store
+
+
 class NeuroglancerMesh(volume.VolumeProvider, srctype="neuroglancer/precompmesh"):
     """
     A surface mesh provided as neuroglancer precomputed mesh.
@@ -21,12 +21,39 @@ from ..locations import pointset, boundingbox as _boundingbox
 
 from typing import Union, Dict
 import nibabel as nib
+from nibabel.fileholders import FileHolder
+from urllib.parse import urlsplit
+from io import BytesIO
 import os
 import numpy as np
 
 
 class NiftiProvider(volume.VolumeProvider, srctype="nii"):
 
+    # If True, gzipped images are decompressed into a copy in the local cache
+    # when first loaded, and memory mapped from there by later fetches. This
+    # trades disk space for memory and load time, and lets processes share
+    # the same image in the page cache.
+    KEEP_DECOMPRESSED = False
+
+    # If True, gzipped images are read through a gzip seek index kept in the
+    # local cache, so that volumes of interest and single voxels are read
+    # without decompressing the whole image. Building the index decompresses
+    # the image once more on first load. Requires the indexed_gzip package
+    # (`pip install siibra[gzip-index]`).
+    USE_GZIP_INDEX = False
+
+    # If True, remote uncompressed NIfTI files are not downloaded as a whole,
+    # but read partially with http Range requests where the server supports
+    # them. Header information and volumes of interest then only cost the
+    # bytes they cover.
+    USE_RANGE_REQUESTS = False
+    _NO_RANGE_SUPPORT = set()
+
+    # Number of (decompressed) bytes read from the start of remote images to
+    # parse their header, including possible header extensions.
+    HEADER_BYTES = 64 * 1024
+
     def __init__(self, src: Union[str, Dict[str, str], nib.Nifti1Image]):
         """
         Construct a new NIfTI volume source, from url, local file, or Nift1Image object.
@@ -40,7 +67,7 @@ class NiftiProvider(volume.VolumeProvider, srctype="nii"):
                 return lambda fn=url: nib.load(fn)
             else:
                 req = requests.HttpRequest(url)
-                return lambda req=req: req.data
+                return lambda req=req: self._load(req)
 
         if isinstance(src, nib.Nifti1Image):
             self._img_loaders = {None: lambda img=src: img}
@@ -53,6 +80,25 @@ class NiftiProvider(volume.VolumeProvider, srctype="nii"):
         if not isinstance(src, nib.Nifti1Image):
             self._init_url = src
 
+    @classmethod
+    def _load(cls, req: requests.HttpRequest):
+        if (
+            cls.USE_RANGE_REQUESTS
+            and not req.cached
+            and urlsplit(req.url).path.endswith(".nii")
+            and req.url not in cls._NO_RANGE_SUPPORT
+        ):
+            try:
+                holder = FileHolder(fileobj=requests.HttpRangeFile(req.url))
+                return nib.Nifti1Image.from_file_map({"header": holder, "image": holder})
+            except requests.SiibraHttpRequestError as e:
+                logger.debug(f"Cannot read {req.url} partially, downloading the full file. {e}")
+                cls._NO_RANGE_SUPPORT.add(req.url)
+        req.func = requests.find_suitiable_decoder(
+            req.url, keep_decompressed=cls.KEEP_DECOMPRESSED, gzip_index=cls.USE_GZIP_INDEX
+        )
+        return req.data
+
     @property
     def _url(self) -> Union[str, Dict[str, str]]:
         return self._init_url
@@ -68,19 +114,82 @@ class NiftiProvider(volume.VolumeProvider, srctype="nii"):
         of the union of fragments in this nifti volume.
         """
         bbox = None
-        for loader in self._img_loaders.values():
-            img = loader()
-            if len(img.shape) > 3:
+        for fragment_name in self._img_loaders:
+            meta = self._fragment_metadata(fragment_name)
+            if len(meta.shape) > 3:
                 logger.warning(
-                    f"N-D NIfTI volume has shape {img.shape}, but "
-                    f"bounding box considers only {img.shape[:3]}"
+                    f"N-D NIfTI volume has shape {meta.shape}, but "
+                    f"bounding box considers only {meta.shape[:3]}"
                 )
-            shape = img.shape[:3]
-            next_bbox = _boundingbox.BoundingBox((0, 0, 0), shape, space=None) \
-                .transform(img.affine)
+            next_bbox = meta.boundingbox
             bbox = next_bbox if bbox is None else bbox.union(next_bbox)
         return bbox
 
+    def _fragment_metadata(self, fragment_name: str) -> volume.VolumeMetadata:
+        url = self._init_url.get(fragment_name) if isinstance(self._init_url, dict) else self._init_url
+        if url is None or os.path.isfile(url):
+            # images in memory or in local files are loaded lazily by nibabel
+            return volume.VolumeMetadata.from_image(self._img_loaders[fragment_name]())
+        return self._load_metadata(url, lambda: self._read_header(url, self._img_loaders[fragment_name]))
+
+    @classmethod
+    def _read_header(cls, url: str, loader) -> volume.VolumeMetadata:
+        """Determine the metadata of a remote image from its header bytes only."""
+        try:
+            prefix = requests.HttpRequest(url).peek(
+                cls.HEADER_BYTES, decompress=urlsplit(url).path.endswith(".gz")
+            )
+            header = nib.Nifti1Header.from_fileobj(BytesIO(prefix))
+        except Exception as e:
+            logger.debug(f"Cannot read NIfTI header of {url}, loading the image instead. {e}")
+            return volume.VolumeMetadata.from_image(loader())
+        return volume.VolumeMetadata(
+            header.get_data_shape(), header.get_best_affine(), header.get_data_dtype()
+        )
+
+    def _match_fragment(self, fragment: str = None) -> str:
+        if len(self._img_loaders) > 1:
+            matched_names = [n for n in self._img_loaders if fragment.lower() in n.lower()]
+            if len(matched_names) != 1:
+                raise ValueError(
+                    f"Requested fragment '{fragment}' could not be matched uniquely "
+                    f"to [{', '.join(self._img_loaders)}]"
+                )
+            return matched_names[0]
+        assert len(self._img_loaders) > 0
+        fragment_name = next(iter(self._img_loaders))
+        if fragment is not None:
+            assert fragment.lower() in fragment_name.lower()
+        return fragment_name
+
+    def get_metadata(
+        self,
+        fragment: str = None,
+        voi: _boundingbox.BoundingBox = None,
+        label: int = None
+    ) -> volume.VolumeMetadata:
+        """
+        Shape, affine and data type of the image returned by fetch() with the
+        same arguments. Remote images are not downloaded for this; only their
+        header is read, and the result is kept in the local cache.
+        """
+        if voi is not None:
+            return volume.VolumeProvider.get_metadata(self, fragment=fragment, voi=voi, label=label)
+        if len(self._img_loaders) > 1 and fragment is None:
+            # geometry of the merged fragments, see _merge_fragments()
+            bbox = self.boundingbox
+            meta = self._fragment_metadata(next(iter(self._img_loaders)))
+            s0 = np.identity(4)
+            s0[:3, -1] = list(bbox.minpoint.transform(np.linalg.inv(meta.affine)))
+            result_affine = np.dot(meta.affine, s0)
+            voxdims = np.asanyarray(bbox.transform(result_affine).shape, dtype="int")
+            result = volume.VolumeMetadata(tuple(voxdims), result_affine, meta.dtype)
+        else:
+            result = self._fragment_metadata(self._match_fragment(fragment))
+        if label is not None:
+            result = volume.VolumeMetadata(result.shape, result.affine, np.dtype("uint8"))
+        return result
+
     def _merge_fragments(self) -> nib.Nifti1Image:
         # TODO this only performs nearest neighbor interpolation, optimized for float types.
         bbox = self.boundingbox
@@ -148,20 +257,9 @@ class NiftiProvider(volume.VolumeProvider, srctype="nii"):
                 )
                 result = self._merge_fragments()
             else:
-                matched_names = [n for n in self._img_loaders if fragment.lower() in n.lower()]
-                if len(matched_names) != 1:
-                    raise ValueError(
-                        f"Requested fragment '{fragment}' could not be matched uniquely "
-                        f"to [{', '.join(self._img_loaders)}]"
-                    )
-                else:
-                    result = self._img_loaders[matched_names[0]]()
+                result = self._img_loaders[self._match_fragment(fragment)]()
         else:
-            assert len(self._img_loaders) > 0
-            fragment_name, loader = next(iter(self._img_loaders.items()))
-            if fragment is not None:
-                assert fragment.lower() in fragment_name.lower()
-            result = loader()
+            result = self._img_loaders[self._match_fragment(fragment)]()
 
         if voi is not None:
             bb_vox = voi.transform_bbox(np.linalg.inv(result.affine))
@@ -243,3 +341,10 @@ class ZipContainedNiftiProvider(NiftiProvider, srctype="zip/nii"):
 
         # required for self._url property
         self._init_url = src
+
+    def _fragment_metadata(self, fragment_name: str) -> volume.VolumeMetadata:
+        # the archive needs to be downloaded, but the result is kept in the cache
+        return self._load_metadata(
+            self._init_url,
+            lambda: volume.VolumeMetadata.from_image(self._img_loaders[fragment_name]())
+        )
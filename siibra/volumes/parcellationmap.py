@@ -477,7 +477,8 @@ class Map(concept.AtlasConcept, configuration_folder="maps"):
                     if fmt not in self.formats:
                         continue
                     try:
-                        self._affine_cached = self.fetch(index=MapIndex(volume=0), format=fmt).affine
+                        # read from headers or info files, without loading voxel data
+                        self._affine_cached = self.volumes[0].get_metadata(format=fmt).affine
                         break
                     except Exception:
                         logger.debug("Caught exceptions:\n", exc_info=1)
@@ -773,20 +774,67 @@ class Map(concept.AtlasConcept, configuration_folder="maps"):
         z: Union[int, np.ndarray, List]
     ):
         fragments = self.fragments or {None}
-        if isinstance(x, int):
+        if isinstance(x, (int, np.integer)):
+            # index the data object directly, so that proxied images
+            # (memory mapped, or gzipped with a seek index) read one voxel only
             return [
-                (None, volume, fragment, np.asanyarray(volimg.dataobj)[x, y, z])
+                (None, volume, fragment, volimg.dataobj[x, y, z][()])
                 for fragment in fragments
                 for volume, volimg in enumerate(self.fetch_iter(fragment=fragment))
             ]
-        else:
+
+        def read(dataobj):
+            # read only the bounding box of the requested voxels
+            X, Y, Z = (np.asarray(c, dtype=int) for c in (x, y, z))
+            if min(X.min(), Y.min(), Z.min()) < 0:
+                return np.asanyarray(dataobj)[X, Y, Z]
+            x0, y0, z0 = X.min(), Y.min(), Z.min()
+            block = np.asanyarray(dataobj[x0:X.max() + 1, y0:Y.max() + 1, z0:Z.max() + 1])
+            return block[X - x0, Y - y0, Z - z0]
+
+        return [
+            (pointindex, volume, fragment, value)
+            for fragment in fragments
+            for volume, volimg in enumerate(self.fetch_iter(fragment=fragment))
+            for pointindex, value
+            in enumerate(read(volimg.dataobj))
+        ]
+
+    def _read_points(self, xyz_mm: np.ndarray):
+        """
+        Read the values of all mapped volumes at the given physical coordinates
+        (N x 3 array) in the space of this map, in the form of _read_voxel().
+        Volume providers supporting point readout load only the image chunks
+        containing the points, at full resolution. Otherwise, the voxels are
+        read from the fetched images.
+        """
+        fragments = self.fragments or {None}
+        try:
             return [
                 (pointindex, volume, fragment, value)
                 for fragment in fragments
-                for volume, volimg in enumerate(self.fetch_iter(fragment=fragment))
+                for volume, vol in enumerate(self.volumes)
                 for pointindex, value
-                in enumerate(np.asanyarray(volimg.dataobj)[x, y, z])
+                in enumerate(vol.read_points(xyz_mm, fragment=fragment))
             ]
+        except NotImplementedError:
+            pass
+        xyz_mm = np.asarray(xyz_mm).reshape(-1, 3)
+        phys2vox = np.linalg.inv(self.affine)
+        X, Y, Z = (np.dot(phys2vox, np.c_[xyz_mm, np.ones(len(xyz_mm))].T) + 0.5).astype("int")[:3]
+        return self._read_voxel(X, Y, Z)
+
+    def _read_point_arrays(self, xyz_mm: np.ndarray):
+        """
+        Read the values of all mapped volumes at the given physical coordinates
+        like _read_points(), but return them as parallel arrays of point
+        indices, volumes, fragments and values.
+        """
+        values = self._read_points(xyz_mm)
+        if len(values) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=object), np.zeros(0)
+        pointindex, volume, fragment, value = zip(*values)
+        return np.array(pointindex), np.array(volume), np.array(fragment, dtype=object), np.array(value)
 
     def _assign(
         self,
@@ -984,21 +1032,25 @@ class Map(concept.AtlasConcept, configuration_folder="maps"):
         if points.has_constant_sigma:
             sigma_vox = points.sigma[0] / scaling
             if sigma_vox < 3:
-                pts_warped = points.warp(self.space.id)
-                X, Y, Z = (np.dot(phys2vox, pts_warped.homogeneous.T) + 0.5).astype("int")[:3]
-                for pointindex, vol, frag, value in self._read_voxel(X, Y, Z):
-                    if value > lower_threshold:
-                        position = pts_warped[pointindex].coordinate
-                        assignments.append(
-                            Assignment(
-                                input_structure=pointindex,
-                                centroid=tuple(np.array(position).round(2)),
-                                volume=vol,
-                                fragment=frag,
-                                map_value=value
-                            )
-                        )
-                return assignments
+                positions = points.warp(self.space.id).homogeneous[:, :3]
+                pointindex, vol, frag, value = self._read_point_arrays(positions)
+                selected = value > lower_threshold
+                centroids = positions.round(2)
+                return [
+                    Assignment(
+                        input_structure=p,
+                        centroid=tuple(centroids[p]),
+                        volume=v,
+                        fragment=f,
+                        map_value=val
+                    )
+                    for p, v, f, val in zip(
+                        pointindex[selected].tolist(),
+                        vol[selected].tolist(),
+                        frag[selected],
+                        value[selected].tolist()
+                    )
+                ]
 
         # if we get here, we need to handle each point independently.
         # This is much slower but more precise in dealing with the uncertainties
@@ -1012,8 +1064,7 @@ class Map(concept.AtlasConcept, configuration_folder="maps"):
                 # voxel-precise - just read out the value in the maps
                 N = len(self)
                 logger.debug(f"Assigning coordinate {tuple(pt)} to {N} maps")
-                x, y, z = (np.dot(phys2vox, pt.homogeneous) + 0.5).astype("int")[:3]
-                values = self._read_voxel(x, y, z)
+                values = self._read_points(np.array([pt.coordinate]))
                 for _, vol, frag, value in values:
                     if value > lower_threshold:
                         assignments.append(
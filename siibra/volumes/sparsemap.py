@@ -16,14 +16,16 @@
 from . import parcellationmap, volume as _volume
 
 from ..commons import MapIndex, logger, iterate_connected_components, siibra_tqdm
-from ..locations import boundingbox
 from ..retrieval import cache
 from ..retrieval.repositories import ZipfileConnector, GitlabConnector
 
-from os import path, rename, makedirs
+from os import path, rename, makedirs, listdir
+from shutil import rmtree, copyfileobj
 from zipfile import ZipFile, ZIP_DEFLATED
 import gzip
+import json
 from typing import Dict, Union, TYPE_CHECKING, List
+from collections.abc import Sequence
 from nilearn import image
 from nibabel import Nifti1Image, load
 import numpy as np
@@ -32,16 +34,60 @@ if TYPE_CHECKING:
     from ..core.region import Region
 
 
+class SparseProbs(Sequence):
+    """
+    Read-only view of the values of a SparseIndex as a sequence, which
+    holds for each mapped coordinate a dict from volume to value.
+    Negative coordinate ids, as found in SparseIndex.voxels outside the maps,
+    yield empty dicts.
+    """
+
+    def __init__(self, spind: "SparseIndex"):
+        self._spind = spind
+
+    def __len__(self):
+        return self._spind.num_coords
+
+    def __getitem__(self, coord_id: int) -> Dict[int, float]:
+        if coord_id < 0:
+            return {}
+        spind = self._spind
+        i0, i1 = spind.indptr[coord_id], spind.indptr[coord_id + 1]
+        return dict(zip(spind.volume_ids[i0:i1].tolist(), spind.values[i0:i1].tolist()))
+
+
 class SparseIndex:
+    """
+    Sparse representation of a list of statistical maps in the same voxel space.
+
+    - voxels[x, y, z] is the id of the coordinate (x, y, z), or -1 where no
+      volume maps it.
+    - The values are stored in compressed sparse row (CSR) layout over the
+      coordinate ids: the volumes mapping coordinate i are
+      volume_ids[indptr[i]:indptr[i + 1]], in ascending order, with values
+      values[indptr[i]:indptr[i + 1]].
+    - volume_voxels[v] holds the linear indices of the voxels mapped by
+      volume v, in ascending order.
+    """
+
+    # version of the binary format written by _to_folder()
+    FORMAT_VERSION = 1
+    ARRAYS = ["voxels", "indptr", "volume_ids", "values", "volume_voxels", "volume_indptr"]
 
     def __init__(self):
-        self.probs = []
         self.bboxes = []
 
         # these are initialized when adding the first volume, see below
         self.affine: np.ndarray = None
         self.shape = None
         self.voxels: np.ndarray = None
+        self.volume_voxels: List[np.ndarray] = []
+
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._volume_ids = np.zeros(0, dtype=np.uint16)
+        self._values = np.zeros(0, dtype=np.float32)
+        # coordinate ids, volumes and values of added images not yet merged into the CSR arrays
+        self._pending = []
 
     def add_img(self, img: Nifti1Image):
 
@@ -54,22 +100,26 @@ class SparseIndex:
                 raise RuntimeError(
                     "Building sparse maps from volumes with different voxel spaces is not yet supported in siibra."
                 )
+            if not self.voxels.flags.writeable:
+                # loaded read-only from the cache
+                self.voxels = np.array(self.voxels)
 
         volume = self.num_volumes
         imgdata = np.asanyarray(img.dataobj)
         X, Y, Z = [v.astype("int32") for v in np.where(imgdata > 0)]
-        for x, y, z, prob in zip(X, Y, Z, imgdata[X, Y, Z]):
-            coord_id = self.voxels[x, y, z]
-            if coord_id >= 0:
-                # Coordinate already seen. Add observed value.
-                assert volume not in self.probs[coord_id]
-                assert len(self.probs) > coord_id
-                self.probs[coord_id][volume] = prob
-            else:
-                # New coordinate. Append entry with observed value.
-                coord_id = len(self.probs)
-                self.voxels[x, y, z] = coord_id
-                self.probs.append({volume: prob})
+
+        # assign ids to coordinates not seen in previous volumes
+        coord_ids = self.voxels[X, Y, Z]
+        new = coord_ids < 0
+        num_coords = self.num_coords
+        coord_ids[new] = np.arange(num_coords, num_coords + new.sum(), dtype=np.int32)
+        self.voxels[X[new], Y[new], Z[new]] = coord_ids[new]
+
+        # np.where returns the voxels in C order, i.e. sorted by linear index
+        self.volume_voxels.append(
+            np.ravel_multi_index((X, Y, Z), self.shape).astype(self._voxel_index_dtype)
+        )
+        self._pending.append((coord_ids, volume, imgdata[X, Y, Z].astype(np.float32)))
 
         self.bboxes.append(
             {
@@ -78,6 +128,61 @@ class SparseIndex:
             }
         )
 
+    @property
+    def _voxel_index_dtype(self):
+        return np.int32 if np.prod(self.shape) < 2**31 else np.int64
+
+    def _merge_pending(self):
+        """Merge the values of added images into the CSR arrays."""
+        if len(self._pending) == 0:
+            return
+        num_coords = int(self.voxels.max()) + 1
+        if self.num_volumes > np.iinfo(self._volume_ids.dtype).max:
+            self._volume_ids = self._volume_ids.astype(np.int32)
+        coord_ids = np.concatenate(
+            [np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr))]
+            + [c for c, _, _ in self._pending]
+        )
+        volume_ids = np.concatenate(
+            [self._volume_ids] + [np.full(len(c), v, dtype=self._volume_ids.dtype) for c, v, _ in self._pending]
+        )
+        values = np.concatenate([self._values] + [v for _, _, v in self._pending])
+        # volumes are added in ascending order, so a stable sort keeps them sorted per coordinate
+        order = np.argsort(coord_ids, kind="stable")
+        self._indptr = np.zeros(num_coords + 1, dtype=np.int64)
+        np.cumsum(np.bincount(coord_ids, minlength=num_coords), out=self._indptr[1:])
+        self._volume_ids = volume_ids[order]
+        self._values = values[order]
+        self._pending = []
+
+    @property
+    def indptr(self) -> np.ndarray:
+        self._merge_pending()
+        return self._indptr
+
+    @property
+    def volume_ids(self) -> np.ndarray:
+        self._merge_pending()
+        return self._volume_ids
+
+    @property
+    def values(self) -> np.ndarray:
+        self._merge_pending()
+        return self._values
+
+    @property
+    def probs(self) -> SparseProbs:
+        return SparseProbs(self)
+
+    @property
+    def num_coords(self):
+        """Number of voxels mapped by at least one volume."""
+        if self.voxels is None:
+            return 0
+        if len(self._pending) == 0:
+            return len(self._indptr) - 1
+        return int(self.voxels.max()) + 1
+
     @property
     def num_volumes(self):
         return len(self.bboxes)
@@ -85,52 +190,149 @@ class SparseIndex:
     def max(self):
         return self.voxels.max()
 
+    def _entries(self, coord_ids: np.ndarray, volume: int) -> np.ndarray:
+        """
+        Positions in the CSR arrays of the values of the given volume at
+        the given coordinates, or -1 where the volume does not map them.
+        """
+        coord_ids = np.asarray(coord_ids)
+        start, stop = self.indptr[coord_ids], self.indptr[coord_ids + 1]
+        result = np.full(len(coord_ids), -1, dtype=np.int64)
+        # rows are short, so test their entries position by position
+        for offset in range(int((stop - start).max(initial=0))):
+            pos = start + offset
+            hit = pos < stop
+            hit[hit] = self.volume_ids[pos[hit]] == volume
+            result[hit] = pos[hit]
+        return result
+
+    def _gather(self, coord_ids: np.ndarray):
+        """
+        Expand the CSR rows of the given coordinates. Returns parallel arrays
+        with the position of each entry's coordinate in coord_ids, and the
+        position of the entry in the CSR arrays.
+        """
+        coord_ids = np.asarray(coord_ids)
+        start = self.indptr[coord_ids]
+        lengths = self.indptr[coord_ids + 1] - start
+        rows = np.repeat(np.arange(len(coord_ids)), lengths)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return rows, np.repeat(start, lengths) + offsets
+
+    def read_voxels(self, x, y, z):
+        """
+        Read the values of all volumes at the given voxel coordinates.
+        Coordinates outside the voxel space are not mapped by any volume.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray]
+            Parallel arrays with the index of the coordinate, the volume, and
+            the value of each mapped (coordinate, volume) pair, sorted by
+            coordinate index and volume.
+        """
+        X, Y, Z = (np.asarray(c, dtype=np.int64).reshape(-1) for c in (x, y, z))
+        inside = np.ones(len(X), dtype=bool)
+        for c, s in zip((X, Y, Z), self.shape):
+            inside &= (c >= 0) & (c < s)
+        points = np.flatnonzero(inside)
+        coord_ids = self.voxels[X[points], Y[points], Z[points]]
+        points, coord_ids = points[coord_ids >= 0], coord_ids[coord_ids >= 0]
+        rows, entries = self._gather(coord_ids)
+        return points[rows], self.volume_ids[entries], self.values[entries]
+
     def coords(self, volume: int):
-        # Nx3 array with x/y/z coordinates of the N nonzero values of the given mapindex
+        # 3xN array with x/y/z coordinates of the N nonzero values of the given mapindex
         assert volume in range(self.num_volumes)
-        coord_ids = [i for i, l in enumerate(self.probs) if volume in l]
-        x0, y0, z0 = self.bboxes[volume]["minpoint"]
-        x1, y1, z1 = self.bboxes[volume]["maxpoint"]
-        return (
-            np.array(
-                np.where(
-                    np.isin(
-                        self.voxels[x0: x1 + 1, y0: y1 + 1, z0: z1 + 1],
-                        coord_ids,
-                    )
-                )
-            ).T
-            + (x0, y0, z0)
-        ).T
+        return np.array(np.unravel_index(self.volume_voxels[volume], self.shape))
 
     def mapped_voxels(self, volume: int):
         # returns the x, y, and z coordinates of nonzero voxels for the map
         # with the given index, together with their corresponding values v.
         assert volume in range(self.num_volumes)
-        x, y, z = [v.squeeze() for v in np.split(self.coords(volume), 3)]
-        v = [self.probs[i][volume] for i in self.voxels[x, y, z]]
-        return x, y, z, v
+        x, y, z = self.coords(volume)
+        return x, y, z, self.values[self._entries(self.voxels[x, y, z], volume)]
+
+    def _to_folder(self, folder: str):
+        """
+        Write this index to the given folder as raw numpy arrays, which can be
+        memory-mapped when loading, together with a json file of metadata.
+        """
+        makedirs(folder, exist_ok=True)
+        arrays = {
+            "voxels": self.voxels,
+            "indptr": self.indptr,
+            "volume_ids": self.volume_ids,
+            "values": self.values,
+            "volume_voxels": np.concatenate(
+                self.volume_voxels or [np.zeros(0, dtype=self._voxel_index_dtype)]
+            ),
+            "volume_indptr": np.cumsum([0] + [len(v) for v in self.volume_voxels], dtype=np.int64),
+        }
+        for name in self.ARRAYS:
+            np.save(path.join(folder, f"{name}.npy"), arrays[name])
+        with open(path.join(folder, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "version": self.FORMAT_VERSION,
+                    "affine": np.asarray(self.affine).tolist(),
+                    "shape": [int(v) for v in self.shape],
+                    "bboxes": [
+                        [int(v) for v in (*bbox["minpoint"], *bbox["maxpoint"])]
+                        for bbox in self.bboxes
+                    ],
+                },
+                f
+            )
+
+    @classmethod
+    def _from_folder(cls, folder: str):
+        """
+        Load an index written by _to_folder(), memory-mapping its arrays.
+        Returns None if the folder does not contain an index of the current
+        format version.
+        """
+        try:
+            with open(path.join(folder, "meta.json"), "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != cls.FORMAT_VERSION:
+            return None
+        arrays = {
+            name: np.load(path.join(folder, f"{name}.npy"), mmap_mode="r")
+            for name in cls.ARRAYS
+        }
+        result = cls()
+        result.affine = np.array(meta["affine"])
+        result.shape = tuple(meta["shape"])
+        result.bboxes = [
+            {"minpoint": tuple(b[:3]), "maxpoint": tuple(b[3:])}
+            for b in meta["bboxes"]
+        ]
+        result.voxels = arrays["voxels"]
+        result._indptr = arrays["indptr"]
+        result._volume_ids = arrays["volume_ids"]
+        result._values = arrays["values"]
+        volume_indptr = arrays["volume_indptr"]
+        result.volume_voxels = [
+            arrays["volume_voxels"][i0:i1]
+            for i0, i1 in zip(volume_indptr[:-1], volume_indptr[1:])
+        ]
+        return result
 
     def _to_local_cache(self, cache_prefix: str):
         """
         Serialize this index to the cache, using the given prefix for the cache
         filenames.
         """
-        probsfile = cache.CACHE.build_filename(f"{cache_prefix}", suffix="probs.txt.gz")
-        bboxfile = cache.CACHE.build_filename(f"{cache_prefix}", suffix="bboxes.txt.gz")
-        voxelfile = cache.CACHE.build_filename(f"{cache_prefix}", suffix="voxels.nii.gz")
-        Nifti1Image(self.voxels, self.affine).to_filename(voxelfile)
-        with gzip.open(probsfile, 'wt') as f:
-            for D in self.probs:
-                f.write("{}\n".format(" ".join(f"{i} {p}" for i, p in D.items())))
-        with gzip.open(bboxfile, "wt") as f:
-            for bbox in self.bboxes:
-                f.write(
-                    "{} {}\n".format(
-                        " ".join(map(str, bbox["minpoint"])),
-                        " ".join(map(str, bbox["maxpoint"])),
-                    )
-                )
+        folder = cache.CACHE.build_filename(f"{cache_prefix}", suffix="sparseindex")
+        temp_folder = f"{folder}_temp"
+        rmtree(temp_folder, ignore_errors=True)
+        self._to_folder(temp_folder)
+        rmtree(folder, ignore_errors=True)
+        rename(temp_folder, folder)
+        cache.CACHE.register(folder)
 
     @staticmethod
     def _from_local_cache(cache_name: str):
@@ -149,11 +351,34 @@ class SparseIndex:
             None if cached files are not found or suitable.
         """
 
+        folder = cache.CACHE.build_filename(f"{cache_name}", suffix="sparseindex")
+        if path.isdir(folder):
+            result = SparseIndex._from_folder(folder)
+            if result is not None:
+                cache.CACHE.touch(folder)
+                return result
+
+        # indices cached or precomputed in the former text format are
+        # converted once to the binary format
+        result = SparseIndex._from_text_files(cache_name)
+        if result is not None:
+            result._to_local_cache(cache_name)
+            result = SparseIndex._from_folder(folder)
+        return result
+
+    @staticmethod
+    def _from_text_files(cache_name: str):
+        """
+        Load a sparse index from cache files in the text format used by
+        siibra versions before the binary format.
+        """
         probsfile = cache.CACHE.build_filename(f"{cache_name}", suffix="probs.txt.gz")
         bboxfile = cache.CACHE.build_filename(f"{cache_name}", suffix="bboxes.txt.gz")
         voxelfile = cache.CACHE.build_filename(f"{cache_name}", suffix="voxels.nii.gz")
         if not all(path.isfile(f) for f in [probsfile, bboxfile, voxelfile]):
             return None
+        for fn in [probsfile, bboxfile, voxelfile]:
+            cache.CACHE.touch(fn)
 
         result = SparseIndex()
 
@@ -164,17 +389,24 @@ class SparseIndex:
 
         with gzip.open(probsfile, "rt") as f:
             lines = f.readlines()
-            for line in siibra_tqdm(
-                lines,
-                total=len(lines),
-                desc="Loading sparse index",
-                unit="voxels"
-            ):
-                fields = line.strip().split(" ")
-                mapindices = list(map(int, fields[0::2]))
-                values = list(map(float, fields[1::2]))
-                D = dict(zip(mapindices, values))
-                result.probs.append(D)
+        counts = np.zeros(len(lines), dtype=np.int64)
+        volume_ids, values = [], []
+        for i, line in siibra_tqdm(
+            enumerate(lines),
+            total=len(lines),
+            desc="Loading sparse index",
+            unit="voxels"
+        ):
+            fields = line.split()
+            counts[i] = len(fields) // 2
+            volume_ids.extend(fields[0::2])
+            values.extend(fields[1::2])
+        result._indptr = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum(counts, out=result._indptr[1:])
+        result._volume_ids = np.array(volume_ids, dtype=np.int32)
+        if result._volume_ids.max(initial=0) <= np.iinfo(np.uint16).max:
+            result._volume_ids = result._volume_ids.astype(np.uint16)
+        result._values = np.array(values, dtype=np.float32)
 
         with gzip.open(bboxfile, "rt") as f:
             for line in f:
@@ -186,6 +418,15 @@ class SparseIndex:
                     }
                 )
 
+        # derive the voxels of each volume from the values grouped by coordinate
+        mapped = np.flatnonzero(result.voxels.ravel() >= 0)
+        coord_voxels = np.zeros(result.num_coords, dtype=result._voxel_index_dtype)
+        coord_voxels[result.voxels.ravel()[mapped]] = mapped
+        entry_voxels = np.repeat(coord_voxels, np.diff(result.indptr))
+        order = np.lexsort((entry_voxels, result.volume_ids))
+        bounds = np.searchsorted(result.volume_ids[order], np.arange(result.num_volumes + 1))
+        result.volume_voxels = [entry_voxels[order[v0:v1]] for v0, v1 in zip(bounds[:-1], bounds[1:])]
+
         return result
 
 
@@ -194,19 +435,18 @@ class SparseMap(parcellationmap.Map):
     A sparse representation of list of statistical (e.g. probabilistic) brain
     region maps.
 
-    It represents the 3D statistical maps of N brain regions by two data structures:
+    It represents the 3D statistical maps of N brain regions by a SparseIndex:
 
-    1) 'spatial_index', a 3D volume where non-negative values represent unique indices into a list of region assignments
-    2) 'probs', a list of region assignments where each entry is a dict
+    1) 'voxels', a 3D volume where non-negative values represent unique indices into a list of region assignments
+    2) 'indptr', 'volume_ids' and 'values', the region assignments in compressed sparse row layout
 
     More precisely, given ``i = sparse_index.voxels[x, y, z]`` we define that
 
     - if `i<0`, no brain region is assigned at this location
-    - if `i>=0`, ``probs[i]`` defines the probabilities of brain regions.
+    - if `i>=0`, ``volume_ids[indptr[i]:indptr[i + 1]]`` are the volumes of the brain regions
+      assigned to the voxel, and ``values[indptr[i]:indptr[i + 1]]`` their (probability) values.
 
-    Each entry in probs is a dictionary that represents the region assignments for
-    the unique voxel where ``spatial_index == i``. The assignment maps from a MapIndex
-    to the actual (probability) value.
+    ``sparse_index.probs[i]`` provides the same assignments as a dictionary from volume to value.
     """
 
     # A gitlab instance with holds precomputed sparse indices
@@ -310,13 +550,15 @@ class SparseMap(parcellationmap.Map):
             makedirs(destination)
         if self._sparse_index_cached is None:
             _ = self.sparse_index
-        suffices = [".probs.txt.gz", ".bboxes.txt.gz", ".voxels.nii.gz"]
+        folder = cache.CACHE.build_filename(self._cache_prefix, suffix="sparseindex")
+        if not path.isdir(folder):
+            self._sparse_index_cached._to_local_cache(self._cache_prefix)
         try:
             with ZipFile(f"{destination}/{filename}.zip", 'w') as zipf:
-                for suffix in suffices:
+                for fname in sorted(listdir(folder)):
                     zipf.write(
-                        filename=cache.CACHE.build_filename(self._cache_prefix, suffix),
-                        arcname=path.basename(f"{filename}{suffix}"),
+                        filename=path.join(folder, fname),
+                        arcname=f"{filename}.{fname}",
                         compress_type=ZIP_DEFLATED
                     )
         except Exception as e:
@@ -341,15 +583,30 @@ class SparseMap(parcellationmap.Map):
         """
         zconn = ZipfileConnector(zipfname)
         with ZipFile(zconn.zipfile, 'r') as zp:
-            suffices = [".probs.txt.gz", ".bboxes.txt.gz", ".voxels.nii.gz"]
-            for suffix in suffices:
-                file = [f for f in zconn.search_files(suffix=suffix)]
-                assert len(file) == 1, f"Could not find a unique '{suffix}' file in {zipfname}."
-                zp.extract(file[0], cache.CACHE.folder)
-                rename(
-                    path.join(cache.CACHE.folder, file[0]),
-                    cache.CACHE.build_filename(self._cache_prefix, suffix=suffix)
-                )
+            if any(f.endswith(".meta.json") for f in zp.namelist()):
+                folder = cache.CACHE.build_filename(self._cache_prefix, suffix="sparseindex")
+                temp_folder = f"{folder}_temp"
+                rmtree(temp_folder, ignore_errors=True)
+                makedirs(temp_folder)
+                for fname in ["meta.json"] + [f"{name}.npy" for name in SparseIndex.ARRAYS]:
+                    file = [f for f in zp.namelist() if f.endswith(f".{fname}")]
+                    assert len(file) == 1, f"Could not find a unique '{fname}' file in {zipfname}."
+                    with zp.open(file[0]) as src, open(path.join(temp_folder, fname), "wb") as dst:
+                        copyfileobj(src, dst)
+                rmtree(folder, ignore_errors=True)
+                rename(temp_folder, folder)
+                cache.CACHE.register(folder, url=zipfname)
+            else:
+                # SparseIndex saved in the former text format
+                suffices = [".probs.txt.gz", ".bboxes.txt.gz", ".voxels.nii.gz"]
+                for suffix in suffices:
+                    file = [f for f in zconn.search_files(suffix=suffix)]
+                    assert len(file) == 1, f"Could not find a unique '{suffix}' file in {zipfname}."
+                    zp.extract(file[0], cache.CACHE.folder)
+                    cachefile = cache.CACHE.build_filename(self._cache_prefix, suffix=suffix)
+                    cache.CACHE.ensure_folder(cachefile)
+                    rename(path.join(cache.CACHE.folder, file[0]), cachefile)
+                    cache.CACHE.register(cachefile, url=zipfname)
         zconn.clear_cache()
 
         return SparseIndex._from_local_cache(self._cache_prefix)
@@ -427,19 +684,20 @@ class SparseMap(parcellationmap.Map):
         return Nifti1Image(result, self.affine)
 
     def _read_voxel(self, x, y, z):
-        spind = self.sparse_index
-        vx = spind.voxels[x, y, z]
-        if isinstance(vx, int):
-            return list(
-                (None, volume, None, value)
-                for volume, value in spind.probs[vx].items()
-            )
+        pointindex, volume, value = self.sparse_index.read_voxels(x, y, z)
+        if isinstance(x, (int, np.integer)):
+            pointindex = [None] * len(volume)
         else:
-            return list(
-                (pointindex, volume, None, value)
-                for pointindex, voxel in enumerate(vx)
-                for volume, value in spind.probs[voxel].items()
-            )
+            pointindex = pointindex.tolist()
+        return list(zip(pointindex, volume.tolist(), [None] * len(volume), value.tolist()))
+
+    def _read_point_arrays(self, xyz_mm: np.ndarray):
+        # read the points directly from the sparse index
+        xyz_mm = np.asarray(xyz_mm).reshape(-1, 3)
+        phys2vox = np.linalg.inv(self.affine)
+        X, Y, Z = (np.dot(phys2vox, np.c_[xyz_mm, np.ones(len(xyz_mm))].T) + 0.5).astype("int")[:3]
+        pointindex, volume, value = self.sparse_index.read_voxels(X, Y, Z)
+        return pointindex, volume, np.full(len(volume), None, dtype=object), value
 
     def _assign_image(self, queryimg: Nifti1Image, minsize_voxel: int, lower_threshold: float, split_components: bool = True) -> List[parcellationmap.AssignImageResult]:
         """
@@ -477,92 +735,72 @@ class SparseMap(parcellationmap.Map):
         iter_func = iterate_connected_components if split_components \
             else lambda img: [(1, img)]
 
+        # Statistics of the thresholded map values of all volumes. The query
+        # components are compared with the maps in the union of their bounding
+        # boxes, outside of which the maps are zero.
+        spind = self.sparse_index
+        num_volumes = spind.num_volumes
+        volume_ids = spind.volume_ids
+        values = spind.values.astype(np.float64)
+        values[values < lower_threshold] = 0
+        count1 = np.bincount(volume_ids, weights=values > 0, minlength=num_volumes)
+        sum1 = np.bincount(volume_ids, weights=values, minlength=num_volumes)
+        sumsq1 = np.bincount(volume_ids, weights=values ** 2, minlength=num_volumes)
+        max1 = np.zeros(num_volumes)
+        np.maximum.at(max1, volume_ids, values)
+        minpoints = np.array([bbox["minpoint"] for bbox in spind.bboxes]).reshape(-1, 3)
+        maxpoints = np.array([bbox["maxpoint"] for bbox in spind.bboxes]).reshape(-1, 3)
+
         for mode, modeimg in iter_func(queryimg):
 
-            # determine bounding box of the mode
             modemask = np.asanyarray(modeimg.dataobj)
             XYZ2 = np.array(np.where(modemask)).T
             position = np.dot(modeimg.affine, np.r_[XYZ2.mean(0), 1])[:3]
             if XYZ2.shape[0] <= minsize_voxel:
                 continue
-            X2, Y2, Z2 = [v.squeeze() for v in np.split(XYZ2, 3, axis=1)]
-
-            bbox2 = boundingbox.BoundingBox(XYZ2.min(0), XYZ2.max(0) + 1, space=None)
-            if bbox2.volume == 0:
-                continue
-
-            spind = self.sparse_index
-
-            for volume in siibra_tqdm(
-                range(len(self)),
-                desc=f"Assigning structure #{mode} to {len(self)} sparse maps",
-                total=len(self),
-                unit=" map"
-            ):
-                bbox1 = boundingbox.BoundingBox(
-                    self.sparse_index.bboxes[volume]["minpoint"],
-                    self.sparse_index.bboxes[volume]["maxpoint"],
-                    space=None,
-                )
-                if bbox1.intersection(bbox2) is None:
-                    continue
-
-                # compute union of voxel space bounding boxes
-                bbox = bbox1.union(bbox2)
-                bbshape = np.array(bbox.shape, dtype="int") + 1
-                x0, y0, z0 = map(int, bbox.minpoint)
-
-                # build flattened vector of map values
-                v1 = np.zeros(np.prod(bbshape))
-                XYZ1 = spind.coords(volume).T
-                X1, Y1, Z1 = [v.squeeze() for v in np.split(XYZ1, 3, axis=1)]
-                indices1 = np.ravel_multi_index(
-                    (X1 - x0, Y1 - y0, Z1 - z0), bbshape
-                )
-                v1[indices1] = [spind.probs[i][volume] for i in spind.voxels[X1, Y1, Z1]]
-                v1[v1 < lower_threshold] = 0
-
-                # build flattened vector of input image mode
-                v2 = np.zeros(np.prod(bbshape))
-                indices2 = np.ravel_multi_index(
-                    (X2 - x0, Y2 - y0, Z2 - z0), bbshape
-                )
-                v2[indices2] = querydata[X2, Y2, Z2]
-
-                assert v1.shape == v2.shape
-
-                intersection = np.sum(
-                    (v1 > 0) & (v2 > 0)
-                )  # np.minimum(v1, v2).sum()
-                if intersection == 0:
-                    continue
-                iou = intersection / np.sum(
-                    (v1 > 0) | (v2 > 0)
-                )  # np.maximum(v1, v2).sum()
+            X2, Y2, Z2 = XYZ2.T
+            v2 = querydata[X2, Y2, Z2].astype(np.float64)
+            count2 = (v2 > 0).sum()
+            sum2 = v2.sum()
+            sumsq2 = (v2 ** 2).sum()
+
+            # look up the component's voxels in the sparse index, and reduce
+            # the products with the map values per volume
+            coord_ids = spind.voxels[X2, Y2, Z2]
+            mapped = np.flatnonzero(coord_ids >= 0)
+            rows, entries = spind._gather(coord_ids[mapped])
+            w1 = values[entries]
+            w2 = v2[mapped[rows]]
+            volumes = volume_ids[entries]
+            intersection = np.bincount(volumes, weights=(w1 > 0) & (w2 > 0), minlength=num_volumes)
+            sum12 = np.bincount(volumes, weights=w1 * w2, minlength=num_volumes)
+
+            # number of voxels in the union of the bounding boxes of maps and component
+            size = np.prod(
+                np.maximum(maxpoints, XYZ2.max(0) + 1) - np.minimum(minpoints, XYZ2.min(0)) + 1,
+                axis=1
+            )
 
-                v1d = v1 - v1.mean()
-                v2d = v2 - v2.mean()
+            for volume in np.flatnonzero(intersection > 0):
+                n = size[volume]
                 rho = (
-                    (v1d * v2d).sum()
-                    / np.sqrt((v1d ** 2).sum())
-                    / np.sqrt((v2d ** 2).sum())
+                    (sum12[volume] - sum1[volume] * sum2 / n)
+                    / np.sqrt(sumsq1[volume] - sum1[volume] ** 2 / n)
+                    / np.sqrt(sumsq2 - sum2 ** 2 / n)
                 )
-
-                maxval = v1.max()
-
                 assignments.append(
                     parcellationmap.AssignImageResult(
                         input_structure=mode,
                         centroid=tuple(position.round(2)),
-                        volume=volume,
+                        volume=int(volume),
                         fragment=None,
-                        map_value=maxval,
-                        intersection_over_union=iou,
-                        intersection_over_first=intersection / (v1 > 0).sum(),
-                        intersection_over_second=intersection / (v2 > 0).sum(),
+                        map_value=max1[volume],
+                        intersection_over_union=intersection[volume] / (count1[volume] + count2 - intersection[volume]),
+                        intersection_over_first=intersection[volume] / count1[volume],
+                        intersection_over_second=intersection[volume] / count2,
                         correlation=rho,
-                        weighted_mean_of_first=np.sum(v1 * v2) / np.sum(v2),
-                        weighted_mean_of_second=np.sum(v1 * v2) / np.sum(v1)
+                        weighted_mean_of_first=sum12[volume] / sum2,
+                        weighted_mean_of_second=sum12[volume] / sum1[volume]
                     )
                 )
 
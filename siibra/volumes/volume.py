@@ -14,15 +14,19 @@
 # limitations under the License.
 """A specific mesh or 3D array."""
 from .. import logger
-from ..retrieval import requests
+from ..retrieval import requests, cache
+from ..retrieval.exceptions import CircuitOpenError
 from ..locations import boundingbox as _boundingbox
 from ..core import space
 
 import nibabel as nib
+import numpy as np
 from abc import ABC, abstractmethod
-from typing import List, Dict, Union, Set, TYPE_CHECKING
+from dataclasses import dataclass
+from typing import Callable, List, Dict, Tuple, Union, Set, TYPE_CHECKING
 import json
-from time import sleep
+import os
+from requests.exceptions import RequestException
 
 if TYPE_CHECKING:
     from ..retrieval.datasets import EbrainsDataset
@@ -159,6 +163,54 @@ class Volume:
     def __repr__(self):
         return self.__str__()
 
+    def _select_format(self, format: str = None) -> str:
+        if format is None:
+            requested_formats = self.SUPPORTED_FORMATS
+        elif format in self._FORMAT_LOOKUP:  # allow use of aliases
+            requested_formats = self._FORMAT_LOOKUP[format]
+        elif format in self.SUPPORTED_FORMATS:
+            requested_formats = [format]
+        else:
+            raise ValueError(f"Invalid format requested: {format}")
+
+        # select the first source unless the user specifically requests a format
+        for fmt in requested_formats:
+            if fmt in self.formats:
+                logger.debug(f"Requested format was '{format}', selected format is '{fmt}'")
+                return fmt
+        raise ValueError(f"Invalid format requested: {format}")
+
+    def get_metadata(self, format: str = None, **kwargs) -> "VolumeMetadata":
+        """
+        Shape, affine and data type of the image that fetch() returns for the
+        same arguments, determined from file headers or info files where the
+        provider supports it, without loading voxel data.
+
+        Parameters
+        ----------
+        format: str, default=None
+            Requested format, selected as in fetch().
+        """
+        return self._providers[self._select_format(format)].get_metadata(**kwargs)
+
+    def read_points(self, xyz_mm: np.ndarray, format: str = None, **kwargs) -> np.ndarray:
+        """
+        Read the values of the image that fetch() returns for the same
+        arguments at the given physical coordinates (N x 3 array), for
+        providers which can do so without fetching the image.
+
+        Parameters
+        ----------
+        format: str, default=None
+            Requested format, selected as in fetch().
+
+        Raises
+        ------
+        NotImplementedError
+            If the selected provider does not support point readout.
+        """
+        return self._providers[self._select_format(format)].read_points(xyz_mm, **kwargs)
+
     def fetch(
         self,
         format: str = None,
@@ -184,38 +236,20 @@ class Volume:
         An image or mesh
         """
 
-        if format is None:
-            requested_formats = self.SUPPORTED_FORMATS
-        elif format in self._FORMAT_LOOKUP:  # allow use of aliases
-            requested_formats = self._FORMAT_LOOKUP[format]
-        elif format in self.SUPPORTED_FORMATS:
-            requested_formats = [format]
-        else:
-            raise ValueError(f"Invalid format requested: {format}")
-
-        # select the first source unless the user specifically requests a format
-        for fmt in requested_formats:
-            if fmt in self.formats:
-                selected_format = fmt
-                logger.debug(f"Requested format was '{format}', selected format is '{selected_format}'")
-                break
-        else:
-            raise ValueError(f"Invalid format requested: {format}")
-
-        # try the selected format only
-        for try_count in range(6):
-            try:
-                if selected_format == "gii-label":
-                    tpl = self.space.get_template(variant=kwargs.get('variant'))
-                    mesh = tpl.fetch(**kwargs)
-                    labels = self._providers[selected_format].fetch(**kwargs)
-                    return dict(**mesh, **labels)
-                else:
-                    return self._providers[selected_format].fetch(**kwargs)
-            except requests.SiibraHttpRequestError as e:
-                if e.status_code == 429:  # too many requests
-                    sleep(0.1)
-                logger.error(f"Cannot access {self._providers[selected_format]}", exc_info=(try_count == 5))
+        selected_format = self._select_format(format)
+
+        # try the selected format only. Transient http errors are already
+        # retried by the connection pool, within the deadline of its retry policy.
+        try:
+            if selected_format == "gii-label":
+                tpl = self.space.get_template(variant=kwargs.get('variant'))
+                mesh = tpl.fetch(**kwargs)
+                labels = self._providers[selected_format].fetch(**kwargs)
+                return dict(**mesh, **labels)
+            else:
+                return self._providers[selected_format].fetch(**kwargs)
+        except (requests.SiibraHttpRequestError, CircuitOpenError, RequestException):
+            logger.error(f"Cannot access {self._providers[selected_format]}", exc_info=True)
         if format is None and len(self.formats) > 1:
             logger.info(
                 f"No format was specified and auto-selected format '{selected_format}' "
@@ -244,6 +278,34 @@ class Subvolume(Volume):
 VolumeData = Union[nib.Nifti1Image, Dict]
 
 
+@dataclass
+class VolumeMetadata:
+    """Shape, affine and data type of an image volume."""
+    shape: Tuple[int, ...]
+    affine: np.ndarray
+    dtype: np.dtype
+
+    @property
+    def boundingbox(self) -> _boundingbox.BoundingBox:
+        """Bounding box of the volume in physical coordinates."""
+        return _boundingbox.BoundingBox((0, 0, 0), self.shape[:3], space=None).transform(self.affine)
+
+    def to_json(self) -> Dict:
+        return {
+            "shape": [int(v) for v in self.shape],
+            "affine": np.asanyarray(self.affine).tolist(),
+            "dtype": np.dtype(self.dtype).str,
+        }
+
+    @classmethod
+    def from_json(cls, spec: Dict) -> "VolumeMetadata":
+        return cls(tuple(spec["shape"]), np.array(spec["affine"]), np.dtype(spec["dtype"]))
+
+    @classmethod
+    def from_image(cls, img: nib.Nifti1Image) -> "VolumeMetadata":
+        return cls(tuple(img.shape), img.affine, img.dataobj.dtype)
+
+
 class VolumeProvider(ABC):
 
     def __init_subclass__(cls, srctype: str) -> None:
@@ -263,6 +325,48 @@ class VolumeProvider(ABC):
     def fetch(self, *args, **kwargs) -> VolumeData:
         raise NotImplementedError
 
+    def get_metadata(self, **kwargs) -> VolumeMetadata:
+        """
+        Shape, affine and data type of the image that fetch() returns for the
+        same arguments. This default implementation fetches the image,
+        providers override it to read only headers or info files.
+        """
+        img = self.fetch(**kwargs)
+        if not isinstance(img, nib.Nifti1Image):
+            raise NotImplementedError(f"{self.__class__.__name__} does not provide image volumes.")
+        return VolumeMetadata.from_image(img)
+
+    def read_points(self, xyz_mm: np.ndarray, **kwargs) -> np.ndarray:
+        """
+        Values of the image that fetch() returns for the same arguments at the
+        given physical coordinates (N x 3 array). Providers which can read
+        single voxels without fetching the whole image override this.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support point readout.")
+
+    @staticmethod
+    def _load_metadata(key: str, compute: Callable[[], VolumeMetadata]) -> VolumeMetadata:
+        """
+        Return metadata persisted in the local cache under the given key,
+        computing and storing it if not yet available.
+        """
+        cachefile = cache.CACHE.build_filename(f"{key} metadata", suffix=".json")
+        if os.path.isfile(cachefile):
+            try:
+                with open(cachefile, "r") as f:
+                    result = VolumeMetadata.from_json(json.load(f))
+                cache.CACHE.touch(cachefile)
+                return result
+            except (ValueError, KeyError):
+                logger.debug(f"Ignoring invalid metadata cache file {cachefile}")
+        result = compute()
+        cache.CACHE.ensure_folder(cachefile)
+        with open(f"{cachefile}_temp", "w") as f:
+            json.dump(result.to_json(), f)
+        os.replace(f"{cachefile}_temp", cachefile)
+        cache.CACHE.register(cachefile)
+        return result
+
     @property
     @abstractmethod
     def _url(self) -> Union[str, Dict[str, str]]:
@@ -303,6 +407,10 @@ class SubvolumeProvider(VolumeProvider, srctype="subvolume"):
     def boundingbox(self) -> _boundingbox.BoundingBox:
         return self.provider.boundingbox
 
+    def get_metadata(self, **kwargs) -> VolumeMetadata:
+        meta = self.provider.get_metadata(**kwargs)
+        return VolumeMetadata(meta.shape[:3], meta.affine, meta.dtype)
+
     def fetch(self, **kwargs):
         # activate caching at the caller using "with SubvolumeProvider.UseCaching():""
         if self.__class__._USE_CACHING:
@@ -0,0 +1,118 @@
+from siibra.retrieval.cache import Cache, CacheIndex
+
+import os
+import pytest
+
+
+@pytest.fixture
+def tmp_cache(tmp_path):
+    cache = Cache.__new__(Cache)
+    cache.folder = str(tmp_path)
+    cache._index_cached = None
+    yield cache
+    if cache._index_cached is not None:
+        cache._index_cached.close()
+
+
+def write_entry(cache: Cache, name: str, nbytes: int):
+    fn = os.path.join(cache.folder, name)
+    with open(fn, "wb") as f:
+        f.write(b"0" * nbytes)
+    return fn
+
+
+def test_index_built_from_existing_folder(tmp_cache):
+    write_entry(tmp_cache, "foo", 100)
+    write_entry(tmp_cache, "bar", 50)
+    assert tmp_cache.index.total_size() == 150
+    assert sorted(os.path.basename(f) for f in tmp_cache) == ["bar", "foo"]
+    assert not any(CacheIndex.FILENAME in f for f in tmp_cache)
+
+
+def test_register_and_touch(tmp_cache):
+    _ = tmp_cache.index
+    fn = write_entry(tmp_cache, "foo", 10)
+    tmp_cache.register(fn, url="http://foo.co/bar")
+    size, atime, url = tmp_cache.index.get(fn)
+    assert (size, url) == (10, "http://foo.co/bar")
+    tmp_cache.touch(fn)
+    assert tmp_cache.index.get(fn)[1] >= atime
+    # re-registering keeps the origin url
+    tmp_cache.register(fn)
+    assert tmp_cache.index.get(fn)[2] == "http://foo.co/bar"
+
+
+def test_maintenance_removes_least_recently_used(tmp_cache):
+    _ = tmp_cache.index
+    files = [write_entry(tmp_cache, name, 1024) for name in ["a", "b", "c"]]
+    for fn in files:
+        tmp_cache.register(fn)
+    tmp_cache.touch(files[0])
+    tmp_cache.SIZE_GIB = 2048 / 1024**3
+    tmp_cache.run_maintenance()
+    assert [os.path.isfile(fn) for fn in files] == [True, False, True]
+    assert tmp_cache.index.total_size() == 2048
+
+
+def test_build_filename_is_sharded(tmp_cache):
+    fn = tmp_cache.build_filename("foo", suffix="npy")
+    basename = os.path.basename(fn)
+    assert basename.endswith(".npy")
+    assert os.path.dirname(fn) == os.path.join(tmp_cache.folder, basename[:2], basename[2:4])
+    # the shard folder is only created for writing
+    assert not os.path.exists(os.path.dirname(fn))
+    tmp_cache.ensure_folder(fn)
+    assert os.path.isdir(os.path.dirname(fn))
+
+
+def test_flat_entries_are_migrated(tmp_cache):
+    sharded = tmp_cache.build_filename("foo")
+    flatfile = write_entry(tmp_cache, os.path.basename(sharded), 10)
+    assert tmp_cache.index.total_size() == 10
+
+    assert tmp_cache.build_filename("foo") == sharded
+    assert os.path.isfile(sharded) and not os.path.exists(flatfile)
+    assert list(tmp_cache) == [sharded]
+
+    other = write_entry(tmp_cache, "0123abcd", 5)
+    tmp_cache.migrate()
+    assert not os.path.exists(other)
+    assert os.path.isfile(os.path.join(tmp_cache.folder, "01", "23", "0123abcd"))
+    assert tmp_cache.index.total_size() == 15
+
+
+def test_register_stores_validators(tmp_cache):
+    _ = tmp_cache.index
+    fn = write_entry(tmp_cache, "foo", 10)
+    assert tmp_cache.index.validators(fn) == (None, None)
+    tmp_cache.register(fn, url="http://foo.co/bar", etag='"abc"')
+    tmp_cache.register(fn, last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    assert tmp_cache.index.validators(fn) == ('"abc"', "Mon, 01 Jan 2024 00:00:00 GMT")
+
+
+def test_remove_deletes_companion_files(tmp_cache):
+    _ = tmp_cache.index
+    fn = write_entry(tmp_cache, "foo", 10)
+    tmp_cache.register(fn)
+    companions = [write_entry(tmp_cache, f"foo{suffix}", 0) for suffix in Cache.COMPANION_SUFFIXES]
+    other = write_entry(tmp_cache, "foobar.lock", 0)
+    tmp_cache.remove(fn)
+    assert not any(os.path.exists(f) for f in [fn, *companions])
+    assert os.path.isfile(other)
+    assert len(tmp_cache.index) == 0
+
+
+def test_orphaned_companion_files_are_removed(tmp_cache):
+    entry = write_entry(tmp_cache, "foo", 10)
+    lockfile = write_entry(tmp_cache, "foo_temp.lock", 0)
+    orphans = [write_entry(tmp_cache, name, 5) for name in ["bar_temp", "bar_temp.lock", "bar_temp.validator"]]
+    recent = write_entry(tmp_cache, "baz.lock", 0)
+    assert list(tmp_cache) == [entry]
+
+    old = os.stat(recent).st_mtime - 2 * Cache.ORPHAN_MAX_AGE
+    for fn in [lockfile, *orphans]:
+        os.utime(fn, (old, old))
+    tmp_cache.remove_orphans()
+    assert [os.path.exists(fn) for fn in [entry, lockfile, *orphans, recent]] == [
+        True, True, False, False, False, True
+    ]
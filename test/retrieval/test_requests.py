@@ -1,7 +1,27 @@
-from siibra.retrieval.requests import EbrainsRequest, HttpRequest, CACHE
+from siibra.retrieval.requests import (
+    EbrainsRequest,
+    HttpRequest,
+    MultiSourcedRequest,
+    SiibraHttpRequestError,
+    DECODERS,
+    FileDecoder,
+    decode_file,
+    decoder_name,
+    find_suitiable_decoder,
+    HttpRangeFile,
+    CACHE,
+    POOL,
+    prefetch,
+)
+from siibra.retrieval.connections import RETRY_POLICY
+from siibra.retrieval.exceptions import CircuitOpenError
+from siibra.retrieval.cache import MEMORY_CACHE, MAPPED_NBYTES, MemoryCache, estimate_nbytes
 
 import pytest
 import json
+import os
+import gzip
+import tempfile
 from itertools import product, repeat
 from unittest.mock import PropertyMock, patch, mock_open, MagicMock
 from contextlib import contextmanager
@@ -9,6 +29,12 @@ from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 
 import requests_mock
+from requests.exceptions import ChunkedEncodingError
+import numpy as np
+import pandas as pd
+from io import BytesIO
+from nibabel import Nifti1Image
+from nibabel.fileholders import FileHolder
 
 
 def test_device_flow():
@@ -35,11 +61,12 @@ http_test_retrieve_args = [*product([True, False], repeat=2)]
 def patch_all(post_flag=False, cache_flag=False):
     url = "http://foo.co/bar"
     response_text = "foo-bar"
-    return_filename = "foo-bar.txt"
 
     m_open = mock_open()
     rename_mock = MagicMock()
-    try:
+    # file locks are real files, so keep them out of the working directory
+    with tempfile.TemporaryDirectory() as tmpdir:
+        return_filename = os.path.join(tmpdir, "foo-bar.txt")
         with patch("builtins.open", m_open):
             with patch("os.rename", rename_mock):
                 with patch.object(
@@ -59,17 +86,10 @@ def patch_all(post_flag=False, cache_flag=False):
                                 req_mock.get(url, text=response_text)
 
                             yield req, m_open, rename_mock, pmock, build_filename_mock, response_text
-    finally:
-        pass
 
 
 @pytest.mark.parametrize("cache_flag, post_flag", http_test_retrieve_args)
 def test_httprequests_retrieve(cache_flag, post_flag):
-    response_text = "foo-bar"
-    return_filename = "foo-bar.txt"
-
-    m_open = mock_open()
-    rename_mock = MagicMock()
     with patch_all(post_flag=post_flag, cache_flag=cache_flag) as (
         req,
         m_open,
@@ -79,12 +99,13 @@ def test_httprequests_retrieve(cache_flag, post_flag):
         response_text,
     ):
         req._retrieve()
-        pmock.assert_called_once()
+        pmock.assert_called()
 
         if cache_flag:
             m_open.assert_not_called()
             return
 
+        return_filename = build_filename_mock.return_value
         m_open.assert_called_once_with(f"{return_filename}_temp", "wb")
         handle = m_open()
         handle.write.assert_called_once_with(response_text.encode("utf-8"))
@@ -101,8 +122,10 @@ test_filelock_args = [
 
 
 @pytest.mark.parametrize("filenames,presleeps,expected_indices", test_filelock_args)
-def test_file_lock_(filenames, presleeps, expected_indices):
+def test_file_lock_(filenames, presleeps, expected_indices, tmp_path):
     call_order = []
+    throttle_cachefile = str(tmp_path / throttle_filename)
+    filenames = [throttle_cachefile if fn == throttle_filename else fn for fn in filenames]
 
     def exec_retrieve(
         req: HttpRequest, overwrite_cachefile=None, presleep=None, index=None
@@ -116,7 +139,7 @@ def test_file_lock_(filenames, presleeps, expected_indices):
         return index
 
     def rename_mock_side_effect(oldname, newname):
-        if newname == throttle_filename:
+        if newname == throttle_cachefile:
             sleep(1)
 
     with patch_all() as (
@@ -141,3 +164,442 @@ def test_file_lock_(filenames, presleeps, expected_indices):
             )
         assert call_order[0] == expected_indices[0]
         assert call_order[1] == expected_indices[1]
+
+
+def test_httprequests_use_connection_pool():
+    with patch_all() as (req, *_):
+        with patch.object(POOL, "get", wraps=POOL.get) as get_mock:
+            req._retrieve()
+            get_mock.assert_called_once()
+
+
+def test_revalidate_keeps_unmodified_content():
+    with patch_all(cache_flag=True) as (req, m_open, rename_mock, *_):
+        req.revalidate = True
+        with requests_mock.Mocker() as req_mock:
+            req_mock.get(req.url, status_code=304)
+            with patch.object(CACHE.index, "validators", return_value=('"abc"', None)):
+                with patch.object(CACHE, "touch") as touch_mock:
+                    req._retrieve()
+            assert req_mock.last_request.headers["If-None-Match"] == '"abc"'
+            assert "If-Modified-Since" not in req_mock.last_request.headers
+        touch_mock.assert_called_once_with(req.cachefile)
+        m_open.assert_not_called()
+        rename_mock.assert_not_called()
+        assert not req.revalidate
+
+
+def test_revalidate_replaces_modified_content():
+    with patch_all(cache_flag=True) as (req, m_open, rename_mock, *_):
+        req.revalidate = True
+        with requests_mock.Mocker() as req_mock:
+            req_mock.get(req.url, text="new", headers={"ETag": '"def"'})
+            with patch.object(CACHE.index, "validators", return_value=(None, "Mon, 01 Jan 2024 00:00:00 GMT")):
+                with patch.object(CACHE, "register") as register_mock:
+                    with patch("os.path.isfile", return_value=False):
+                        req._retrieve()
+            assert req_mock.last_request.headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        rename_mock.assert_called_once()
+        register_mock.assert_called_once_with(
+            req.cachefile, url=req.url, etag='"def"', last_modified=None
+        )
+        assert not req.revalidate
+
+
+def mock_response(status_code=200, headers=None, chunks=(), error=None):
+    response = MagicMock(status_code=status_code, ok=status_code < 400, headers=headers or {})
+
+    def iter_content(block_size):
+        yield from chunks
+        if error is not None:
+            raise error
+
+    response.iter_content.side_effect = iter_content
+    return response
+
+
+def test_interrupted_download_is_resumed(tmp_path):
+    cachefile = str(tmp_path / "foo")
+    responses = [
+        mock_response(
+            headers={"Content-Length": "6", "Accept-Ranges": "bytes", "ETag": '"abc"'},
+            chunks=[b"foo"],
+            error=ChunkedEncodingError("connection lost"),
+        ),
+        mock_response(206, headers={"Content-Length": "3"}, chunks=[b"bar"]),
+    ]
+    with patch.object(CACHE, "build_filename", return_value=cachefile):
+        req = HttpRequest("http://foo.co/bar")
+    with patch.object(HttpRequest, "_open_stream", side_effect=responses) as open_mock:
+        with patch.object(CACHE, "register"):
+            req._retrieve()
+    assert open_mock.call_args_list[1].args[1:] == (3, '"abc"')
+    with open(cachefile, "rb") as f:
+        assert f.read() == b"foobar"
+
+
+def test_incomplete_download_raises_and_keeps_partial_file(tmp_path):
+    cachefile = str(tmp_path / "foo")
+    with patch.object(CACHE, "build_filename", return_value=cachefile):
+        req = HttpRequest("http://foo.co/bar")
+    response = mock_response(
+        headers={"Content-Length": "6", "Accept-Ranges": "bytes", "ETag": '"abc"'}, chunks=[b"foo"]
+    )
+    with patch.object(HttpRequest, "_open_stream", return_value=response):
+        with pytest.raises(SiibraHttpRequestError):
+            req._retrieve()
+    assert not req.cached
+    # the next attempt requests the missing bytes only, if unchanged
+    response = mock_response(206, headers={"Content-Length": "3"}, chunks=[b"bar"])
+    with patch.object(HttpRequest, "_open_stream", return_value=response) as open_mock:
+        with patch.object(CACHE, "register"):
+            req._retrieve()
+    assert open_mock.call_args.args[1:] == (3, '"abc"')
+    with open(cachefile, "rb") as f:
+        assert f.read() == b"foobar"
+    assert not (tmp_path / "foo_temp.validator").exists()
+
+
+def test_partial_download_of_changed_resource_is_discarded(tmp_path):
+    cachefile = str(tmp_path / "foo")
+    with patch.object(CACHE, "build_filename", return_value=cachefile):
+        req = HttpRequest("http://foo.co/bar")
+    with requests_mock.Mocker() as req_mock:
+        req_mock.get(req.url, headers={"Content-Length": "6", "Accept-Ranges": "bytes", "ETag": '"old"'}, content=b"AAA")
+        with pytest.raises(SiibraHttpRequestError):
+            req._retrieve()
+
+        # the server ignores the range since the ETag does not match anymore
+        req_mock.get(req.url, headers={"Accept-Ranges": "bytes", "ETag": '"new"'}, content=b"BBBBBB")
+        with patch.object(CACHE, "register"):
+            req._retrieve()
+        assert req_mock.last_request.headers["Range"] == "bytes=3-"
+        assert req_mock.last_request.headers["If-Range"] == '"old"'
+    with open(cachefile, "rb") as f:
+        assert f.read() == b"BBBBBB"
+
+    # partial downloads without a validator are not resumed
+    req.refresh = True
+    with open(f"{cachefile}_temp", "wb") as f:
+        f.write(b"AAA")
+    with requests_mock.Mocker() as req_mock:
+        req_mock.get(req.url, content=b"CCCCCC")
+        with patch.object(CACHE, "register"):
+            req._retrieve()
+        assert "Range" not in req_mock.last_request.headers
+    with open(cachefile, "rb") as f:
+        assert f.read() == b"CCCCCC"
+
+
+def test_concurrent_retrievals_are_coalesced(tmp_path):
+    cachefile = str(tmp_path / "foo")
+
+    def open_stream(*args, **kwargs):
+        sleep(0.2)
+        return mock_response(headers={"Content-Length": "3"}, chunks=[b"foo"])
+
+    with patch.object(CACHE, "build_filename", return_value=cachefile):
+        reqs = [HttpRequest("http://foo.co/bar") for _ in range(4)]
+    with patch.object(HttpRequest, "_open_stream", side_effect=open_stream) as open_mock:
+        with patch.object(CACHE, "register"):
+            with ThreadPoolExecutor(max_workers=4) as ex:
+                _ = list(ex.map(HttpRequest._retrieve, reqs))
+    open_mock.assert_called_once()
+    assert all(req.cached for req in reqs)
+
+
+def test_adaptive_block_size():
+    assert HttpRequest._adaptive_block_size(None) == HttpRequest.MIN_BLOCK_SIZE
+    assert HttpRequest._adaptive_block_size(1024) == HttpRequest.MIN_BLOCK_SIZE
+    assert HttpRequest._adaptive_block_size(10 * 1024**3) == HttpRequest.MAX_BLOCK_SIZE
+
+
+def test_connection_pool_configure():
+    session = POOL.session
+    maxsize = POOL.POOL_MAXSIZE
+    try:
+        POOL.configure(pool_maxsize=maxsize + 1)
+        assert POOL.session is not session
+        assert POOL.session.get_adapter("https://foo.co").poolmanager.connection_pool_kw["maxsize"] == maxsize + 1
+    finally:
+        POOL.configure(pool_maxsize=maxsize)
+
+
+@pytest.fixture
+def retry_policy():
+    RETRY_POLICY.reset()
+    with patch("siibra.retrieval.connections.sleep") as sleep_mock:
+        yield RETRY_POLICY, sleep_mock
+    RETRY_POLICY.reset()
+
+
+def test_pool_retries_transient_errors(retry_policy):
+    _, sleep_mock = retry_policy
+    url = "http://foo.co/retry"
+    with requests_mock.Mocker() as req_mock:
+        req_mock.get(url, [
+            {"status_code": 503},
+            {"status_code": 429, "headers": {"Retry-After": "2"}},
+            {"status_code": 200, "text": "foo"},
+        ])
+        r = POOL.get(url)
+        assert r.text == "foo"
+        assert req_mock.call_count == 3
+    assert sleep_mock.call_count == 2
+    assert sleep_mock.call_args.args[0] == 2.
+
+
+def test_pool_does_not_retry_post(retry_policy):
+    url = "http://foo.co/retry"
+    with requests_mock.Mocker() as req_mock:
+        req_mock.post(url, status_code=503)
+        assert POOL.post(url).status_code == 503
+        assert req_mock.call_count == 1
+
+
+def test_circuit_breaker_fails_fast(retry_policy):
+    policy, _ = retry_policy
+    url = "http://foo.co/down"
+    with requests_mock.Mocker() as req_mock:
+        req_mock.get(url, status_code=502)
+        with patch.object(policy, "MAX_RETRIES", policy.BREAKER_THRESHOLD - 1):
+            assert POOL.get(url).status_code == 502
+        assert policy.breaker(url).is_open
+        calls = req_mock.call_count
+        with pytest.raises(CircuitOpenError):
+            POOL.get(url)
+        assert req_mock.call_count == calls
+
+
+def test_multisourced_request_skips_open_circuits(retry_policy):
+    policy, _ = retry_policy
+    with patch.object(HttpRequest, "get", autospec=True, side_effect=lambda req: req.url) as get_mock:
+        breaker = policy.breaker("http://down.co/foo")
+        for _ in range(policy.BREAKER_THRESHOLD):
+            breaker.record_failure()
+        req = MultiSourcedRequest([HttpRequest("http://down.co/foo"), HttpRequest("http://up.co/foo")])
+        assert req.get() == "http://up.co/foo"
+        get_mock.assert_called_once()
+
+
+def test_prefetch_reports_errors():
+    ok_url, bad_url = "http://foo.co/ok", "http://foo.co/bad"
+    with patch.object(HttpRequest, "cached", new_callable=PropertyMock, return_value=False):
+        loaders = [("ok", HttpRequest(ok_url)), ("bad", HttpRequest(bad_url))]
+
+        def retrieve(self):
+            if self.url == bad_url:
+                raise RuntimeError("failed")
+
+        with patch.object(HttpRequest, "_retrieve", autospec=True, side_effect=retrieve) as retrieve_mock:
+            errors = prefetch(loaders, max_workers=2)
+    assert retrieve_mock.call_count == 2
+    assert list(errors.keys()) == [bad_url]
+
+
+def test_prefetch_skips_cached():
+    with patch.object(HttpRequest, "cached", new_callable=PropertyMock, return_value=True):
+        with patch.object(HttpRequest, "_retrieve") as retrieve_mock:
+            assert prefetch([HttpRequest("http://foo.co/bar")]) == {}
+            retrieve_mock.assert_not_called()
+
+
+def test_memory_cache_decodes_once():
+    decoder = MagicMock(return_value=np.zeros(10))
+    with patch.object(MEMORY_CACHE, "maxsize_bytes", 1024), patch.dict(DECODERS, {".foo": decoder}):
+        MEMORY_CACHE.clear()
+        with patch_all(cache_flag=True) as (req, *_):
+            req.func = decoder
+            first = req.get()
+            second = req.get()
+        MEMORY_CACHE.clear()
+    decoder.assert_called_once()
+    assert first is second
+
+
+def test_memory_cache_keys_on_decoder_name():
+    assert decoder_name(None) == ""
+    assert decoder_name(DECODERS[".json"]) == ".json"
+    assert decoder_name(find_suitiable_decoder("http://foo.co/a.json.gz")) == ".json.gz"
+    assert decoder_name(find_suitiable_decoder("a.nii.gz", keep_decompressed=True)) == ".nii.gz decompressed"
+    assert decoder_name(np.load) == "numpy.load"
+    # decoders created by the caller cannot be told apart, and are not cached
+    decoders = [(lambda i: (lambda b: np.full(2, i)))(i) for i in range(2)]
+    assert decoder_name(decoders[0]) is None
+    with patch.object(MEMORY_CACHE, "maxsize_bytes", 1024):
+        MEMORY_CACHE.clear()
+        with patch_all(cache_flag=True) as (req, *_):
+            results = []
+            for decoder in decoders:
+                req.func = decoder
+                results.append(req.get())
+            assert len(MEMORY_CACHE._items) == 0
+        MEMORY_CACHE.clear()
+    assert [r.tolist() for r in results] == [[0, 0], [1, 1]]
+
+
+def test_memory_cache_objects_are_not_modified_by_callers():
+    memcache = MemoryCache(maxsize_bytes=10**6)
+    memcache.put("arr", np.zeros(10))
+    with pytest.raises(ValueError):
+        memcache.get("arr")[0] = 1
+    df = pd.DataFrame({"a": [1, 2]})
+    memcache.put("df", df)
+    cached = memcache.get("df")
+    cached.loc[0, "a"] = 5
+    assert memcache.get("df").loc[0, "a"] == 1
+
+
+def test_memory_cache_lru_eviction():
+    memcache = MemoryCache(maxsize_bytes=200)
+    memcache.put("a", np.zeros(10))  # 80 bytes
+    memcache.put("b", np.zeros(10))
+    assert memcache.get("a") is not None  # "b" is now least recently used
+    memcache.put("c", np.zeros(10))
+    assert memcache.get("b") is None
+    assert memcache.get("a") is not None and memcache.get("c") is not None
+    memcache.put("d", np.zeros(100))  # exceeds the budget, never cached
+    assert memcache.get("d") is None
+
+
+def test_estimate_nbytes():
+    assert estimate_nbytes(np.zeros((2, 3), dtype="float32")) == 24
+    assert estimate_nbytes(Nifti1Image(np.zeros((2, 2, 2), dtype="uint8"), np.eye(4))) == 8
+    assert estimate_nbytes(BytesIO(b"foo")) is None
+
+
+def test_estimate_nbytes_of_data_on_disk(tmp_path):
+    arr = np.zeros((64, 64, 64), dtype="float32")
+    npyfile = str(tmp_path / "arr")
+    with open(npyfile, "wb") as f:
+        np.save(f, arr)
+    assert estimate_nbytes(decode_file(npyfile, DECODERS[".npy"])) == MAPPED_NBYTES
+    niifile = str(tmp_path / "img")
+    Nifti1Image(arr, np.eye(4)).to_filename(f"{niifile}.nii")
+    os.rename(f"{niifile}.nii", niifile)
+    assert estimate_nbytes(decode_file(niifile, DECODERS[".nii"])) == MAPPED_NBYTES
+
+
+def test_file_decoders_read_from_disk(tmp_path):
+    arr = np.arange(24, dtype="float32").reshape(2, 3, 4)
+
+    npyfile = str(tmp_path / "arr")  # cache files have no suffix
+    with open(npyfile, "wb") as f:
+        np.save(f, arr)
+    loaded = decode_file(npyfile, DECODERS[".npy"])
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, arr)
+
+    niifile = str(tmp_path / "img")
+    with open(niifile, "wb") as f:
+        f.write(Nifti1Image(arr, np.eye(4)).to_bytes())
+    img = decode_file(niifile, DECODERS[".nii"])
+    assert img.dataobj.is_proxy
+    # the proxy holds no open file
+    assert img.dataobj.file_like == niifile
+    assert np.array_equal(np.asanyarray(img.dataobj), arr)
+
+    # memory-mapped data does not change if the cache entry is removed
+    loaded = decode_file(npyfile, DECODERS[".npy"])
+    os.remove(npyfile)
+    assert np.array_equal(loaded, arr)
+    with open(npyfile, "wb") as f:
+        np.save(f, arr)
+
+    # byte decoders still work
+    with open(npyfile, "rb") as f:
+        assert np.array_equal(DECODERS[".npy"](f.read()), arr)
+
+
+def test_keep_decompressed_nifti(tmp_path):
+    arr = np.arange(24, dtype="float32").reshape(2, 3, 4)
+    gzfile = str(tmp_path / "img")
+    with open(gzfile, "wb") as f:
+        f.write(gzip.compress(Nifti1Image(arr, np.eye(4)).to_bytes()))
+    copyfile = str(tmp_path / "copy")
+
+    decoder = find_suitiable_decoder("http://foo.co/img.nii.gz", keep_decompressed=True)
+    with patch.object(CACHE, "build_filename", return_value=copyfile):
+        with patch.object(CACHE, "register") as register_mock, patch.object(CACHE, "touch"):
+            img = decode_file(gzfile, decoder)
+            _ = decode_file(gzfile, decoder)
+    register_mock.assert_called_once_with(copyfile)
+    assert img.dataobj.is_proxy and img.dataobj.file_like == copyfile
+    assert np.array_equal(np.asanyarray(img.dataobj), arr)
+    # without the option, the image is decompressed in memory
+    img = decode_file(gzfile, find_suitiable_decoder("http://foo.co/img.nii.gz"))
+    assert not isinstance(img.dataobj.file_like, str)
+
+
+def test_gzip_index_requires_indexed_gzip():
+    with patch("siibra.retrieval.requests.IndexedGzipFile", None):
+        assert find_suitiable_decoder("http://foo.co/img.nii.gz") is not None
+        with pytest.raises(ImportError):
+            find_suitiable_decoder("http://foo.co/img.nii.gz", gzip_index=True)
+
+
+def test_indexed_gzip_nifti(tmp_path):
+    pytest.importorskip("indexed_gzip")
+    arr = np.random.rand(20, 30, 40).astype("float32")
+    gzfile = str(tmp_path / "img")
+    with open(gzfile, "wb") as f:
+        f.write(gzip.compress(Nifti1Image(arr, np.eye(4)).to_bytes()))
+    indexfile = str(tmp_path / "img.gzidx")
+
+    # the index is only built on request
+    assert not isinstance(find_suitiable_decoder("http://foo.co/img.nii.gz"), FileDecoder)
+    decoder = find_suitiable_decoder("http://foo.co/img.nii.gz", gzip_index=True)
+    with patch.object(CACHE, "build_filename", return_value=indexfile):
+        with patch.object(CACHE, "register") as register_mock, patch.object(CACHE, "touch"):
+            img = decode_file(gzfile, decoder)
+            _ = decode_file(gzfile, decoder)
+    register_mock.assert_called_once_with(indexfile)
+    assert img.dataobj.is_proxy
+    assert img.dataobj[3, 4, 5] == arr[3, 4, 5]
+    assert np.array_equal(img.dataobj[5:10, 0:3, 20:], arr[5:10, 0:3, 20:])
+
+
+def test_http_range_file_reads_partially(tmp_path):
+    arr = np.random.rand(20, 30, 40).astype("float32")
+    content = Nifti1Image(arr, np.eye(4)).to_bytes()
+    url = "http://foo.co/img.nii"
+
+    def serve_range(request, context):
+        start, stop = map(int, request.headers["Range"][len("bytes="):].split("-"))
+        context.status_code = 206
+        return content[start:stop + 1]
+
+    with requests_mock.Mocker() as req_mock:
+        req_mock.head(url, headers={"Accept-Ranges": "bytes", "Content-Length": str(len(content))})
+        req_mock.get(url, content=serve_range)
+        with patch.object(CACHE, "build_filename", return_value=str(tmp_path / "img")):
+            with patch.object(CACHE, "register"), patch.object(CACHE, "touch"):
+                f = HttpRangeFile(url, block_size=4096)
+                holder = FileHolder(fileobj=f)
+                img = Nifti1Image.from_file_map({"header": holder, "image": holder})
+                assert img.shape == arr.shape
+                assert np.array_equal(img.dataobj[:, :, 5], arr[:, :, 5])
+                ranges = [r.headers["Range"] for r in req_mock.request_history if r.method == "GET"]
+                fetched = sum(f._blocks) * 4096
+                assert fetched < len(content) / 10
+                # blocks are reused, also by new file objects
+                f2 = HttpRangeFile(url, block_size=4096)
+                f2.seek(f.tell() - 10)
+                _ = f2.read(10)
+                assert [r.headers["Range"] for r in req_mock.request_history if r.method == "GET"] == ranges
+
+
+def test_http_range_file_registers_disk_usage(tmp_path):
+    size = 64 * 1024**2
+    url = "http://foo.co/large.nii"
+    with requests_mock.Mocker() as req_mock:
+        req_mock.head(url, headers={"Accept-Ranges": "bytes", "Content-Length": str(size)})
+        req_mock.get(url, status_code=206, content=b"x" * 4096)
+        with patch.object(CACHE, "build_filename", return_value=str(tmp_path / "large")):
+            with patch.object(CACHE, "_index_cached", MagicMock()) as index_mock, patch.object(CACHE, "touch"):
+                f = HttpRangeFile(url, block_size=4096)
+                assert f.read(10) == b"x" * 10
+    sizes = [c.args[1] for c in index_mock.add.call_args_list if c.args[0] == f.datafile]
+    # registered when created and updated after fetching the block
+    assert len(sizes) == 2
+    assert sizes[-1] < 1024**2
@@ -0,0 +1,277 @@
+import hashlib
+import os
+from threading import get_ident
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+import nibabel as nib
+import numpy as np
+import pytest
+import requests_mock
+
+from siibra.core.space import Space
+from siibra.retrieval.cache import CACHE, CHUNK_CACHE
+from siibra.retrieval.connections import POOL
+from siibra.volumes.neuroglancer import (
+    NeuroglancerProvider,
+    NeuroglancerVolume,
+    NeuroglancerScale,
+    NeuroglancerChunkStore,
+    PooledHttpAccessor,
+    PooledShardedHttpAccessor,
+    pooled_http_accessor,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_space_registry():
+    # bounding boxes without a space do not need the configuration
+    with patch.object(Space, "get_instance", return_value=None):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def empty_chunk_cache():
+    CHUNK_CACHE.clear()
+    yield
+    CHUNK_CACHE.clear()
+
+
+@pytest.fixture
+def tmp_cachefiles(tmp_path):
+    def build_filename(str_rep, suffix=None):
+        return str(tmp_path / (hashlib.sha256(str_rep.encode()).hexdigest() + (suffix or "")))
+
+    with patch.object(CACHE, "build_filename", side_effect=build_filename):
+        with patch.object(CACHE, "register"), patch.object(CACHE, "touch"):
+            yield tmp_path
+
+
+@pytest.fixture
+def arr_xyz():
+    return np.random.randint(0, 255, (20, 25, 30)).astype("uint8")
+
+
+@pytest.fixture
+def ngvolume(arr_xyz):
+    """NeuroglancerVolume serving chunks of arr_xyz from memory."""
+    threads = set()
+
+    def read_chunk(key, bounds):
+        threads.add(get_ident())
+        sleep(0.005)  # simulate network latency
+        x0, x1, y0, y1, z0, z1 = bounds
+        return arr_xyz[x0:x1, y0:y1, z0:z1].T[None]
+
+    scaleinfo = {
+        "chunk_sizes": [[8, 8, 8]],
+        "encoding": "raw",
+        "key": "1um",
+        "resolution": [1e3, 1e3, 1e3],
+        "size": list(arr_xyz.shape),
+        "voxel_offset": [0, 0, 0],
+    }
+    volume = NeuroglancerVolume("http://foo.co/precomputed")
+    volume._io = MagicMock(info={"data_type": "uint8", "scales": [scaleinfo]})
+    volume._io.read_chunk.side_effect = read_chunk
+    volume._transform_nm = np.identity(4)
+    volume._scales_cached = [NeuroglancerScale(volume, scaleinfo)]
+    volume.threads = threads
+    return volume
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_fetch_assembles_chunks(ngvolume, arr_xyz, max_workers):
+    with patch.object(NeuroglancerVolume, "MAX_WORKERS", max_workers), patch.object(CHUNK_CACHE, "maxsize_bytes", 0):
+        img = ngvolume.fetch()
+    # the image keeps the zyx layout of the chunks, the affine swaps the axes
+    assert np.array_equal(np.asanyarray(img.dataobj), arr_xyz.T)
+    assert ngvolume._io.read_chunk.call_count == 3 * 4 * 4
+    assert (len(ngvolume.threads) > 1) == (max_workers > 1)
+
+
+def test_fetch_propagates_chunk_errors(ngvolume):
+    ngvolume._io.read_chunk.side_effect = IOError("chunk missing")
+    with pytest.raises(IOError):
+        ngvolume.fetch()
+
+
+def test_chunk_cache_serves_overlapping_fetches(ngvolume, arr_xyz):
+    ngvolume.fetch()
+    assert ngvolume._io.read_chunk.call_count == 3 * 4 * 4
+    img = ngvolume.fetch()
+    assert ngvolume._io.read_chunk.call_count == 3 * 4 * 4
+    assert np.array_equal(np.asanyarray(img.dataobj), arr_xyz.T)
+
+    # only the most recently used chunks are kept within the byte budget
+    with patch.object(CHUNK_CACHE, "maxsize_bytes", 8**3 * 4):
+        CHUNK_CACHE.clear()
+        ngvolume.fetch()
+        assert CHUNK_CACHE._nbytes <= 8**3 * 4
+        ngvolume.scales[0]._read_chunk(0, 0, 0)
+    assert ngvolume._io.read_chunk.call_count == 2 * 3 * 4 * 4 + 1
+
+
+def test_chunk_store_packs_chunks_into_shards(ngvolume, arr_xyz, tmp_cachefiles, tmp_path):
+    scale = ngvolume.scales[0]
+    with patch.object(NeuroglancerVolume, "USE_CACHE", True), patch.object(NeuroglancerChunkStore, "SHARD_SIZE", 2):
+        ngvolume.fetch()
+        assert len(list(tmp_cachefiles.glob("*.shard"))) == 2 * 2 * 2
+        CHUNK_CACHE.clear()
+        img = ngvolume.fetch()
+        assert ngvolume._io.read_chunk.call_count == 3 * 4 * 4
+        assert np.array_equal(np.asanyarray(img.dataobj), arr_xyz.T)
+
+        bundle = str(tmp_path / "bundle.zip")
+        assert scale.export_chunks(bundle) == 8
+        for f in tmp_cachefiles.glob("*.shard"):
+            f.unlink()
+        assert scale.chunkstore.get(2, 3, 3) is None
+        store = NeuroglancerChunkStore.import_bundle(bundle)
+        assert (store.url, store.key) == (ngvolume.url, scale.key)
+        assert np.array_equal(store.get(2, 3, 3), arr_xyz[16:, 24:, 24:].T)
+
+
+def test_chunk_store_ignores_invalid_shards(tmp_cachefiles):
+    store = NeuroglancerChunkStore("http://foo.co/precomputed", "1um")
+    chunk = np.arange(24, dtype="int16").reshape(2, 3, 4)
+    store.put(0, 0, 1, chunk)
+    assert store.get(0, 0, 0) is None
+    assert np.array_equal(store.get(0, 0, 1), chunk)
+    with open(store.shardfile(0, 0, 0), "r+b") as f:
+        f.write(b"garbage")
+    assert store.get(0, 0, 1) is None
+    store.put(0, 0, 1, chunk)
+    assert np.array_equal(store.get(0, 0, 1), chunk)
+
+
+def test_chunk_store_overwrites_chunks_in_place(tmp_cachefiles):
+    store = NeuroglancerChunkStore("http://foo.co/precomputed", "1um")
+    chunk = np.arange(24, dtype="int16").reshape(2, 3, 4)
+    shardfile = store.shardfile(0, 0, 0)
+    store.put(0, 0, 1, chunk)
+    size = os.path.getsize(shardfile)
+    store.put(0, 0, 1, chunk)
+    store.put(0, 0, 1, np.zeros_like(chunk))
+    assert os.path.getsize(shardfile) == size
+    assert np.array_equal(store.get(0, 0, 1), np.zeros_like(chunk))
+    # data which does not fit is appended
+    store.put(0, 0, 1, chunk * 1000)
+    assert os.path.getsize(shardfile) > size
+    assert np.array_equal(store.get(0, 0, 1), chunk * 1000)
+
+
+def test_read_points_loads_touched_chunks_only(ngvolume, arr_xyz):
+    # voxel size is 1um = 1e-3mm
+    ijk = np.array([[0, 0, 0], [3, 4, 5], [19, 24, 29], [17, 9, 2]])
+    xyz_mm = np.r_[ijk, [[-1, 0, 0], [20, 0, 0]]] * 1e-3
+    values = ngvolume.read_points(xyz_mm)
+    assert values.tolist() == [*arr_xyz[tuple(ijk.T)], 0, 0]
+    assert ngvolume._io.read_chunk.call_count == 3
+
+    provider = NeuroglancerProvider.__new__(NeuroglancerProvider)
+    provider._fragments = {None: ngvolume}
+    label = arr_xyz[3, 4, 5]
+    assert provider.read_points(xyz_mm[:2], label=label).tolist() == [arr_xyz[0, 0, 0] == label, 1]
+
+
+def test_lazy_array_slicing(ngvolume, arr_xyz):
+    arr = ngvolume.get_array()
+    assert (arr.shape, arr.dtype) == (arr_xyz.shape, arr_xyz.dtype)
+    assert np.array_equal(arr.affine, np.diag([1e-3, 1e-3, 1e-3, 1]))
+    assert ngvolume._io.read_chunk.call_count == 0
+
+    for key in [
+        (slice(2, 5), slice(3, 11), 7),
+        (..., -1),
+        (slice(None, None, 3), slice(20, 2, -5)),
+        (4, 5, 6),
+        slice(7, 7),
+    ]:
+        assert np.array_equal(arr[key], arr_xyz[key])
+    assert np.array_equal(np.asarray(arr), arr_xyz)
+    with pytest.raises(IndexError):
+        arr[20]
+
+
+def test_lazy_array_blocks(ngvolume, arr_xyz):
+    arr = ngvolume.get_array()
+    result = np.zeros_like(arr_xyz)
+    with patch.object(CHUNK_CACHE, "maxsize_bytes", 0):
+        for block, data in arr.iter_blocks((10, 16, 30)):
+            assert data.shape[1] <= 16 and all(s.start % 8 == 0 for s in block)
+            result[block] = data
+        # aligned blocks read every chunk once
+        assert ngvolume._io.read_chunk.call_count == 3 * 4 * 4
+    assert np.array_equal(result, arr_xyz)
+
+
+def test_fetch_to_memmap(ngvolume, arr_xyz, tmp_cachefiles, tmp_path):
+    expected = ngvolume.fetch()
+    with patch.object(NeuroglancerVolume, "MAX_GiB", 0):
+        with pytest.raises(RuntimeError):
+            ngvolume.fetch()
+        filename = str(tmp_path / "out.nii")
+        img = ngvolume.fetch(memmap=filename)
+        assert isinstance(img.dataobj, nib.arrayproxy.ArrayProxy)
+        assert np.array_equal(np.asanyarray(img.dataobj), arr_xyz)
+        # same physical geometry as the image assembled in memory
+        assert np.allclose(img.affine, expected.affine[:, [2, 1, 0, 3]])
+        assert np.array_equal(nib.load(filename).get_fdata(), arr_xyz)
+
+        calls = ngvolume._io.read_chunk.call_count
+        cached = ngvolume.fetch(memmap=True)
+        assert cached.get_filename().startswith(str(tmp_cachefiles))
+        assert np.array_equal(np.asanyarray(ngvolume.fetch(memmap=True).dataobj), arr_xyz)
+        assert ngvolume._io.read_chunk.call_count == calls
+
+
+@pytest.mark.parametrize("suffix", ["", ".nii.gz", ".img"])
+def test_fetch_to_memmap_rejects_other_suffixes(ngvolume, tmp_path, suffix):
+    filename = str(tmp_path / f"out{suffix}")
+    with pytest.raises(ValueError):
+        ngvolume.fetch(memmap=filename)
+    assert not list(tmp_path.iterdir())
+    assert ngvolume._io.read_chunk.call_count == 0
+
+
+def test_read_points_with_voxel_offset(ngvolume, arr_xyz):
+    offset = np.array([5, 3, 9])
+    ngvolume.scales[0].voxel_offset = offset
+
+    def read_chunk(key, bounds):
+        # chunks are named by their position in the voxel space of the volume
+        x0, x1, y0, y1, z0, z1 = np.array(bounds) - np.repeat(offset, 2)
+        return arr_xyz[x0:x1, y0:y1, z0:z1].T[None]
+
+    ngvolume._io.read_chunk.side_effect = read_chunk
+    idx = np.array([[0, 0, 0], [3, 4, 5], [19, 24, 29], [8, 16, 24]])
+    ijk = np.r_[idx + offset, [[0, 0, 0], [25, 27, 38]]]
+    values = ngvolume.read_points(ijk * 1e-3)
+    assert values.tolist() == [*arr_xyz[tuple(idx.T)], 0, 0]
+    assert ngvolume._io.read_chunk.call_args_list[0][0][1] == (5, 13, 3, 11, 9, 17)
+
+    # points and fetched images agree on the position of the data
+    img = ngvolume.fetch()
+    assert np.allclose(img.affine[:3, 3], offset * 1e-3)
+    data = np.asanyarray(img.dataobj)
+    vox = np.round(np.dot(np.linalg.inv(img.affine), np.c_[ijk * 1e-3, np.ones(len(ijk))].T)[:3].T).astype("int")
+    inside = np.all((vox >= 0) & (vox < data.shape), axis=1)
+    assert inside.tolist() == [True] * 4 + [False] * 2
+    assert values[:4].tolist() == data[tuple(vox[inside].T)].tolist()
+
+
+def test_http_chunks_are_fetched_through_connection_pool():
+    url = "https://foo.co/vol"
+    accessor = pooled_http_accessor(url, {"scales": [{"key": "1mm"}]})
+    assert type(accessor) is PooledHttpAccessor
+    with requests_mock.Mocker() as m, patch.object(POOL, "request", wraps=POOL.request) as request_mock:
+        m.get(f"{url}/1mm/0-64_0-64_0-64", content=b"chunk")
+        assert accessor.fetch_chunk("1mm", (0, 64, 0, 64, 0, 64)) == b"chunk"
+    request_mock.assert_called_once_with("GET", f"{url}/1mm/0-64_0-64_0-64")
+
+    sharded_info = {"scales": [{"key": "1mm", "sharding": {"@type": "neuroglancer_uint64_sharded_v1"}}]}
+    accessor = pooled_http_accessor(url, sharded_info)
+    assert type(accessor) is PooledShardedHttpAccessor
+    assert accessor.info is sharded_info
+    assert accessor._session is POOL
@@ -0,0 +1,61 @@
+import gzip
+import hashlib
+from unittest.mock import patch
+
+import numpy as np
+import nibabel as nib
+import pytest
+import requests_mock
+
+from siibra.core.space import Space
+from siibra.retrieval.cache import CACHE
+from siibra.volumes.nifti import NiftiProvider
+
+
+@pytest.fixture(autouse=True)
+def no_space_registry():
+    # bounding boxes without a space do not need the configuration
+    with patch.object(Space, "get_instance", return_value=None):
+        yield
+
+
+@pytest.fixture
+def tmp_cachefiles(tmp_path):
+    def build_filename(str_rep, suffix=None):
+        return str(tmp_path / (hashlib.sha256(str_rep.encode()).hexdigest() + (suffix or "")))
+
+    with patch.object(CACHE, "build_filename", side_effect=build_filename):
+        with patch.object(CACHE, "register"), patch.object(CACHE, "touch"):
+            yield tmp_path
+
+
+def test_metadata_reads_remote_header_only(tmp_cachefiles):
+    url = "http://foo.co/img.nii.gz"
+    img = nib.Nifti1Image(np.random.rand(60, 70, 80).astype("float32"), np.diag([2, 2, 2, 1]))
+    with requests_mock.Mocker() as req_mock:
+        req_mock.get(url, content=gzip.compress(img.to_bytes()))
+        provider = NiftiProvider(url)
+        meta = provider.get_metadata()
+        assert meta.shape == img.shape
+        assert np.allclose(meta.affine, img.affine)
+        assert meta.dtype == np.dtype("float32")
+        assert not provider._img_loaders[None].__defaults__[0].cached
+        # the result is kept in the cache
+        _ = NiftiProvider(url).boundingbox
+        assert req_mock.call_count == 1
+
+
+def test_metadata_of_merged_fragments(tmp_path):
+    files = {}
+    for name, offset in [("left", 0), ("right", 10)]:
+        affine = np.identity(4)
+        affine[:3, 3] = [offset, 5, 0]
+        files[name] = str(tmp_path / f"{name}.nii")
+        nib.save(nib.Nifti1Image(np.ones((8, 6, 4), dtype="uint8"), affine), files[name])
+    provider = NiftiProvider(files)
+    meta = provider.get_metadata()
+    img = provider.fetch()
+    assert meta.shape == img.shape
+    assert np.allclose(meta.affine, img.affine)
+    assert meta.dtype == img.dataobj.dtype
+    assert provider.get_metadata(fragment="left").shape == (8, 6, 4)
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, PropertyMock
 from siibra.volumes.parcellationmap import Map, space, parcellation, MapType, MapIndex, ExcessiveArgumentException, InsufficientArgumentException, ConflictingArgumentException, NonUniqueIndexError
 from siibra.commons import Species
 from siibra.core.region import Region
@@ -8,6 +8,7 @@ from parameterized import parameterized
 import random
 from itertools import product
 import inspect
+import numpy as np
 
 
 class DummyCls:
@@ -350,3 +351,51 @@ class TestMap(unittest.TestCase):
                 self.assertIs(return_val, list(return_find_indicies.keys())[0])
             
             mock.assert_called_once_with(region)
+
+    def test_read_voxel(self):
+        arr = np.arange(24, dtype="float32").reshape(2, 3, 4)
+        dataobj = MagicMock()
+        dataobj.__getitem__.side_effect = lambda key: arr[key]
+        img = MagicMock(dataobj=dataobj)
+        with patch.object(Map, "fragments", new_callable=PropertyMock, return_value=None):
+            with patch.object(Map, "fetch_iter", return_value=[img]):
+                values = self.map._read_voxel(np.array([0, 1]), np.array([1, 2]), np.array([1, 3]))
+                self.assertEqual([v for *_, v in values], [arr[0, 1, 1], arr[1, 2, 3]])
+                # only the bounding box of the points is read
+                dataobj.__getitem__.assert_called_once_with((slice(0, 2), slice(1, 3), slice(1, 4)))
+
+                values = self.map._read_voxel(np.int64(1), np.int64(2), np.int64(3))
+                self.assertEqual(values, [(None, 0, None, arr[1, 2, 3])])
+
+    def test_read_points(self):
+        xyz = np.array([[0.0, 2.0, 2.0], [2.0, 4.0, 6.0]])
+        vol = MagicMock()
+        vol.read_points.return_value = np.array([5, 7])
+        with patch.object(Map, "fragments", new_callable=PropertyMock, return_value=None):
+            with patch.object(self.map, "volumes", [vol]):
+                values = self.map._read_points(xyz)
+                self.assertEqual(values, [(0, 0, None, 5), (1, 0, None, 7)])
+
+                # providers without point readout read the voxels of the fetched images
+                vol.read_points.side_effect = NotImplementedError
+                with patch.object(Map, "affine", new_callable=PropertyMock, return_value=np.diag([2, 2, 2, 1])):
+                    with patch.object(Map, "_read_voxel", return_value=[]) as read_voxel:
+                        self.map._read_points(xyz)
+                X, Y, Z = read_voxel.call_args[0]
+                self.assertEqual((X.tolist(), Y.tolist(), Z.tolist()), ([0, 1], [1, 2], [1, 3]))
+
+    def test_assign_points_from_point_arrays(self):
+        positions = np.array([[0.0, 2.0, 2.0], [2.0, 4.0, 6.0], [1.234, 5.678, 9.0]])
+        points = MagicMock(has_constant_sigma=True, sigma=[0.0])
+        points.warp.return_value.homogeneous = np.c_[positions, np.ones(3)]
+        point_arrays = (
+            np.array([0, 0, 2]), np.array([1, 3, 1]), np.array([None, "left", None], dtype=object), np.array([0.2, 0.7, 0.5])
+        )
+        with patch.object(Map, "space", new_callable=PropertyMock), \
+                patch.object(Map, "affine", new_callable=PropertyMock, return_value=np.diag([2, 2, 2, 1])), \
+                patch.object(Map, "_read_point_arrays", return_value=point_arrays):
+            assignments = self.map._assign_points(points, lower_threshold=0.3)
+        self.assertEqual(
+            [(a.input_structure, a.centroid, a.volume, a.fragment, a.map_value) for a in assignments],
+            [(0, (0.0, 2.0, 2.0), 3, "left", 0.7), (2, (1.23, 5.68, 9.0), 1, None, 0.5)]
+        )
@@ -4,6 +4,12 @@ import pytest
 from unittest.mock import patch, PropertyMock
 from uuid import uuid4
 from itertools import product, repeat
+from nibabel import Nifti1Image
+from siibra.retrieval.cache import CACHE
+from zipfile import ZipFile
+from shutil import rmtree
+import gzip
+import numpy as np
 
 class DCls:
     def __init__(self, **kwargs):
@@ -150,4 +156,228 @@ def test_sparse_index_prefixes(mock_sparse_map_spc_parc, mock_sparse_index_from_
             call0, call1 = mock_sparse_index_from_local_cache.call_args_list
             
             assert call0 != call1, f"Prefix used should be different, based on not just space, parcellation, maptype, but also name"
-            assert foo._cache_prefix != bar._cache_prefix
\ No newline at end of file
+            assert foo._cache_prefix != bar._cache_prefix
+
+
+@pytest.fixture
+def sparse_imgs():
+    np.random.seed(42)
+    affine = np.diag([2, 2, 2, 1])
+    arrs = []
+    for _ in range(4):
+        arr = np.random.rand(10, 12, 14).astype("float32")
+        arr[arr < 0.8] = 0
+        arrs.append(arr)
+    return [Nifti1Image(arr, affine) for arr in arrs]
+
+
+def build_expected_probs(imgs):
+    # reference implementation with one dict per voxel
+    voxels = np.zeros(imgs[0].shape, dtype=np.int32) - 1
+    probs = []
+    for volume, img in enumerate(imgs):
+        arr = np.asanyarray(img.dataobj)
+        for x, y, z in zip(*np.where(arr > 0)):
+            if voxels[x, y, z] < 0:
+                voxels[x, y, z] = len(probs)
+                probs.append({})
+            probs[voxels[x, y, z]][volume] = arr[x, y, z]
+    return voxels, probs
+
+
+def test_sparse_index_add_img(sparse_imgs):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+    voxels, probs = build_expected_probs(sparse_imgs)
+    assert np.array_equal(spind.voxels, voxels)
+    assert spind.max() == len(spind.probs) - 1 == len(probs) - 1
+    assert [spind.probs[i] for i in range(len(probs))] == probs
+    assert spind.probs[-1] == {}
+    for volume, img in enumerate(sparse_imgs):
+        arr = np.asanyarray(img.dataobj)
+        assert np.array_equal(spind.coords(volume), np.array(np.where(arr > 0)))
+        x, y, z, v = spind.mapped_voxels(volume)
+        assert np.array_equal(v, arr[x, y, z])
+
+
+def test_sparse_index_local_cache(sparse_imgs, tmp_path):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+
+    def build_filename(str_rep, suffix=None):
+        return str(tmp_path / f"{str_rep}.{suffix}")
+
+    with patch.object(CACHE, "build_filename", side_effect=build_filename):
+        with patch.object(CACHE, "register"), patch.object(CACHE, "touch"):
+            spind._to_local_cache("foo")
+            loaded = SparseIndex._from_local_cache("foo")
+    assert np.array_equal(loaded.voxels, spind.voxels)
+    assert loaded.bboxes == spind.bboxes
+    assert [loaded.probs[i] for i in range(len(spind.probs))] == [spind.probs[i] for i in range(len(spind.probs))]
+    for volume in range(len(sparse_imgs)):
+        for a, b in zip(loaded.mapped_voxels(volume), spind.mapped_voxels(volume)):
+            assert np.array_equal(a, b)
+
+
+def test_sparse_index_csr_layout(sparse_imgs):
+    spind = SparseIndex()
+    spind.add_img(sparse_imgs[0])
+    spind.add_img(sparse_imgs[1])
+    assert len(spind.indptr) == spind.num_coords + 1
+    # images added after the CSR arrays were built are merged on access
+    spind.add_img(sparse_imgs[2])
+    spind.add_img(sparse_imgs[3])
+    voxels, probs = build_expected_probs(sparse_imgs)
+    assert spind.indptr.tolist() == np.cumsum([0] + [len(p) for p in probs]).tolist()
+    assert spind.volume_ids.tolist() == [v for p in probs for v in p]
+    assert np.array_equal(spind.values, np.array([v for p in probs for v in p.values()], dtype="float32"))
+    assert spind.values.dtype == np.float32
+    for volume, img in enumerate(sparse_imgs):
+        arr = np.asanyarray(img.dataobj)
+        assert spind.volume_voxels[volume].tolist() == np.flatnonzero(arr > 0).tolist()
+
+
+@pytest.fixture
+def tmp_cachefiles(tmp_path):
+    def build_filename(str_rep, suffix=None):
+        return str(tmp_path / f"{str_rep}.{suffix}")
+
+    with patch.object(CACHE, "build_filename", side_effect=build_filename):
+        with patch.object(CACHE, "register"), patch.object(CACHE, "touch"):
+            yield tmp_path
+
+
+def write_text_cache(spind, prefix):
+    """Write spind in the text format of former siibra versions."""
+    Nifti1Image(np.asarray(spind.voxels), spind.affine).to_filename(CACHE.build_filename(prefix, suffix="voxels.nii.gz"))
+    with gzip.open(CACHE.build_filename(prefix, suffix="probs.txt.gz"), "wt") as f:
+        for i in range(spind.num_coords):
+            f.write(" ".join(f"{v} {p}" for v, p in spind.probs[i].items()) + "\n")
+    with gzip.open(CACHE.build_filename(prefix, suffix="bboxes.txt.gz"), "wt") as f:
+        for bbox in spind.bboxes:
+            f.write(" ".join(map(str, [*bbox["minpoint"], *bbox["maxpoint"]])) + "\n")
+
+
+def assert_same_index(loaded, spind):
+    assert np.array_equal(loaded.voxels, spind.voxels)
+    assert np.array_equal(loaded.affine, spind.affine)
+    assert loaded.shape == spind.shape
+    assert loaded.bboxes == spind.bboxes
+    for name in ["indptr", "volume_ids", "values"]:
+        assert np.array_equal(getattr(loaded, name), getattr(spind, name))
+    for a, b in zip(loaded.volume_voxels, spind.volume_voxels):
+        assert np.array_equal(a, b)
+
+
+def test_sparse_index_binary_cache_is_memory_mapped(sparse_imgs, tmp_cachefiles):
+    spind = SparseIndex()
+    for img in sparse_imgs[:3]:
+        spind.add_img(img)
+    spind._to_local_cache("foo")
+    assert (tmp_cachefiles / "foo.sparseindex" / "meta.json").is_file()
+    loaded = SparseIndex._from_local_cache("foo")
+    assert_same_index(loaded, spind)
+    assert all(isinstance(getattr(loaded, name), np.memmap) for name in ["voxels", "indptr", "values"])
+
+    # indices loaded from the cache can still be extended
+    loaded.add_img(sparse_imgs[3])
+    spind.add_img(sparse_imgs[3])
+    assert_same_index(loaded, spind)
+
+
+def test_sparse_index_converts_text_cache(sparse_imgs, tmp_cachefiles):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+    write_text_cache(spind, "foo")
+    loaded = SparseIndex._from_local_cache("foo")
+    assert_same_index(loaded, spind)
+    assert (tmp_cachefiles / "foo.sparseindex" / "meta.json").is_file()
+    with patch.object(SparseIndex, "_from_text_files") as mock:
+        assert_same_index(SparseIndex._from_local_cache("foo"), spind)
+        mock.assert_not_called()
+
+
+def test_sparse_index_zip_roundtrip(sparse_map_inst, sparse_imgs, tmp_cachefiles, tmp_path):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+    sparse_map_inst._sparse_index_cached = spind
+    sparse_map_inst.name = "foo bar"
+    with patch.object(SparseMap, "_cache_prefix", "foo"):
+        sparse_map_inst.save_sparseindex(str(tmp_path / "export"))
+        zipfname = str(tmp_path / "export" / "foo_bar_index.zip")
+        with ZipFile(zipfname) as zipf:
+            assert "foo_bar_index.meta.json" in zipf.namelist()
+        rmtree(tmp_cachefiles / "foo.sparseindex")
+        with patch.object(CACHE, "folder", str(tmp_path)):
+            loaded = sparse_map_inst.load_zipped_sparseindex(zipfname)
+    assert_same_index(loaded, spind)
+
+
+def test_assign_image_all_volumes_at_once(sparse_map_inst, sparse_imgs):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+    sparse_map_inst._sparse_index_cached = spind
+    query = np.zeros(spind.shape)
+    query[2:7, 3:9, 4:12] = np.random.rand(5, 6, 8) + 0.1
+    threshold = 0.85
+
+    assignments = sparse_map_inst._assign_image(Nifti1Image(query, spind.affine), 0, threshold, split_components=False)
+    assert [a.volume for a in assignments] == list(range(len(sparse_imgs)))
+
+    X2, Y2, Z2 = np.where(query > 0)
+    for a, img in zip(assignments, sparse_imgs):
+        # dense reference over the union of the bounding boxes
+        v1 = np.asanyarray(img.dataobj).astype("float64")
+        v1[v1 < threshold] = 0
+        X1, Y1, Z1 = np.where(np.asanyarray(img.dataobj) > 0)
+        lower = np.minimum([X1.min(), Y1.min(), Z1.min()], [X2.min(), Y2.min(), Z2.min()])
+        upper = np.maximum([X1.max(), Y1.max(), Z1.max()], [X2.max() + 1, Y2.max() + 1, Z2.max() + 1])
+        crop = tuple(slice(lo, up + 1) for lo, up in zip(lower, upper))
+        vec1, vec2 = [np.pad(arr, [(0, 2)] * 3)[crop].ravel() for arr in (v1, query)]
+        both = (v1 > 0) & (query > 0)
+        assert a.map_value == v1.max()
+        assert a.intersection_over_union == both.sum() / ((v1 > 0) | (query > 0)).sum()
+        assert a.intersection_over_first == both.sum() / (v1 > 0).sum()
+        assert a.intersection_over_second == both.sum() / (query > 0).sum()
+        assert np.isclose(a.correlation, np.corrcoef(vec1, vec2)[0, 1])
+        assert np.isclose(a.weighted_mean_of_first, (v1 * query).sum() / query.sum())
+        assert np.isclose(a.weighted_mean_of_second, (v1 * query).sum() / v1.sum())
+
+
+def test_sparse_index_read_voxels(sparse_imgs):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+    voxels, probs = build_expected_probs(sparse_imgs)
+    X, Y, Z = np.random.randint(0, 10, (3, 200))
+    X[:2] = [-1, 10]
+    pointindex, volume, value = spind.read_voxels(X, Y, Z)
+    expected = [
+        (i, v, p)
+        for i, (x, y, z) in enumerate(zip(X, Y, Z)) if 0 <= x < 10
+        for v, p in (probs[voxels[x, y, z]] if voxels[x, y, z] >= 0 else {}).items()
+    ]
+    assert list(zip(pointindex.tolist(), volume.tolist(), value)) == expected
+
+
+def test_read_points_from_sparse_index(sparse_map_inst, sparse_imgs):
+    spind = SparseIndex()
+    for img in sparse_imgs:
+        spind.add_img(img)
+    sparse_map_inst._sparse_index_cached = spind
+    x, y, z = np.argwhere(spind.voxels >= 0)[0]
+    assert sparse_map_inst._read_voxel(np.int32(x), np.int32(y), np.int32(z)) == [
+        (None, v, None, p) for v, p in spind.probs[spind.voxels[x, y, z]].items()
+    ]
+
+    # voxel size is 2mm
+    xyz_mm = np.array([[2 * x, 2 * y, 2 * z], [-10, 0, 0], [2 * x + 0.9, 2 * y, 2 * z]])
+    pointindex, volume, fragment, value = sparse_map_inst._read_point_arrays(xyz_mm)
+    assert list(zip(pointindex.tolist(), volume.tolist(), fragment, value.tolist())) == [
+        (i, v, None, p) for i in [0, 2] for v, p in spind.probs[spind.voxels[x, y, z]].items()
+    ]
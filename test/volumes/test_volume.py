@@ -3,7 +3,10 @@ import pytest
 from unittest.mock import patch
 from siibra.commons import MapType
 from siibra.volumes.volume import Volume, VolumeProvider, space
+from siibra.retrieval.connections import POOL, RETRY_POLICY
+from siibra.retrieval.requests import SiibraHttpRequestError
 from parameterized import parameterized
+import requests_mock
 
 class DummyVolumeProvider(VolumeProvider, srctype="foo-bar"):
     def fetch(self, *args, **kwargs): pass
@@ -71,6 +74,30 @@ class TestVolume(unittest.TestCase):
         # TODO add after tests for boudningbox are added
         pass
 
+    def test_fetch_returns_none_if_unavailable(self):
+        url = "http://foo.co/img.nii.gz"
+
+        def fetch(*args, **kwargs):
+            r = POOL.get(url)
+            if not r.ok:
+                raise SiibraHttpRequestError(url=url, status_code=r.status_code)
+
+        RETRY_POLICY.reset()
+        try:
+            with patch.object(DummyVolumeProvider, "fetch", side_effect=fetch), \
+                    patch.object(Volume, "SUPPORTED_FORMATS", ["foo-bar"]), \
+                    patch("siibra.retrieval.connections.sleep"), \
+                    requests_mock.Mocker() as req_mock:
+                req_mock.get(url, status_code=503)
+                self.assertIsNone(self.volume.fetch())
+                # the status is retried by the connection pool only
+                self.assertEqual(req_mock.call_count, RETRY_POLICY.MAX_RETRIES + 1)
+                # the host is offline now
+                self.assertIsNone(self.volume.fetch())
+                self.assertEqual(req_mock.call_count, RETRY_POLICY.MAX_RETRIES + 1)
+        finally:
+            RETRY_POLICY.reset()
+
 
 # TODO move to int test
 # fetch_ng_volume_fetchable_params = [